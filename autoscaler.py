@@ -30,19 +30,26 @@ class AutoScaler:
                 chosen = settings
         return chosen
 
-    def get_settings(self, equity: float, force: bool = False) -> Dict:
+    def get_settings(self, equity: float, force: bool = False, now: float = None) -> Dict:
         """
         คืนค่า settings (risk_per_trade, max_positions, max_gross_exposure).
         จะ apply change ถ้า cooldown หมดหรือ force=True.
         """
         desired = self._get_tier_for(equity)
-        now = time.time()
+        now = time.time() if now is None else now
         if force or (desired != self.current_settings and (now - self.last_apply_time) >= self.cooldown_secs):
             # apply (but we still return desired even if cooldown not passed)
             self.current_settings = desired.copy()
             self.last_apply_time = now
         return self.current_settings.copy()
 
+    def state_dict(self) -> Dict:
+        return {"current_settings": dict(self.current_settings), "last_apply_time": self.last_apply_time}
+
+    def load_state(self, d: Dict):
+        self.current_settings = dict(d["current_settings"])
+        self.last_apply_time = d["last_apply_time"]
+
     def set_tiers(self, tiers_list):
         """
         (Optional) เสริม: ตั้ง tiers ใหม่เป็น list ของ tuples (min_equity, settings_dict)
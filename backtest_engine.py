@@ -0,0 +1,309 @@
+# backtest_engine.py - multi-timeframe backtest on the live decision core, without lookahead
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from autoscaler import AutoScaler
+from buckets import BucketService
+from config import CFG
+from fill_sim import EXIT_NAMES, EXIT_NONE, FEE, SLIPPAGE, STOP_FIRST, fill_exits, trade_pnl
+from meta import MetaLearner
+from pipeline import NEUTRAL_BAND, RR, TF_WEIGHTS, TIMEFRAMES, blend, build_experts, filter_direction_series, \
+    strength_to_prob_batch
+from portfolio_risk import PortfolioRisk
+from position_registry import PositionRegistry
+from regime import regime_factor_series
+from risk import RiskGovernor
+from trade_selectors import pick_diversified_arrays
+from utils import atr_wilder, timeframe_to_ms
+from utils_sizing import compute_sl_tp_batch, kelly_multiplier_batch, position_size_by_risk_batch
+
+BANGKOK_OFFSET_MS = 7 * 3_600_000     # the runner's daily reset follows Asia/Bangkok days
+
+
+def _ts_ms(df: pd.DataFrame) -> np.ndarray:
+    ts = df['timestamp']
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        return ((ts - pd.Timestamp(0, tz=ts.dt.tz)) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+    return ts.to_numpy(dtype=np.int64)
+
+
+def build_features(data: Dict[str, Dict[str, pd.DataFrame]], symbols: Sequence[str], experts=None,
+                   timeframes: Sequence[str] = TIMEFRAMES, tf_weights: Dict[str, float] = TF_WEIGHTS,
+                   regime_cfg=CFG.regime) -> dict:
+    """
+    Everything the decision core needs, precomputed over full histories and aligned on one
+    decision clock (the close of every bar of the finest timeframe). At clock time t each
+    timeframe contributes its last bar that closed at or before t, so no value is used before
+    it exists; a symbol whose last closed bar is older than one period (data gap) is neutral.
+      contrib   (S, C, E) float32  per-expert TF blend: sum_tf w_tf * direction * strength * regime factor
+      tf_votes  (S, C, TF) float32 per-timeframe sum of those votes (origin timeframe of a trade)
+      allowed   (S, C) int8        1h filter_direction
+      price / open / high / low    (S, C) last closed bar of the finest timeframe
+      atr       (S, C)             1h atr14
+      close_1h  (S, T1h), h1_index (C,) for momentum ranking, correlation and covariance
+    """
+    experts = experts or build_experts()
+    symbols = list(symbols)
+    names = [e.name for e in experts]
+    tf_ms = {tf: timeframe_to_ms(tf) for tf in timeframes}
+    base = min(timeframes, key=tf_ms.get)
+    ts = {(s, tf): _ts_ms(data[s][tf]) for s in symbols for tf in timeframes
+          if data.get(s, {}).get(tf) is not None and len(data[s][tf])}
+    base_grid = np.unique(np.concatenate([v for (s, tf), v in ts.items() if tf == base] or [np.zeros(0, np.int64)]))
+    clock = base_grid + tf_ms[base]
+    grid_1h = np.unique(np.concatenate([v for (s, tf), v in ts.items() if tf == "1h"] or [np.zeros(0, np.int64)]))
+    S, C, T, E = len(symbols), len(clock), len(timeframes), len(experts)
+
+    contrib = np.zeros((S, C, E), dtype=np.float32)
+    tf_votes = np.zeros((S, C, T), dtype=np.float32)
+    allowed = np.zeros((S, C), dtype=np.int8)
+    price, open_, high, low, atr = (np.full((S, C), np.nan) for _ in range(5))
+    close_1h = np.full((S, len(grid_1h)), np.nan)
+    for i, s in enumerate(symbols):
+        for t, tf in enumerate(timeframes):
+            if (s, tf) not in ts:
+                continue
+            df = data[s][tf].reset_index(drop=True)
+            if 'atr14' not in df:
+                df = df.assign(atr14=atr_wilder(df, 14))
+            ts_s = ts[(s, tf)]
+            d = np.zeros((len(df), E))
+            for k, e in enumerate(experts):
+                dk, sk, _ = e.signal_series(df)
+                d[:, k] = dk * np.clip(sk, 0.0, 1.0)
+            d *= float(tf_weights.get(tf, 0.0)) * regime_factor_series(df['high'], df['low'], df['close'], names,
+                                                                       regime_cfg)
+            # last bar closed at or before each clock tick, if it closed within the last period
+            j = np.searchsorted(ts_s + tf_ms[tf], clock, side='right') - 1
+            ok = (j >= 0) & (clock - (ts_s[np.maximum(j, 0)] + tf_ms[tf]) < tf_ms[tf])
+            jj = j[ok]
+            contrib[i, ok] += d[jj].astype(np.float32)
+            tf_votes[i, ok, t] = d[jj].sum(axis=1)
+            if tf == "1h":
+                allowed[i, ok] = filter_direction_series(df)[jj]
+                atr[i, ok] = df['atr14'].to_numpy(dtype=float)[jj]
+                close_1h[i, np.searchsorted(grid_1h, ts_s)] = df['close'].to_numpy(dtype=float)
+            if tf == base:
+                price[i, ok] = df['close'].to_numpy(dtype=float)[jj]
+                open_[i, ok] = df['open'].to_numpy(dtype=float)[jj]
+                high[i, ok] = df['high'].to_numpy(dtype=float)[jj]
+                low[i, ok] = df['low'].to_numpy(dtype=float)[jj]
+    h1_index = np.searchsorted(grid_1h + tf_ms.get("1h", 3_600_000), clock, side='right') - 1
+    return {"symbols": symbols, "timeframes": list(timeframes), "expert_names": names, "clock": clock,
+            "contrib": contrib, "tf_votes": tf_votes, "allowed": allowed, "price": price, "open": open_,
+            "high": high, "low": low,
+            "atr": atr, "close_1h": close_1h, "h1_index": h1_index}
+
+
+def make_risk_cfg(capital: float, max_positions: int = 4, max_gross_exposure: float = 0.6,
+                  max_risk_per_day: float = 0.02, max_per_bucket: int = 2):
+    """RiskGovernor settings with the runner's defaults."""
+    cfg = type("C", (), {})()
+    cfg.max_positions = max_positions
+    cfg.max_gross_exposure = max_gross_exposure
+    cfg.max_risk_per_day = max_risk_per_day
+    cfg.max_per_bucket = max_per_bucket
+    cfg.portfolio_risk_unit = 100.0
+    cfg.dyn_budget_lookback = 20
+    cfg.dyn_budget_min = 50.0
+    cfg.dyn_budget_max = 2000.0
+    cfg.risk_sample_secs = 3600.0
+    cfg.risk_metrics_window = 168
+    cfg.daily_loss_limit = 0.05 * capital
+    cfg.max_var_frac = 0.0
+    cfg.max_portfolio_var_frac = 0.03
+    cfg.max_open_risk_frac = 0.0
+    cfg.buckets_map = {}
+    return cfg
+
+
+class _Universe:
+    """Momentum ranking, diversified tradables, buckets and covariance, refreshed once per 1h bar on demand."""
+
+    def __init__(self, f: dict, risk: RiskGovernor, buckets: BucketService, risk_cfg, bucket_every: int = 24):
+        self.f, self.risk, self.buckets, self.risk_cfg = f, risk, buckets, risk_cfg
+        self.bucket_every = bucket_every
+        c = f["close_1h"]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.rets = c[:, 1:] / c[:, :-1] - 1.0
+            self.mom = np.full_like(c, np.nan)
+            self.mom[:, 89:] = c[:, 89:] / c[:, :-89] - 1.0
+        self.bars = np.cumsum(np.isfinite(c), axis=1)
+        self.first = np.argmax(np.isfinite(c), axis=1)      # a listing starts later: drop its leading gap
+        self.k = -2
+        self.k_buckets = None
+        self.tradables = set()
+
+    def at(self, k: int) -> set:
+        if k == self.k:
+            return self.tradables
+        self.k = k
+        f, syms = self.f, self.f["symbols"]
+        if k < 0:
+            self.tradables = set()
+            return self.tradables
+        mom = self.mom[:, k]
+        valid = np.flatnonzero((self.bars[:, k] >= 95) & np.isfinite(mom))
+        order = valid[np.argsort(-mom[valid], kind='stable')]
+        window = self.rets[:, max(0, k - 120):k] if k > 0 else self.rets[:, :0]
+        self.tradables = {syms[i] for i in pick_diversified_arrays(order, window, CFG.risk.top_k,
+                                                                   CFG.risk.corr_threshold)}
+        closes = {s: f["close_1h"][i, self.first[i]:k + 1] for i, s in enumerate(syms) if self.bars[i, k] >= 3}
+        self.risk.portfolio.update_covariance(closes, key=k)
+        if self.k_buckets is None or k - self.k_buckets >= self.bucket_every:
+            self.buckets.refresh({s: c[-(self.buckets.window + 1):] for s, c in closes.items()})
+            self.risk_cfg.buckets_map = self.buckets.mapping
+            self.k_buckets = k
+        return self.tradables
+
+
+def run_backtest(f: dict, capital: float = 10000.0, fee: float = FEE, slippage: float = SLIPPAGE,
+                 max_positions: int = 4, max_gross_exposure: float = 0.6, max_risk_per_day: float = 0.02,
+                 max_per_bucket: int = 2, warmup: int = 0, k_atr: float = 2.0, exit_cooldown: float = 1800.0,
+                 intrabar: bool = True, ambiguity: str = STOP_FIRST) -> dict:
+    """
+    Walk the decision clock with the runner's rules: gates -> blend with MetaLearner weights ->
+    filter / EU -> batched sizing (AutoScaler tier, half-Kelly) -> RiskGovernor.can_open.
+    Entries fill at the decision close with `slippage` against us. Exits go through fill_sim:
+    with intrabar the resting SL / TP2 are resolved from each bar's high / low (same-bar
+    ambiguity per `ambiguity`), otherwise against the close only like the runner; break-even /
+    ATR trailing moves at the close, TTL exits at the close. `fee` is charged per side.
+    -> {"equity": Series, "trades": DataFrame, "clock": ms array}
+    """
+    syms, clock = f["symbols"], f["clock"]
+    sym_index = {s: i for i, s in enumerate(syms)}
+    price, atr, allowed, contrib = f["price"], f["atr"], f["allowed"], f["contrib"]
+    risk_cfg = make_risk_cfg(capital, max_positions, max_gross_exposure, max_risk_per_day, max_per_bucket)
+    risk = RiskGovernor(risk_cfg)
+    risk.portfolio = PortfolioRisk(syms)
+    universe = _Universe(f, risk, BucketService(CFG.risk.corr_threshold), risk_cfg)
+    autoscaler = AutoScaler(cooldown_secs=3600)
+    meta = MetaLearner(CFG.meta, f["expert_names"])
+    positions = PositionRegistry(CFG.risk.ttl_candles)
+
+    # weights live in [0, 2]: symbols that cannot clear the neutral band at any weight are never evaluated
+    possible = (allowed != 0) & (np.abs(contrib).sum(axis=2) * 2.0 > NEUTRAL_BAND) & np.isfinite(price) & \
+        np.isfinite(atr)
+    any_possible = possible.any(axis=0)
+    equity_curve = np.full(len(clock), float(capital))
+    trades: List[dict] = []
+    realized = 0.0
+    last_day = None
+    ttl_due = set()
+    auto = autoscaler.get_settings(capital, force=True, now=clock[0] / 1000.0 if len(clock) else 0.0)
+
+    def close_position(s: str, exit_px: float, now: float, reason: str):
+        nonlocal realized
+        st = positions.get(s)
+        side = st['side']
+        qty = abs(st['pos'])
+        pnl = float(trade_pnl(st['entry'], exit_px, qty, side, fee))
+        realized += pnl
+        risk.register_pnl(pnl)
+        if st['contrib'] is not None and st['risk_usd']:
+            meta.update_vector(st['contrib'], pnl / st['risk_usd'])
+        risk.on_close(s)
+        positions.close(s, reason, cooldown_seconds=exit_cooldown, now=now)
+        ttl_due.discard(s)
+        trades.append({"symbol": s, "side": side, "qty": qty, "entry_time": st['entry_time'], "exit_time": now,
+                       "entry": st['entry'], "exit": exit_px, "pnl": pnl, "r": pnl / st['risk_usd'] if st['risk_usd'] else 0.0,
+                       "reason": reason, "tf_origin": st['tf_origin']})
+
+    for t in range(warmup, len(clock)):
+        now = clock[t] / 1000.0
+        px = price[:, t]
+        day = int((clock[t] + BANGKOK_OFFSET_MS) // 86_400_000)
+        if day != last_day:
+            risk.daily_pnl = 0.0
+            last_day = day
+        unrealized = sum((px[sym_index[st['symbol']]] - st['entry']) * st['pos'] for st in positions.list_open()
+                         if np.isfinite(px[sym_index[st['symbol']]]))
+        equity_curve[t] = capital + realized + unrealized
+        risk.on_equity(equity_curve[t], day, now)
+        equity = capital + realized
+        auto = autoscaler.get_settings(equity, now=now)
+        ttl_due.update(positions.tick(now))
+
+        # ---- entries ----
+        open_syms = positions.symbols()
+        slots = min(auto['max_positions'], max_positions) - len(open_syms)
+        if any_possible[t] and slots > 0 and risk.can_trade_today(equity) and \
+                risk.total_abs_exposure() < max_gross_exposure * max(1.0, equity):
+            tradables = universe.at(int(f["h1_index"][t]))
+            rows = [i for i in np.flatnonzero(possible[:, t]) if syms[i] in tradables and syms[i] not in positions
+                    and not positions.in_cooldown(syms[i], now)]
+            if rows:
+                rows = np.array(rows)
+                d, strength, eu = blend(contrib[rows, t].astype(float) @ meta.weights_vector())
+                ok = (d != 0) & (d == allowed[rows, t]) & (eu > 0)
+                rows, d, strength, eu = rows[ok], d[ok], strength[ok], eu[ok]
+                order = np.argsort(-eu, kind='stable')
+                rows, d, strength = rows[order], d[order], strength[order]
+                c_price = px[rows]
+                c_sl, c_tp1, c_tp2 = compute_sl_tp_batch(c_price, atr[rows, t], k_atr=k_atr, side=d)
+                open_now = len(open_syms)
+                n_auto = auto['max_positions']
+                remaining = np.maximum(1, n_auto - np.arange(open_now, max(open_now + 1, n_auto)))
+                risk_fracs = np.minimum(auto['risk_per_trade'], max_risk_per_day / remaining)
+                risk_fracs = np.minimum(risk_fracs, risk.dynamic_budget() / max(1.0, equity))
+                qty = position_size_by_risk_batch(equity, risk_fracs[None, :], c_price[:, None], c_sl[:, None])
+                qty *= kelly_multiplier_batch(strength_to_prob_batch(strength), RR)[:, None]
+                qty = np.floor(np.nan_to_num(qty) * 1e6) / 1e6
+                counts = universe.buckets.counts(open_syms)
+                for ci, i in enumerate(rows):
+                    if len(open_syms) >= n_auto:
+                        break
+                    s, side = syms[i], int(d[ci])
+                    q = float(qty[ci, min(len(open_syms) - open_now, qty.shape[1] - 1)])
+                    if q <= 0:
+                        continue
+                    p, sl = float(c_price[ci]), float(c_sl[ci])
+                    can, _ = risk.can_open(equity, s, q * p, counts, len(open_syms), direction=side,
+                                           stop_risk=q * abs(p - sl))
+                    if not can:
+                        continue
+                    entry = p * (1 + side * slippage)
+                    tf_t = f["tf_votes"][i, t] * side
+                    positions.open(s, {"pos": side * q, "entry": entry, "sl": sl, "tp1": float(c_tp1[ci]),
+                                       "tp2": float(c_tp2[ci]), "risk_usd": q * abs(entry - sl),
+                                       "contrib": contrib[i, t].astype(float) * side,
+                                       "tf_origin": f["timeframes"][int(np.argmax(tf_t))]}, now=now)
+                    risk.on_open(s, q * entry, q, entry, sl, float(c_tp2[ci]), direction=side)
+                    open_syms.append(s)
+                    counts = universe.buckets.counts(open_syms)
+
+        # ---- exits: every position that was open through this bar, as arrays ----
+        held = [st for st in positions.list_open() if st['entry_time'] != now and np.isfinite(px[sym_index[st['symbol']]])]
+        if held:
+            rows = np.array([sym_index[st['symbol']] for st in held])
+            bar = (f["open"][rows, t], f["high"][rows, t], f["low"][rows, t]) if intrabar else (px[rows],) * 3
+            code, fill, new_sl = fill_exits(*bar, px[rows], np.array([st['entry'] for st in held]),
+                                            np.array([st['sl'] for st in held]), np.array([st['tp2'] for st in held]),
+                                            np.array([st['side'] for st in held]), atr[rows, t], ambiguity, slippage)
+            for k, st in enumerate(held):
+                s = st['symbol']
+                st['sl'] = float(new_sl[k])
+                if code[k] != EXIT_NONE:
+                    close_position(s, float(fill[k]), now, EXIT_NAMES[code[k]])
+                elif s in ttl_due:
+                    close_position(s, float(px[rows[k]]) * (1 - st['side'] * slippage), now, "ttl")
+
+    index = pd.to_datetime(clock[warmup:], unit='ms')
+    return {"equity": pd.Series(equity_curve[warmup:], index=index, name="equity"),
+            "trades": pd.DataFrame(trades), "clock": clock[warmup:]}
+
+
+def summarize(curve: pd.Series, trades: pd.DataFrame, bars_per_year: float) -> dict:
+    """CAGR-ish, Sharpe, max drawdown, profit factor, trade count from an equity curve (USD)."""
+    rets = curve.pct_change().dropna()
+    ann = (1 + rets.mean()) ** bars_per_year - 1 if len(rets) else 0.0
+    vol = rets.std() * bars_per_year ** 0.5 if len(rets) else 0.0
+    dd = float((curve / curve.cummax() - 1).min()) if len(curve) else 0.0
+    pnl = trades['pnl'] if len(trades) else pd.Series(dtype=float)
+    gains, losses = pnl[pnl > 0].sum(), -pnl[pnl <= 0].sum()
+    return {"final": float(curve.iloc[-1] / curve.iloc[0]) if len(curve) else 1.0, "cagr": float(ann),
+            "sharpe": float(ann / vol) if vol > 0 else 0.0, "max_dd": dd,
+            "pf": float(gains / losses) if losses > 0 else float('inf'), "trades": int(len(trades)),
+            "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0}
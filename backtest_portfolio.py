@@ -1,147 +1,110 @@
 import argparse
-import os
-import numpy as np
 import pandas as pd
 import ccxt
 from config import CFG
-from regime import RegimeDetector
-from experts.trend import TrendFollower
-from experts.mean_revert import MeanRevert
-from experts.breakout import Breakout
-from experts.pullback import TrendPullback
-from experts.vol_squeeze import VolSqueezeBreakout
-from meta import MetaLearner
-from risk import RiskGovernor
-from utils import atr_wilder
-from trade_selectors import rank_by_momentum, pick_diversified
-
-FEE = 0.0005       # 0.05% per trade side
-SLIPPAGE = 0.001   # 0.10% adverse
-
-
-def load_ccxt(exchange: str, symbol: str, timeframe: str, limit: int=1500) -> pd.DataFrame:
-    ex = getattr(ccxt, exchange)()
-    o = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(o, columns=['timestamp','open','high','low','close','volume'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-    return df
-
-
-def run_portfolio(symbols, timeframe, limit):
-    # load data for all symbols
-    data = {s: load_ccxt(CFG.data.exchange, s, timeframe, limit) for s in symbols}
-    # sync common timeline by inner join on timestamp
-    idx = None
-    for df in data.values():
-        idx = df['timestamp'] if idx is None else idx
-    # choose the smallest common index
-    common = None
-    for s, df in data.items():
-        common = df['timestamp'] if common is None else pd.Series(np.intersect1d(common.values, df['timestamp'].values))
+from fill_sim import FEE, POLICIES, SLIPPAGE, STOP_FIRST
+from backtest_engine import build_features, run_backtest, summarize
+from history_store import HistoryStore
+from pipeline import TF_WEIGHTS, TIMEFRAMES
+from result_cache import CACHE_DIR, ResultCache, data_digest
+from utils import timeframe_to_ms
+
+
+def load_ccxt(exchange: str, symbol: str, timeframe: str, limit: int=1500, store: HistoryStore=None,
+              offline: bool=False) -> pd.DataFrame:
+    # last `limit` bars from the local history store; online, only the missing bars are downloaded first
+    store = store or HistoryStore()
+    if not offline:
+        try:
+            ex = getattr(ccxt, exchange)({'enableRateLimit': True})
+            since = int(pd.Timestamp.now(tz='UTC').value // 1_000_000) - limit * timeframe_to_ms(timeframe)
+            store.backfill(lambda s, tf, c, lim: ex.fetch_ohlcv(s, timeframe=tf, since=c, limit=lim),
+                           symbol, timeframe, since)
+        except Exception as e:
+            print(f"[History] backfill {symbol} {timeframe} failed, using local data: {e}")
+    return store.frame(symbol, timeframe, last=limit)
+
+
+def backtest(data, symbols, timeframes, capital: float = 10000.0, intrabar: bool = True, ambiguity: str = STOP_FIRST,
+             cache: ResultCache = None, **params) -> dict:
+    """
+    build_features + run_backtest + summarize on in-memory frames, through the result cache if
+    one is given: an identical data slice / config / code version returns the stored result,
+    and a config change that keeps the features (risk, sizing, fills) reuses them.
+    -> {"equity", "trades", "metrics"}
+    """
+    fkey = rkey = None
+    if cache is not None:
+        fkey = cache.feature_key(data_digest(data, symbols, timeframes), timeframes, TF_WEIGHTS, CFG.regime)
+        rkey = cache.result_key(fkey, CFG, dict(params, capital=capital, fee=FEE, slippage=SLIPPAGE,
+                                                intrabar=intrabar, ambiguity=ambiguity))
+        hit = cache.get("results", rkey)
+        if hit is not None:
+            return hit
+    features = cache.get("features", fkey) if cache is not None else None
+    if features is None:
+        features = build_features(data, symbols, timeframes=timeframes)
+        if cache is not None:
+            cache.put("features", fkey, features)
+    res = run_backtest(features, capital=capital, fee=FEE, slippage=SLIPPAGE, intrabar=intrabar, ambiguity=ambiguity,
+                       **params)
+    base_ms = min(timeframe_to_ms(tf) for tf in timeframes)
+    out = {"equity": res["equity"], "trades": res["trades"],
+           "metrics": summarize(res["equity"], res["trades"], bars_per_year=365 * 86_400_000 / base_ms)}
+    if cache is not None:
+        cache.put("results", rkey, out)
+    return out
+
+
+def run_portfolio(symbols, timeframes, days, capital: float = 10000.0, offline: bool = False, intrabar: bool = True,
+                  ambiguity: str = STOP_FIRST, cache: ResultCache = None):
+    # every timeframe of every symbol over the same span; the engine aligns them on closed bars only
+    store = HistoryStore()
+    data = {}
     for s in symbols:
-        data[s] = data[s][data[s]['timestamp'].isin(common.values)].reset_index(drop=True)
-        data[s]['atr14'] = atr_wilder(data[s], 14)
-        data[s]['date'] = data[s]['timestamp'].dt.date
-
-    experts = [TrendFollower(), MeanRevert(), Breakout(), TrendPullback(), VolSqueezeBreakout()]
-    meta = MetaLearner(CFG.meta, [e.name for e in experts])
-    risk = RiskGovernor(CFG.risk)
-    reg = RegimeDetector(CFG.regime)
-
-    equity = 1.0
-    equity_curve = []
-    state = {s: {"pos": 0.0, "entry": None} for s in symbols}
-
-    # iterate timebar by timebar
-    n = len(next(iter(data.values())))
-    for i in range(max(CFG.data.lookback, 220), n):
-        # build per‑symbol window
-        window = {s: data[s].iloc[:i].copy() for s in symbols}
-        day_key = next(iter(window.values()))['date'].iloc[-1]
-        risk.reset_day(day_key)
-
-        # select tradeable set: XSM top‑K and correlation filter
-        ranked = rank_by_momentum({s: window[s] for s in symbols})
-        tradables = pick_diversified(ranked, window, top_k=CFG.risk.top_k, corr_threshold=CFG.risk.corr_threshold)
-
-        # process symbols
-        pnl_step = 0.0
-        total_weight = 0.0
-
-        for sym in tradables:
-            df = window[sym]
-            rfeat = reg.detect(df).iloc[-1]
-            w_reg = {
-                'trend': float(rfeat['w_trend']),
-                'mean_revert': float(rfeat['w_range']),
-                'breakout': float(rfeat['w_breakout'])
-            }
-            ssum = sum(w_reg.values()) or 1.0
-            w_reg = {k: v/ssum for k,v in w_reg.items()}
-
-            # expert signals
-            sigs = {}
-            for e in experts:
-                sgl = e.signal(df)
-                w = w_reg.get(e.name, 0.0) * meta.get_weight(e.name)
-                sigs[e.name] = (sgl.direction, max(0.0, min(1.0, sgl.strength)) * w, sgl.reason)
-
-            net = sum(direction * strength for (direction, strength, _) in sigs.values())
-            direction = 1 if net > 0.05 else (-1 if net < -0.05 else 0)
-            strength = min(1.0, abs(net))
-
-            price = float(df['close'].iloc[-1])
-            atrv = float(df['atr14'].iloc[-1] or 0.0)
-            dec = risk.decide(sym, price, atrv, direction, strength)
-
-            # mark‑to‑market & close logic
-
-pos = state[sym]['pos']
-            entry = state[sym]['entry']
-            if pos != 0.0 and entry is not None:
-                ret = (price/entry - 1.0)
-                pnl = (ret if pos>0 else -ret) - FEE - SLIPPAGE
-                pnl_step += pnl * abs(pos)
-                # simple reversal/exit
-                if dec is None or (dec.side == 'buy' and pos<0) or (dec.side=='sell' and pos>0):
-                    state[sym]['pos'] = 0.0
-                    state[sym]['entry'] = None
-                    risk.close_position(sym)
-
-            # open new
-            if dec and state[sym]['pos'] == 0.0:
-                state[sym]['pos'] = dec.size if dec.side=='buy' else -dec.size
-                state[sym]['entry'] = price * (1 + SLIPPAGE if dec.side=='buy' else 1 - SLIPPAGE)
-                risk.open_position(sym, state[sym]['pos'], state[sym]['entry'])
-
-        # update equity
-        equity *= (1.0 + pnl_step)
-        equity_curve.append(equity)
-        risk.register_pnl(pnl_step)
-        risk.on_equity(equity)
-
-    # metrics
-    curve = pd.Series(equity_curve, index=data[symbols[0]].iloc[max(CFG.data.lookback,220):].timestamp)
-    rets = curve.pct_change().dropna()
-    ann = (1 + rets.mean())**(365*24) - 1 if len(rets) else 0  # rough hourly→annual if 1h bars
-    vol = rets.std() * (365*24)**0.5 if len(rets) else 0
-    sharpe = ann / vol if vol>0 else 0
-    dd = (curve / curve.cummax() - 1).min()
-
-    # profit factor (approx via positive/negative step pnls)
-    pos = rets[rets>0].sum()
-    neg = -rets[rets<=0].sum()
-    pf = (pos/neg) if neg>0 else np.inf
-
-    print(f"Final equity: {equity:.3f}x | CAGR~{ann*100:.2f}% | Sharpe~{sharpe:.2f} | MaxDD {dd*100:.2f}% | PF {pf:.2f}")
+        data[s] = {tf: load_ccxt(CFG.data.exchange, s, tf, days * 86_400_000 // timeframe_to_ms(tf), store, offline)
+                   for tf in timeframes}
+        if any(df.empty for df in data[s].values()):
+            print(f"[Backtest] {s}: no history for some timeframe, skipped")
+            del data[s]
+    symbols = [s for s in symbols if s in data]
+    if not symbols:
+        print("[Backtest] no data")
+        return None
+
+    res = backtest(data, symbols, timeframes, capital, intrabar, ambiguity, cache)
+    curve, trades, m = res["equity"], res["trades"], res["metrics"]
+    if cache is not None:
+        st = cache.stats()
+        print(f"[Cache] hits={st['hits']} misses={st['misses']} entries={st['entries']} "
+              f"size={st['bytes'] / 2**20:.1f}MB")
+
+    print(f"Final equity: {m['final']:.3f}x | CAGR~{m['cagr']*100:.2f}% | Sharpe~{m['sharpe']:.2f} | "
+          f"MaxDD {m['max_dd']*100:.2f}% | PF {m['pf']:.2f} | trades {m['trades']} win {m['win_rate']*100:.1f}%")
     curve.to_csv('equity_curve_portfolio.csv', index_label='timestamp', header=['equity'])
     print("Saved: equity_curve_portfolio.csv")
+    if len(trades):
+        trades.to_csv('trades_portfolio.csv', index=False)
+        print("Saved: trades_portfolio.csv")
+    return res
+
 
-if name == "main":
+if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--timeframe', default=CFG.data.timeframe)
-    parser.add_argument('--limit', type=int, default=1500)
+    parser.add_argument('--timeframes', default=",".join(TIMEFRAMES))
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--capital', type=float, default=10000.0)
     parser.add_argument('--symbols', default=",".join(CFG.data.symbols))
+    parser.add_argument('--offline', action='store_true', help="use the local history store only")
+    parser.add_argument('--fills', choices=['intrabar', 'close'], default='intrabar',
+                        help="exits from each bar's high / low, or from the close only (like the runner)")
+    parser.add_argument('--ambiguity', choices=POLICIES, default=STOP_FIRST,
+                        help="which of SL / TP fills first when one bar spans both")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--cache-mb', type=int, default=2048, help="result cache size bound (0 = no cache)")
     args = parser.parse_args()
     symbols = [s.strip() for s in args.symbols.split(',') if s.strip()]
-    run_portfolio(symbols, args.timeframe, args.limit)
\ No newline at end of file
+    timeframes = [t.strip() for t in args.timeframes.split(',') if t.strip()]
+    cache = ResultCache(args.cache_dir, args.cache_mb << 20) if args.cache_mb > 0 else None
+    run_portfolio(symbols, timeframes, args.days, args.capital, args.offline, args.fills == 'intrabar', args.ambiguity,
+                  cache)
@@ -1,4 +1,5 @@
 import ccxt
+import numpy as np
 import pandas as pd
 import csv
 import os
@@ -6,6 +7,7 @@ from math import floor
 from abc import ABC, abstractmethod
 from datetime import datetime
 from dotenv import load_dotenv
+from rate_limit import RequestScheduler, binance_klines_weight, PRIORITY_ORDER, PRIORITY_EXIT, PRIORITY_DATA
 
 # ===============================
 # Load .env
@@ -42,6 +44,23 @@ class Broker(ABC):
     def place_order(self, symbol: str, side: str, size: float, price: float = None, stop: float = None, take: float = None):
         pass
 
+    def submit_order(self, symbol: str, side: str, amount: float, client_id: str, reduce_only: bool = False):
+        # generic fallback for brokers without client order ids: raise instead of returning None
+        order = self.place_order(symbol, side, amount)
+        if not order:
+            raise RuntimeError(f"{symbol} {side} {amount} not placed")
+        return order
+
+    def fetch_order_by_client_id(self, symbol: str, client_id: str):
+        return None
+
+    def cancel_order_by_client_id(self, symbol: str, client_id: str):
+        raise NotImplementedError(f"{type(self).__name__} cannot cancel by client id")
+
+    def round_amounts(self, symbols, amounts) -> np.ndarray:
+        # generic fallback: one _round_amount call per element
+        return np.array([self._round_amount(s, float(a)) for s, a in zip(symbols, amounts)], dtype=float)
+
 
 # ===============================
 # CCXT Broker with Paper Mode + Report
@@ -53,10 +72,12 @@ class CCXTBroker(Broker):
         self.paper_log = paper_log
         self.paper_trades = []
 
+        # throttling is done by our own scheduler (weights + priorities), not ccxt's fixed delay
+        self.scheduler = RequestScheduler.for_exchange(exchange)
         self.ex = getattr(ccxt, exchange)({
             'apiKey': api_key,
             'secret': api_secret,
-            'enableRateLimit': True,
+            'enableRateLimit': False,
             'options': {'defaultType': 'future'},
         })
 
@@ -68,7 +89,8 @@ class CCXTBroker(Broker):
             self.ex.has['fetchCurrencies'] = False
             self.ex.set_sandbox_mode(True)
 
-        self.markets = self.ex.load_markets()
+        self.markets = self._call({'weight': 40}, PRIORITY_DATA, self.ex.load_markets)
+        self._lots = {}
         self.hedge_mode = True if sandbox else self._check_hedge_mode()
 
         # prepare paper log
@@ -80,7 +102,7 @@ class CCXTBroker(Broker):
 
     def _check_hedge_mode(self) -> bool:
         try:
-            account_info = self.ex.fapiPrivateGetAccount()
+            account_info = self._call({'weight': 5}, PRIORITY_DATA, self.ex.fapiPrivateGetAccount)
             if 'hedgeMode' in account_info:
                 return account_info['hedgeMode']
             positions = account_info.get('positions', [])
@@ -91,16 +113,72 @@ class CCXTBroker(Broker):
         except Exception:
             return False
 
+    def _retry_after(self):
+        headers = getattr(self.ex, 'last_response_headers', None) or {}
+        for k, v in headers.items():
+            if str(k).lower() == 'retry-after':
+                try:
+                    return float(v)
+                except (TypeError, ValueError):
+                    return None
+        return None
+
+    def _call(self, costs: dict, priority: int, fn, *args, **kwargs):
+        # every exchange request goes through the scheduler; 429/418 back everybody off
+        self.scheduler.acquire(costs, priority)
+        try:
+            return fn(*args, **kwargs)
+        except ccxt.DDoSProtection as e:
+            banned = not isinstance(e, ccxt.RateLimitExceeded)
+            self.scheduler.penalize(self._retry_after(), banned=banned)
+            print(f"[RateLimit] {'418 ban' if banned else '429'} -> backing off: {e}")
+            raise
+        finally:
+            self.scheduler.observe_headers(getattr(self.ex, 'last_response_headers', None))
+
+    def fetch_ohlcv_raw(self, symbol: str, timeframe: str, limit: int, since: int = None):
+        # raw ccxt rows [[ts, o, h, l, c, v], ...] for CandleStore.update (no DataFrame build)
+        return self._call({'weight': binance_klines_weight(limit)}, PRIORITY_DATA,
+                          self.ex.fetch_ohlcv, symbol, timeframe=timeframe, since=since, limit=limit)
+
     def fetch_ohlcv(self, symbol: str, timeframe: str, limit: int):
-        o = self.ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+        o = self.fetch_ohlcv_raw(symbol, timeframe, limit)
         df = pd.DataFrame(o, columns=['timestamp','open','high','low','close','volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         return df
 
     def get_price(self, symbol: str) -> float:
-        t = self.ex.fetch_ticker(symbol)
+        t = self._call({'weight': 1}, PRIORITY_EXIT, self.ex.fetch_ticker, symbol)
         return float(t['last'])
 
+    def _lot_params(self, symbol: str):
+        # (step, min_qty, precision or nan) from the market filters, cached per symbol
+        p = self._lots.get(symbol)
+        if p is None:
+            m = self.markets.get(symbol, {})
+            step, min_qty = 0.0, 0.0
+            for f in m.get('info', {}).get('filters', []):
+                if f.get('filterType') == 'LOT_SIZE':
+                    step = float(f.get('stepSize', 0))
+                    min_qty = float(f.get('minQty', 0))
+            precision = m.get('precision', {}).get('amount')
+            p = self._lots[symbol] = (step, min_qty, float('nan') if precision is None else float(precision))
+        return p
+
+    def round_amounts(self, symbols, amounts) -> np.ndarray:
+        """_round_amount for many (symbol, amount) pairs in one vectorized pass, same results."""
+        lots = np.array([self._lot_params(s) for s in symbols], dtype=float).reshape(-1, 3)
+        step, min_qty, precision = lots[:, 0], lots[:, 1], lots[:, 2]
+        a = np.asarray(amounts, dtype=float).copy()
+        has_step = step > 0
+        a[has_step] = np.floor(a[has_step] / step[has_step]) * step[has_step]
+        low = (min_qty > 0) & (a < min_qty)
+        a[low] = min_qty[low]
+        has_prec = ~np.isnan(precision)
+        scale = np.power(10.0, precision[has_prec])
+        a[has_prec] = np.floor(a[has_prec] * scale) / scale
+        return a
+
     def _round_amount(self, symbol: str, amount: float) -> float:
         m = self.markets.get(symbol, {})
         filters = m.get('info', {}).get('filters', [])
@@ -127,33 +205,137 @@ class CCXTBroker(Broker):
             return None
 
         if self.paper_mode:
-            trade_price = price if price else self.get_price(symbol)
-            record = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "symbol": symbol,
-                "side": side,
-                "size": amt,
-                "price": trade_price,
-                "status": "FILLED"
-            }
-            self.paper_trades.append(record)
-            with open(self.paper_log, mode="a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([record["timestamp"], record["symbol"], record["side"],
-                                 record["size"], record["price"], record["status"]])
-            return record
+            return self._paper_fill(symbol, side, amt, price)
 
         params = {}
         if self.hedge_mode:
             params['positionSide'] = 'LONG' if side.lower()=='buy' else 'SHORT'
 
         try:
-            order = self.ex.create_order(symbol, type='market', side=side, amount=amt, params=params)
+            order = self._call({'weight': 1, 'orders_10s': 1, 'orders_1m': 1}, PRIORITY_ORDER,
+                               self.ex.create_order, symbol, type='market', side=side, amount=amt, params=params)
             return order
         except Exception as e:
             print(f"[Order Error] {symbol} {side} {amt}: {e}")
             return None
 
+    def _paper_fill(self, symbol: str, side: str, amt: float, price: float = None, client_id: str = None):
+        trade_price = price if price else self.get_price(symbol)
+        record = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "symbol": symbol,
+            "side": side,
+            "size": amt,
+            "price": trade_price,
+            "status": "FILLED",
+            "clientOrderId": client_id,
+        }
+        self.paper_trades.append(record)
+        with open(self.paper_log, mode="a", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([record["timestamp"], record["symbol"], record["side"],
+                             record["size"], record["price"], record["status"]])
+        return record
+
+    def submit_order(self, symbol: str, side: str, amount: float, client_id: str, reduce_only: bool = False):
+        """
+        Market order tagged with our client order id, so a retry after a timeout can be
+        looked up instead of sent twice. Raises ccxt errors to the caller (OrderPipeline).
+        """
+        amt = self._round_amount(symbol, amount)
+        if amt <= 0:
+            raise ccxt.InvalidOrder(f"{symbol} amount {amount} rounds to 0")
+        if self.paper_mode:
+            return self._paper_fill(symbol, side, amt, client_id=client_id)
+
+        params = {'newClientOrderId': client_id}
+        if self.hedge_mode:
+            # closing a LONG is a sell on the LONG side (and vice versa)
+            opens_long = (side.lower() == 'buy') != reduce_only
+            params['positionSide'] = 'LONG' if opens_long else 'SHORT'
+        elif reduce_only:
+            params['reduceOnly'] = True
+        return self._call({'weight': 1, 'orders_10s': 1, 'orders_1m': 1}, PRIORITY_ORDER,
+                          self.ex.create_order, symbol, type='market', side=side, amount=amt, params=params)
+
+    def fetch_order_by_client_id(self, symbol: str, client_id: str):
+        if self.paper_mode:
+            return next((t for t in reversed(self.paper_trades) if t.get("clientOrderId") == client_id), None)
+        try:
+            return self._call({'weight': 1}, PRIORITY_ORDER, self.ex.fetch_order, None, symbol,
+                              {'origClientOrderId': client_id})
+        except ccxt.OrderNotFound:
+            return None
+
+    def cancel_order_by_client_id(self, symbol: str, client_id: str):
+        """Cancel whatever is left of an order; raises ccxt.OrderNotFound once it is final (or never landed)."""
+        if self.paper_mode:
+            return self.fetch_order_by_client_id(symbol, client_id)     # paper orders fill at once
+        return self._call({'weight': 1}, PRIORITY_ORDER, self.ex.cancel_order, None, symbol,
+                          {'origClientOrderId': client_id})
+
+    def place_stops(self, specs):
+        """
+        Reduce-only STOP_MARKET (kind 'sl') / TAKE_PROFIT_MARKET (kind 'tp') orders, up to 5
+        per batch request. specs: [{symbol, kind, side, amount, trigger, client_id}]
+        -> [(spec, order or None, error)]
+        """
+        out = []
+        for i in range(0, len(specs), 5):
+            chunk = specs[i:i + 5]
+            reqs = []
+            for sp in chunk:
+                params = {'stopPrice': sp['trigger'], 'newClientOrderId': sp['client_id'], 'workingType': 'MARK_PRICE'}
+                if self.hedge_mode:
+                    params['positionSide'] = 'LONG' if sp['side'] == 'sell' else 'SHORT'
+                else:
+                    params['reduceOnly'] = True
+                reqs.append({'symbol': sp['symbol'], 'type': 'STOP_MARKET' if sp['kind'] == 'sl' else 'TAKE_PROFIT_MARKET',
+                             'side': sp['side'], 'amount': self._round_amount(sp['symbol'], sp['amount']),
+                             'price': None, 'params': params})
+            try:
+                orders = self._call({'weight': 5, 'orders_10s': len(reqs), 'orders_1m': len(reqs)}, PRIORITY_ORDER,
+                                    self.ex.create_orders, reqs)
+                for sp, o in zip(chunk, orders):
+                    ok = bool(o and o.get('id'))
+                    out.append((sp, o if ok else None, "" if ok else str((o or {}).get('info'))))
+            except Exception as e:
+                out.extend((sp, None, str(e)) for sp in chunk)
+        return out
+
+    def cancel_stops(self, symbol: str, client_ids):
+        for i in range(0, len(client_ids), 10):
+            self._call({'weight': 1}, PRIORITY_ORDER, self.ex.cancel_orders, [], symbol,
+                       {'origClientOrderIdList': list(client_ids[i:i + 10])})
+
+    def open_stop_ids(self, symbol: str):
+        orders = self._call({'weight': 1}, PRIORITY_EXIT, self.ex.fetch_open_orders, symbol)
+        return {o.get('clientOrderId') for o in orders}
+
+    def fetch_position_sizes(self, symbols):
+        """
+        {symbol: signed contracts} for the positions the exchange reported, keyed by the runner's
+        symbols (ccxt reports futures as 'BTC/USDT:USDT'); hedge-mode legs are summed. A reported
+        flat position maps to 0.0, a symbol the exchange did not report at all is left out.
+        """
+        alias = {}
+        for s in symbols:
+            alias[s] = s
+            try:
+                m = self.ex.market(s)
+                alias[m['symbol']] = s
+                alias[m['id']] = s
+            except Exception:
+                pass
+        out = {}
+        for p in self._call({'weight': 5}, PRIORITY_ORDER, self.ex.fetch_positions, list(symbols)):
+            s = alias.get(p.get('symbol')) or alias.get((p.get('info') or {}).get('symbol'))
+            if s is None:
+                continue
+            qty = float(p.get('contracts') or 0.0)
+            out[s] = out.get(s, 0.0) + (qty if p.get('side') != 'short' else -qty)
+        return out
+
     def get_paper_report(self):
         if not os.path.exists(self.paper_log):
             return {"error": "No paper log found"}
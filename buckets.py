@@ -0,0 +1,76 @@
+# buckets.py - correlation buckets via hierarchical clustering, refreshed in the background
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+
+def cluster_buckets(closes: Dict[str, np.ndarray], corr_threshold: float = 0.75, window: int = 240) -> Dict[str, str]:
+    """
+    Average-linkage clustering on (1 - correlation) of log returns. Symbols whose
+    returns correlate above ~corr_threshold end up in the same bucket.
+    """
+    syms = [s for s, c in closes.items() if c is not None and len(c) >= 30]
+    if len(syms) < 2:
+        return {s: f"b{i}" for i, s in enumerate(syms)}
+    m = min(min(len(closes[s]) for s in syms), window + 1)
+    px = np.vstack([np.asarray(closes[s], dtype=float)[-m:] for s in syms])
+    r = np.diff(np.log(px), axis=1)
+    corr = np.nan_to_num(np.corrcoef(r), nan=0.0)
+    dist = np.clip(1.0 - corr, 0.0, 2.0)
+    np.fill_diagonal(dist, 0.0)
+    z = linkage(squareform(dist, checks=False), method='average')
+    labels = fcluster(z, t=1.0 - corr_threshold, criterion='distance')
+    return {s: f"b{int(l)}" for s, l in zip(syms, labels)}
+
+
+class BucketService:
+    """
+    Publishes an immutable symbol -> bucket mapping. `submit` hands a copy of the closes to
+    a background thread and returns immediately; readers always see a complete mapping
+    (the reference is swapped atomically), so lookups stay O(1) in the hot path.
+    """
+
+    def __init__(self, corr_threshold: float = 0.75, refresh_secs: float = 3600.0, window: int = 240):
+        self.corr_threshold = corr_threshold
+        self.refresh_secs = refresh_secs
+        self.window = window
+        self.mapping = MappingProxyType({})
+        self.last_refresh = 0.0
+        self._job = None
+
+    def due(self) -> bool:
+        busy = self._job is not None and self._job.is_alive()
+        return not busy and time.time() - self.last_refresh >= self.refresh_secs
+
+    def refresh(self, closes: Dict[str, np.ndarray]):
+        self.mapping = MappingProxyType(cluster_buckets(closes, self.corr_threshold, self.window))
+
+    def submit(self, closes: Dict[str, np.ndarray]):
+        # copy now: the caller's arrays may be ring-buffer views that keep changing
+        snap = {s: np.array(c, dtype=float) for s, c in closes.items() if c is not None}
+        self.last_refresh = time.time()
+        self._job = threading.Thread(target=self._run, args=(snap,), name="bucket-refresh", daemon=True)
+        self._job.start()
+
+    def _run(self, closes):
+        try:
+            self.refresh(closes)
+        except Exception as e:
+            print(f"[Buckets] refresh failed: {e}")
+
+    def bucket(self, symbol: str):
+        return self.mapping.get(symbol)
+
+    def counts(self, symbols) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        m = self.mapping
+        for s in symbols:
+            b = m.get(s)
+            if b is not None:
+                out[b] = out.get(b, 0) + 1
+        return out
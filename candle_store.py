@@ -0,0 +1,167 @@
+# candle_store.py - preallocated ring-buffer candle store (one buffer per symbol/timeframe)
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import timeframe_to_ms
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class CandleBuffer:
+    """
+    Fixed-capacity OHLCV ring buffer backed by contiguous NumPy arrays.
+
+    The buffer is "mirrored": slot i is written at i and i + capacity, so the
+    latest `count` candles are always one contiguous slice -> views are zero-copy.
+    Appending never reallocates. Views stay valid until the next update.
+    """
+
+    def __init__(self, capacity: int, price_dtype=np.float64, ts=None, data=None):
+        self.capacity = int(capacity)
+        self.price_dtype = np.dtype(price_dtype)
+        # external arrays (e.g. shared memory) may be passed in, they must have the mirrored shape
+        self._ts = ts if ts is not None else np.zeros(2 * self.capacity, dtype=np.int64)
+        self._data = data if data is not None else np.zeros((len(PRICE_FIELDS), 2 * self.capacity), dtype=self.price_dtype)
+        self._head = 0     # next write slot in [0, capacity)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._ts.nbytes + self._data.nbytes
+
+    def last_ts(self) -> int:
+        if self._count == 0:
+            return -1
+        return int(self._ts[(self._head - 1) % self.capacity])
+
+    def _write(self, slots: np.ndarray, ts: np.ndarray, values: np.ndarray):
+        for off in (0, self.capacity):
+            self._ts[slots + off] = ts
+            self._data[:, slots + off] = values
+
+    def append(self, ts: int, o: float, h: float, l: float, c: float, v: float):
+        self.extend(np.array([[ts, o, h, l, c, v]], dtype=np.float64))
+
+    def extend(self, rows) -> int:
+        """
+        Merge ccxt-style rows [[ts, o, h, l, c, v], ...] (sorted by ts).
+        A row with the same ts as the last candle updates it in place (forming bar),
+        older rows are ignored. Returns number of new candles.
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.size == 0:
+            return 0
+        ts = rows[:, 0].astype(np.int64)
+        last = self.last_ts()
+        if self._count and ts[-1] >= last:
+            i = int(np.searchsorted(ts, last))
+            if i < len(ts) and ts[i] == last:
+                # refresh the (possibly still forming) last candle
+                self._write(np.array([(self._head - 1) % self.capacity]), ts[i:i + 1], rows[i:i + 1, 1:].T)
+                i += 1
+            ts, rows = ts[i:], rows[i:]
+        elif self._count:
+            return 0
+        n = len(ts)
+        if n == 0:
+            return 0
+        if n > self.capacity:
+            ts, rows = ts[-self.capacity:], rows[-self.capacity:]
+        k = len(ts)
+        slots = (self._head + np.arange(k)) % self.capacity
+        self._write(slots, ts, rows[:, 1:].T)
+        self._head = int((self._head + k) % self.capacity)
+        self._count = min(self.capacity, self._count + k)
+        return n
+
+    def fetch_limit(self, timeframe: str, now_ms: int, full: int) -> int:
+        """How many candles to request: full history when cold, only the gap (+ last bar) when warm."""
+        if self._count == 0:
+            return full
+        missing = (int(now_ms) - self.last_ts()) // timeframe_to_ms(timeframe) + 2
+        return int(max(2, min(full, missing)))
+
+    def _slice(self) -> slice:
+        end = self._head + self.capacity
+        return slice(end - self._count, end)
+
+    def view(self, field: str) -> np.ndarray:
+        """Read-only zero-copy view of one column, oldest -> newest."""
+        if field == 'timestamp':
+            a = self._ts[self._slice()]
+        else:
+            a = self._data[PRICE_FIELDS.index(field), self._slice()]
+        a.flags.writeable = False
+        return a
+
+    def views(self) -> Dict[str, np.ndarray]:
+        return {f: self.view(f) for f in ('timestamp',) + PRICE_FIELDS}
+
+    def frame(self) -> pd.DataFrame:
+        """DataFrame in the CCXTBroker.fetch_ohlcv layout, built on the buffer views."""
+        v = self.views()
+        v['timestamp'] = v['timestamp'].view('datetime64[ms]')
+        return pd.DataFrame(v, copy=False)
+
+
+class CandleStore:
+    """(symbol, timeframe) -> CandleBuffer, capacity bounded by DataConfig.lookback."""
+
+    def __init__(self, capacity: int, price_dtype=np.float64):
+        self.capacity = int(capacity)
+        self.price_dtype = np.dtype(price_dtype)
+        self._buffers: Dict[Tuple[str, str], CandleBuffer] = {}
+
+    def buffer(self, symbol: str, timeframe: str) -> CandleBuffer:
+        key = (symbol, timeframe)
+        b = self._buffers.get(key)
+        if b is None:
+            b = self._buffers[key] = CandleBuffer(self.capacity, self.price_dtype)
+        return b
+
+    def update(self, symbol: str, timeframe: str, rows) -> int:
+        return self.buffer(symbol, timeframe).extend(rows)
+
+    def has(self, symbol: str, timeframe: str) -> bool:
+        b = self._buffers.get((symbol, timeframe))
+        return b is not None and len(b) > 0
+
+    def frame(self, symbol: str, timeframe: str):
+        b = self._buffers.get((symbol, timeframe))
+        if b is None or len(b) == 0:
+            return None
+        return b.frame()
+
+    def state_dict(self) -> dict:
+        """Compact copy of every buffer: {(symbol, tf): (ts int64[n], prices[5, n])}."""
+        out = {}
+        for key, b in self._buffers.items():
+            v = b.views()
+            out[key] = (v['timestamp'].copy(), np.vstack([v[f] for f in PRICE_FIELDS]))
+        return out
+
+    def load_state(self, d: dict, keys=None) -> int:
+        """Refill buffers (optionally only the given keys); the next fetch_limit only asks for the gap."""
+        n = 0
+        for key, (ts, prices) in d.items():
+            if keys is not None and key not in keys:
+                continue
+            rows = np.column_stack([ts.astype(np.float64), prices.T.astype(np.float64)])
+            n += self.update(key[0], key[1], rows)
+        return n
+
+    def fetch_limit(self, symbol: str, timeframe: str, now_ms: int, full: int) -> int:
+        b = self._buffers.get((symbol, timeframe))
+        return full if b is None else b.fetch_limit(timeframe, now_ms, full)
+
+    def keys(self):
+        return list(self._buffers.keys())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._buffers.values())
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List
 
 @dataclass
 class DataConfig:
@@ -11,6 +11,7 @@ class DataConfig:
     ])
     timeframe: str = "1h"
     lookback: int = 600                        # a bit longer for indicators
+    candle_dtype: str = "float64"              # "float32" halves candle store memory
 
 @dataclass
 class RegimeConfig:
@@ -30,6 +31,8 @@ class RiskConfig:
     dyn_budget_max: float = 0.003              # cap
     corr_threshold: float = 0.75               # avoid pairs > this corr
     top_k: int = 5                             # trade only top-K symbols
+    # max time in trade, in candles of the timeframe the entry signal came from
+    ttl_candles: Dict[str, int] = field(default_factory=lambda: {"15m": 96, "30m": 64, "1h": 48})
 
 @dataclass
 class MetaConfig:
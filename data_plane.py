@@ -0,0 +1,196 @@
+# data_plane.py - shared-memory market data plane (one fetcher process, many readers)
+import multiprocessing as mp
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from candle_store import PRICE_FIELDS, CandleBuffer
+
+# header columns per (symbol, timeframe)
+SEQ, HEAD, COUNT = 0, 1, 2
+HEADER_COLS = 4
+
+
+@dataclass
+class PlaneSpec:
+    """Everything a process needs to attach: picklable, passed to workers as-is."""
+    name: str
+    symbols: List[str]
+    timeframes: List[str]
+    capacity: int
+    price_dtype: str = "float64"
+    index: Dict[Tuple[str, str], int] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self.index = {(s, tf): i for i, (s, tf) in enumerate((s, tf) for s in self.symbols for tf in self.timeframes)}
+
+    @property
+    def n_keys(self) -> int:
+        return len(self.symbols) * len(self.timeframes)
+
+    def layout(self):
+        k, cap2 = self.n_keys, 2 * self.capacity
+        item = np.dtype(self.price_dtype).itemsize
+        header = k * HEADER_COLS * 8
+        ts = k * cap2 * 8
+        data = k * len(PRICE_FIELDS) * cap2 * item
+        return header, ts, data
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.layout())
+
+
+def _map(spec: PlaneSpec, buf):
+    header_n, ts_n, _ = spec.layout()
+    k, cap2 = spec.n_keys, 2 * spec.capacity
+    header = np.ndarray((k, HEADER_COLS), dtype=np.int64, buffer=buf, offset=0)
+    ts = np.ndarray((k, cap2), dtype=np.int64, buffer=buf, offset=header_n)
+    data = np.ndarray((k, len(PRICE_FIELDS), cap2), dtype=np.dtype(spec.price_dtype), buffer=buf, offset=header_n + ts_n)
+    return header, ts, data
+
+
+def _attach(name: str):
+    # readers are children of the owner and share its resource tracker, so the
+    # block is unlinked exactly once, by the owner (no tracking needed on 3.13+)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=False, track=False)
+    return shared_memory.SharedMemory(name=name, create=False)
+
+
+class DataPlane:
+    """
+    Writer side. The owner creates the block (create=True) and unlinks it on close;
+    the fetcher process attaches with create=False and publishes candles.
+    Every publish is wrapped in a seqlock: seq is odd while a write is in progress.
+    """
+
+    def __init__(self, spec: PlaneSpec, create: bool = True):
+        self.spec = spec
+        self.owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(name=spec.name, create=True, size=spec.nbytes)
+        else:
+            self.shm = _attach(spec.name)
+        self.header, self.ts, self.data = _map(spec, self.shm.buf)
+        if create:
+            self.header[:] = 0
+        self.buffers = {}
+        for key, i in spec.index.items():
+            b = CandleBuffer(spec.capacity, spec.price_dtype, ts=self.ts[i], data=self.data[i])
+            b._head, b._count = int(self.header[i, HEAD]), int(self.header[i, COUNT])
+            self.buffers[key] = b
+
+    def publish(self, symbol: str, timeframe: str, rows) -> int:
+        i = self.spec.index[(symbol, timeframe)]
+        b = self.buffers[(symbol, timeframe)]
+        self.header[i, SEQ] += 1              # odd: write in progress
+        try:
+            n = b.extend(rows)
+            self.header[i, HEAD] = b._head
+            self.header[i, COUNT] = len(b)
+        finally:
+            self.header[i, SEQ] += 1          # even: consistent
+        return n
+
+    def fetch_limit(self, symbol: str, timeframe: str, now_ms: int, full: int) -> int:
+        return self.buffers[(symbol, timeframe)].fetch_limit(timeframe, now_ms, full)
+
+    def close(self):
+        self.header = self.ts = self.data = None
+        self.buffers = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class DataPlaneReader:
+    """Read-only attachment. Views map the shared arrays directly (no copies)."""
+
+    def __init__(self, spec: PlaneSpec):
+        self.spec = spec
+        self.shm = _attach(spec.name)
+        self.header, self.ts, self.data = _map(spec, self.shm.buf)
+        for a in (self.header, self.ts, self.data):
+            a.flags.writeable = False
+
+    def version(self, symbol: str, timeframe: str) -> int:
+        return int(self.header[self.spec.index[(symbol, timeframe)], SEQ])
+
+    def views(self, symbol: str, timeframe: str, retries: int = 100):
+        """
+        (version, {field: view}) for the latest window. The views are zero-copy, so
+        callers that keep computing on them should confirm with `unchanged(...)` afterwards.
+        """
+        i = self.spec.index[(symbol, timeframe)]
+        for _ in range(retries):
+            seq = int(self.header[i, SEQ])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            head, count = int(self.header[i, HEAD]), int(self.header[i, COUNT])
+            if int(self.header[i, SEQ]) != seq:
+                continue
+            end = head + self.spec.capacity
+            sl = slice(end - count, end)
+            out = {'timestamp': self.ts[i, sl]}
+            for j, f in enumerate(PRICE_FIELDS):
+                out[f] = self.data[i, j, sl]
+            return seq, out
+        raise TimeoutError(f"data plane busy for {symbol} {timeframe}")
+
+    def unchanged(self, symbol: str, timeframe: str, version: int) -> bool:
+        return self.version(symbol, timeframe) == version
+
+    def frame(self, symbol: str, timeframe: str, copy: bool = True):
+        """DataFrame in the fetch_ohlcv layout; copy=True returns a torn-read-free snapshot."""
+        while True:
+            seq, v = self.views(symbol, timeframe)
+            if len(v['timestamp']) == 0:
+                return None
+            v['timestamp'] = v['timestamp'].view('datetime64[ms]')
+            df = pd.DataFrame(v, copy=copy)
+            if not copy or self.unchanged(symbol, timeframe, seq):
+                return df
+
+    def close(self):
+        self.header = self.ts = self.data = None
+        self.shm.close()
+
+
+def run_data_plane(spec: PlaneSpec, exchange: str, api_key: str, api_secret: str, sandbox: bool,
+                   interval: float = 2.0, stop_event=None):
+    """Process target: owns the exchange connection and keeps the shared candles fresh."""
+    from broker import CCXTBroker
+    broker = CCXTBroker(exchange, api_key, api_secret, sandbox=sandbox)
+    plane = DataPlane(spec, create=False)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            t0 = time.time()
+            now_ms = int(t0 * 1000)
+            for s in spec.symbols:
+                for tf in spec.timeframes:
+                    try:
+                        limit = plane.fetch_limit(s, tf, now_ms, spec.capacity)
+                        plane.publish(s, tf, broker.fetch_ohlcv_raw(s, tf, limit=limit))
+                    except Exception as e:
+                        print(f"[DataPlane] fetch err {s} {tf} -> {e}")
+            time.sleep(max(0.0, interval - (time.time() - t0)))
+    finally:
+        plane.close()
+
+
+def start_data_plane(spec: PlaneSpec, exchange: str, api_key: str, api_secret: str, sandbox: bool,
+                     interval: float = 2.0):
+    """Create the shared block in this process and start the fetcher. Returns (plane, process, stop_event)."""
+    plane = DataPlane(spec, create=True)
+    stop = mp.Event()
+    proc = mp.Process(target=run_data_plane, name="data-plane", daemon=True,
+                      args=(spec, exchange, api_key, api_secret, sandbox, interval, stop))
+    proc.start()
+    return plane, proc, stop
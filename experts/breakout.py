@@ -1,35 +1,52 @@
+import numpy as np
+
+from experts.reasons import REASONS, NOT_ENOUGH_DATA, ERROR, series_codes
+
+BREAKOUT_UP = REASONS.code("Breakout above 20-day high")
+BREAKOUT_DOWN = REASONS.code("Breakdown below 20-day low")
+INSIDE_RANGE = REASONS.code("Inside range")
+
+
 class Breakout:
     name = "breakout"
 
-    def signal(self, df):
+    def signal_code(self, df):
         """
         ถ้าราคาทะลุ High/Low 20 วัน → breakout
+        -> (direction, strength, reason code)
         """
         try:
             if len(df) < 20:
-                return self._empty_signal("not enough data")
+                return 0, 0.0, NOT_ENOUGH_DATA
 
             high20 = df['high'].rolling(20).max().iloc[-1]
             low20 = df['low'].rolling(20).min().iloc[-1]
             price = df['close'].iloc[-1]
 
             if price > high20:
-                return self._make_signal(1, 1.0, "Breakout above 20-day high")
+                return 1, 1.0, BREAKOUT_UP
             elif price < low20:
-                return self._make_signal(-1, 1.0, "Breakdown below 20-day low")
+                return -1, 1.0, BREAKOUT_DOWN
             else:
-                return self._empty_signal("Inside range")
-        except Exception as e:
-            return self._empty_signal(str(e))
+                return 0, 0.0, INSIDE_RANGE
+        except Exception:
+            return 0, 0.0, ERROR
+
+    def signal_series(self, df):
+        """signal_code at every bar of a full frame (bar t sees rows <= t) -> (direction, strength, code) arrays"""
+        price = df['close'].to_numpy(dtype=float)
+        high20 = df['high'].rolling(20).max().to_numpy()
+        low20 = df['low'].rolling(20).min().to_numpy()
+        d = np.where(price > high20, 1, np.where(price < low20, -1, 0))
+        code = np.where(d > 0, BREAKOUT_UP, np.where(d < 0, BREAKOUT_DOWN, INSIDE_RANGE))
+        return series_codes(d, np.abs(d), code)
+
+    def signal(self, df):
+        direction, strength, code = self.signal_code(df)
+        return self.Sig(direction, strength, REASONS.text(code))
 
     class Sig:
         def __init__(self, direction=0, strength=0.0, reason=""):
             self.direction = direction
             self.strength = strength
             self.reason = reason
-
-    def _make_signal(self, direction, strength, reason):
-        return self.Sig(direction, strength, reason)
-
-    def _empty_signal(self, reason):
-        return self.Sig(0, 0.0, reason)
@@ -1,35 +1,53 @@
+import numpy as np
+
+from experts.reasons import REASONS, NOT_ENOUGH_DATA, ERROR, series_codes
+
+STRETCHED_UP = REASONS.code("Price above MA20 → short")
+STRETCHED_DOWN = REASONS.code("Price below MA20 → long")
+NEAR_MEAN = REASONS.code("Near mean")
+
+
 class MeanRevert:
     name = "mean_revert"
 
-    def signal(self, df):
+    def signal_code(self, df):
         """
         ถ้าราคาห่างจากค่าเฉลี่ย 20 วันมากเกินไป → คาดว่าจะ revert
+        -> (direction, strength, reason code)
         """
         try:
             if len(df) < 20:
-                return self._empty_signal("not enough data")
+                return 0, 0.0, NOT_ENOUGH_DATA
 
             ma20 = df['close'].rolling(20).mean().iloc[-1]
             price = df['close'].iloc[-1]
 
             diff = (price - ma20) / ma20
             if diff > 0.05:  # ราคา +5% จาก MA
-                return self._make_signal(-1, 0.6, "Price above MA20 → short")
+                return -1, 0.6, STRETCHED_UP
             elif diff < -0.05:  # ราคา -5% จาก MA
-                return self._make_signal(1, 0.6, "Price below MA20 → long")
+                return 1, 0.6, STRETCHED_DOWN
             else:
-                return self._empty_signal("Near mean")
-        except Exception as e:
-            return self._empty_signal(str(e))
+                return 0, 0.0, NEAR_MEAN
+        except Exception:
+            return 0, 0.0, ERROR
+
+    def signal_series(self, df):
+        """signal_code at every bar of a full frame (bar t sees rows <= t) -> (direction, strength, code) arrays"""
+        price = df['close'].to_numpy(dtype=float)
+        ma20 = df['close'].rolling(20).mean().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff = (price - ma20) / ma20
+        d = np.where(diff > 0.05, -1, np.where(diff < -0.05, 1, 0))
+        code = np.where(d < 0, STRETCHED_UP, np.where(d > 0, STRETCHED_DOWN, NEAR_MEAN))
+        return series_codes(d, np.where(d != 0, 0.6, 0.0), code)
+
+    def signal(self, df):
+        direction, strength, code = self.signal_code(df)
+        return self.Sig(direction, strength, REASONS.text(code))
 
     class Sig:
         def __init__(self, direction=0, strength=0.0, reason=""):
             self.direction = direction
             self.strength = strength
             self.reason = reason
-
-    def _make_signal(self, direction, strength, reason):
-        return self.Sig(direction, strength, reason)
-
-    def _empty_signal(self, reason):
-        return self.Sig(0, 0.0, reason)
@@ -1,34 +1,51 @@
+import numpy as np
+
+from experts.reasons import REASONS, NOT_ENOUGH_DATA, ERROR, series_codes
+
+PULLBACK = REASONS.code("Pullback near MA20 in uptrend")
+TOO_FAR = REASONS.code("Too far above MA20")
+NO_UPTREND = REASONS.code("Not in uptrend")
+
+
 class TrendPullback:
     name = "pullback"
 
-    def signal(self, df):
+    def signal_code(self, df):
         """
         ถ้าราคาอยู่ในขาขึ้น แต่ย่อตัวกลับมาใกล้ MA20 → เป็นจังหวะเข้าซื้อ
+        -> (direction, strength, reason code)
         """
         try:
             if len(df) < 20:
-                return self._empty_signal("not enough data")
+                return 0, 0.0, NOT_ENOUGH_DATA
 
             ma20 = df['close'].rolling(20).mean().iloc[-1]
             price = df['close'].iloc[-1]
 
             if price > ma20 * 1.02:
-                return self._empty_signal("Too far above MA20")
+                return 0, 0.0, TOO_FAR
             elif price > ma20:
-                return self._make_signal(1, 0.7, "Pullback near MA20 in uptrend")
+                return 1, 0.7, PULLBACK
             else:
-                return self._empty_signal("Not in uptrend")
-        except Exception as e:
-            return self._empty_signal(str(e))
+                return 0, 0.0, NO_UPTREND
+        except Exception:
+            return 0, 0.0, ERROR
+
+    def signal_series(self, df):
+        """signal_code at every bar of a full frame (bar t sees rows <= t) -> (direction, strength, code) arrays"""
+        price = df['close'].to_numpy(dtype=float)
+        ma20 = df['close'].rolling(20).mean().to_numpy()
+        too_far = price > ma20 * 1.02
+        d = np.where(~too_far & (price > ma20), 1, 0)
+        code = np.where(too_far, TOO_FAR, np.where(d > 0, PULLBACK, NO_UPTREND))
+        return series_codes(d, np.where(d != 0, 0.7, 0.0), code)
+
+    def signal(self, df):
+        direction, strength, code = self.signal_code(df)
+        return self.Sig(direction, strength, REASONS.text(code))
 
     class Sig:
         def __init__(self, direction=0, strength=0.0, reason=""):
             self.direction = direction
             self.strength = strength
             self.reason = reason
-
-    def _make_signal(self, direction, strength, reason):
-        return self.Sig(direction, strength, reason)
-
-    def _empty_signal(self, reason):
-        return self.Sig(0, 0.0, reason)
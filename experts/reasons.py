@@ -0,0 +1,42 @@
+# experts/reasons.py - reason code table shared by all experts (text is resolved only when logged)
+import numpy as np
+
+
+class ReasonTable:
+    """
+    Interns reason strings to small integer codes. Codes are registered at import time
+    only, so every process that imports the experts sees the same table.
+    """
+
+    def __init__(self):
+        self._text = [""]
+        self._code = {"": 0}
+
+    def code(self, text: str) -> int:
+        c = self._code.get(text)
+        if c is None:
+            c = len(self._text)
+            self._text.append(text)
+            self._code[text] = c
+        return c
+
+    def text(self, code: int) -> str:
+        return self._text[int(code)] if 0 <= int(code) < len(self._text) else f"reason#{int(code)}"
+
+    def __len__(self):
+        return len(self._text)
+
+
+REASONS = ReasonTable()
+NOT_EVALUATED = 0
+NOT_ENOUGH_DATA = REASONS.code("not enough data")
+ERROR = REASONS.code("error")
+
+
+def series_codes(direction, strength, code, min_bars: int = 20):
+    """Typed (direction i1, strength f4, code u2) arrays for signal_series; bars before min_bars have not enough data."""
+    direction = np.asarray(direction, dtype=np.int8).copy()
+    strength = np.asarray(strength, dtype=np.float32).copy()
+    code = np.asarray(code, dtype=np.uint16).copy()
+    direction[:min_bars - 1], strength[:min_bars - 1], code[:min_bars - 1] = 0, 0.0, NOT_ENOUGH_DATA
+    return direction, strength, code
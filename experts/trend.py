@@ -1,34 +1,50 @@
+import numpy as np
+
+from experts.reasons import REASONS, NOT_ENOUGH_DATA, ERROR, series_codes
+
+UPTREND = REASONS.code("Price above MA20 (uptrend)")
+DOWNTREND = REASONS.code("Price below MA20 (downtrend)")
+NEAR_MA = REASONS.code("Price near MA20")
+
+
 class TrendFollower:
     name = "trend"
 
-    def signal(self, df):
+    def signal_code(self, df):
         """
         ตีความง่าย ๆ: ถ้าราคาปิดล่าสุด > ราคาเฉลี่ย 20 วัน → แนวโน้มขึ้น
+        -> (direction, strength, reason code)
         """
         try:
             if len(df) < 20:
-                return self._empty_signal("not enough data")
+                return 0, 0.0, NOT_ENOUGH_DATA
 
             ma20 = df['close'].rolling(20).mean().iloc[-1]
             price = df['close'].iloc[-1]
 
             if price > ma20:
-                return self._make_signal(1, 0.8, "Price above MA20 (uptrend)")
+                return 1, 0.8, UPTREND
             elif price < ma20:
-                return self._make_signal(-1, 0.8, "Price below MA20 (downtrend)")
+                return -1, 0.8, DOWNTREND
             else:
-                return self._empty_signal("Price near MA20")
-        except Exception as e:
-            return self._empty_signal(str(e))
+                return 0, 0.0, NEAR_MA
+        except Exception:
+            return 0, 0.0, ERROR
+
+    def signal_series(self, df):
+        """signal_code at every bar of a full frame (bar t sees rows <= t) -> (direction, strength, code) arrays"""
+        price = df['close'].to_numpy(dtype=float)
+        ma20 = df['close'].rolling(20).mean().to_numpy()
+        d = np.where(price > ma20, 1, np.where(price < ma20, -1, 0))
+        code = np.where(d > 0, UPTREND, np.where(d < 0, DOWNTREND, NEAR_MA))
+        return series_codes(d, np.where(d != 0, 0.8, 0.0), code)
+
+    def signal(self, df):
+        direction, strength, code = self.signal_code(df)
+        return self.Sig(direction, strength, REASONS.text(code))
 
     class Sig:
         def __init__(self, direction=0, strength=0.0, reason=""):
             self.direction = direction  # 1=buy, -1=sell, 0=neutral
             self.strength = strength
             self.reason = reason
-
-    def _make_signal(self, direction, strength, reason):
-        return self.Sig(direction, strength, reason)
-
-    def _empty_signal(self, reason):
-        return self.Sig(0, 0.0, reason)
@@ -1,13 +1,24 @@
+import numpy as np
+
+from experts.reasons import REASONS, NOT_ENOUGH_DATA, ERROR, series_codes
+
+SQUEEZE_UP = REASONS.code("Bollinger squeeze breakout ↑")
+SQUEEZE_DOWN = REASONS.code("Bollinger squeeze breakdown ↓")
+WAITING = REASONS.code("Waiting breakout")
+NO_SQUEEZE = REASONS.code("No squeeze")
+
+
 class VolSqueezeBreakout:
     name = "vol_squeeze"
 
-    def signal(self, df):
+    def signal_code(self, df):
         """
         ถ้า Bollinger Band แคบมาก → รอ breakout
+        -> (direction, strength, reason code)
         """
         try:
             if len(df) < 20:
-                return self._empty_signal("not enough data")
+                return 0, 0.0, NOT_ENOUGH_DATA
 
             close = df['close']
             ma20 = close.rolling(20).mean().iloc[-1]
@@ -20,24 +31,36 @@ class VolSqueezeBreakout:
 
             if band_width < 0.05:  # squeeze < 5%
                 if price > upper:
-                    return self._make_signal(1, 1.0, "Bollinger squeeze breakout ↑")
+                    return 1, 1.0, SQUEEZE_UP
                 elif price < lower:
-                    return self._make_signal(-1, 1.0, "Bollinger squeeze breakdown ↓")
+                    return -1, 1.0, SQUEEZE_DOWN
                 else:
-                    return self._empty_signal("Waiting breakout")
+                    return 0, 0.0, WAITING
             else:
-                return self._empty_signal("No squeeze")
-        except Exception as e:
-            return self._empty_signal(str(e))
+                return 0, 0.0, NO_SQUEEZE
+        except Exception:
+            return 0, 0.0, ERROR
+
+    def signal_series(self, df):
+        """signal_code at every bar of a full frame (bar t sees rows <= t) -> (direction, strength, code) arrays"""
+        close = df['close']
+        price = close.to_numpy(dtype=float)
+        ma20 = close.rolling(20).mean().to_numpy()
+        std20 = close.rolling(20).std().to_numpy()
+        upper = ma20 + 2 * std20
+        lower = ma20 - 2 * std20
+        with np.errstate(divide='ignore', invalid='ignore'):
+            squeeze = (upper - lower) / ma20 < 0.05
+        d = np.where(squeeze & (price > upper), 1, np.where(squeeze & (price < lower), -1, 0))
+        code = np.where(~squeeze, NO_SQUEEZE, np.where(d > 0, SQUEEZE_UP, np.where(d < 0, SQUEEZE_DOWN, WAITING)))
+        return series_codes(d, np.abs(d), code)
+
+    def signal(self, df):
+        direction, strength, code = self.signal_code(df)
+        return self.Sig(direction, strength, REASONS.text(code))
 
     class Sig:
         def __init__(self, direction=0, strength=0.0, reason=""):
             self.direction = direction
             self.strength = strength
             self.reason = reason
-
-    def _make_signal(self, direction, strength, reason):
-        return self.Sig(direction, strength, reason)
-
-    def _empty_signal(self, reason):
-        return self.Sig(0, 0.0, reason)
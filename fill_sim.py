@@ -0,0 +1,67 @@
+# fill_sim.py - intrabar exit fills for arrays of open positions (SL / break-even / trailing / TP2)
+import numpy as np
+
+from utils_sizing import trail_stop_batch
+
+FEE = 0.0005       # 0.05% per trade side
+SLIPPAGE = 0.001   # 0.10% adverse
+
+# same-bar ambiguity: both the stop and the target lie inside one bar's range
+STOP_FIRST = "stop_first"        # assume the worst: the stop traded first
+TARGET_FIRST = "target_first"    # assume the best
+NEAREST_OPEN = "nearest_open"    # the level closer to the bar's open traded first (open -> nearer extreme)
+POLICIES = (STOP_FIRST, TARGET_FIRST, NEAREST_OPEN)
+
+EXIT_NONE, EXIT_SL, EXIT_TP = 0, 1, 2
+EXIT_NAMES = ("", "sl", "tp")
+
+
+def resolve_triggers(open_, high, low, sl, tp, side, policy: str = STOP_FIRST):
+    """
+    Which resting trigger each position's bar crosses first, and the level it trades at.
+    A bar that opens beyond a trigger (gap) fills at the open; otherwise at the trigger.
+    All inputs broadcast; tp may be NaN (no target). -> (code int8 array, level array)
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown ambiguity policy {policy!r}, expected one of {POLICIES}")
+    open_, high, low = (np.asarray(x, dtype=float) for x in (open_, high, low))
+    sl, tp, side = (np.asarray(x, dtype=float) for x in (sl, tp, side))
+    long_ = side > 0
+    with np.errstate(invalid='ignore'):
+        sl_gap = np.where(long_, open_ <= sl, open_ >= sl)
+        tp_gap = np.where(long_, open_ >= tp, open_ <= tp)
+        sl_hit = sl_gap | np.where(long_, low <= sl, high >= sl)
+        tp_hit = tp_gap | np.where(long_, high >= tp, low <= tp)
+    both = sl_hit & tp_hit & ~sl_gap & ~tp_gap
+    if policy == STOP_FIRST:
+        take_sl = both
+    elif policy == TARGET_FIRST:
+        take_sl = np.zeros_like(both)
+    else:
+        take_sl = both & (np.abs(open_ - sl) <= np.abs(tp - open_))
+    sl_first = sl_gap | (sl_hit & ~tp_hit) | (both & take_sl)
+    code = np.where(sl_first, EXIT_SL, np.where(tp_hit, EXIT_TP, EXIT_NONE)).astype(np.int8)
+    level = np.where(code == EXIT_SL, np.where(sl_gap, open_, sl), np.where(tp_gap, open_, tp))
+    return code, np.where(code == EXIT_NONE, np.nan, level)
+
+
+def fill_exits(open_, high, low, close, entry, sl, tp, side, atr, policy: str = STOP_FIRST,
+               slippage: float = SLIPPAGE, trail_atr: float = 1.2):
+    """
+    One bar for every open position at once. The stop and target that rested during the bar
+    (sl / tp from the previous bar) are resolved from its range; survivors then get the
+    runner's break-even / trail_atr * ATR stop management at the close, effective next bar.
+    Fills are stop / take-profit market orders: level moved against the position by slippage.
+    -> (code, fill price (NaN if still open), new sl)
+    """
+    side = np.asarray(side, dtype=float)
+    code, level = resolve_triggers(open_, high, low, sl, tp, side, policy)
+    fill = level * (1.0 - side * slippage)
+    new_sl = trail_stop_batch(close, entry, sl, side, np.nan_to_num(np.asarray(atr, dtype=float)), trail_atr)
+    return code, fill, np.where(code == EXIT_NONE, new_sl, np.asarray(sl, dtype=float))
+
+
+def trade_pnl(entry, exit_price, qty, side, fee: float = FEE):
+    """Signed USD result of closing qty at exit_price, fee charged on both sides' notional."""
+    entry, exit_price, qty = (np.asarray(x, dtype=float) for x in (entry, exit_price, qty))
+    return (exit_price - entry) * np.asarray(side, dtype=float) * qty - fee * (entry + exit_price) * qty
@@ -0,0 +1,183 @@
+# history_store.py - local columnar OHLCV history, one memory-mapped .npy per (symbol, timeframe)
+import argparse
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from candle_store import PRICE_FIELDS
+from utils import timeframe_to_ms
+
+COLUMNS = ('timestamp',) + PRICE_FIELDS
+HISTORY_DIR = os.path.join('data', 'history')
+
+
+class HistoryStore:
+    """
+    <root>/<timeframe>/<BASE_QUOTE>.npy holds a float64 array of shape (6, n): one contiguous
+    row per column (timestamp ms, open, high, low, close, volume), sorted by timestamp, no
+    duplicates. Reads np.load(mmap_mode='r') the file and return slices of it, so a range read
+    costs a binary search and no copy. Writes (backfill, CSV import) merge into a temp file and
+    rename it over the old one; readers holding the old map keep a consistent snapshot.
+    """
+
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        self._maps: Dict[Tuple[str, str], Tuple[float, np.ndarray]] = {}
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, timeframe, symbol.replace('/', '_').replace(':', '-') + '.npy')
+
+    # ---- reads ----
+    def _load(self, symbol: str, timeframe: str) -> Optional[np.ndarray]:
+        p = self.path(symbol, timeframe)
+        if not os.path.exists(p):
+            return None
+        mtime = os.path.getmtime(p)
+        hit = self._maps.get((symbol, timeframe))
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+        arr = np.load(p, mmap_mode='r')
+        self._maps[(symbol, timeframe)] = (mtime, arr)
+        return arr
+
+    def coverage(self, symbol: str, timeframe: str) -> Tuple[Optional[int], Optional[int], int]:
+        """(first ts, last ts, bars) or (None, None, 0)."""
+        a = self._load(symbol, timeframe)
+        if a is None or a.shape[1] == 0:
+            return None, None, 0
+        return int(a[0, 0]), int(a[0, -1]), a.shape[1]
+
+    def read(self, symbol: str, timeframe: str, start_ms: int = None, end_ms: int = None,
+             last: int = None) -> np.ndarray:
+        """(6, k) read-only view of bars with start_ms <= ts < end_ms (then the last `last` of them)."""
+        a = self._load(symbol, timeframe)
+        if a is None:
+            return np.zeros((len(COLUMNS), 0))
+        ts = a[0]
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side='left'))
+        hi = a.shape[1] if end_ms is None else int(np.searchsorted(ts, end_ms, side='left'))
+        if last is not None:
+            lo = max(lo, hi - int(last))
+        return a[:, lo:hi]
+
+    def columns(self, symbol: str, timeframe: str, start_ms: int = None, end_ms: int = None,
+                last: int = None) -> Dict[str, np.ndarray]:
+        v = self.read(symbol, timeframe, start_ms, end_ms, last)
+        return {c: v[i] for i, c in enumerate(COLUMNS)}
+
+    def frame(self, symbol: str, timeframe: str, start_ms: int = None, end_ms: int = None,
+              last: int = None) -> pd.DataFrame:
+        """DataFrame in the CCXTBroker.fetch_ohlcv layout (prices stay views of the map)."""
+        v = self.read(symbol, timeframe, start_ms, end_ms, last)
+        # the (5, k) price rows are already one float block in pandas' layout: a per-column dict
+        # would be consolidated (copied) into one, the 2-D slice is taken as is
+        df = pd.DataFrame(v[1:].T, columns=list(PRICE_FIELDS), copy=False)
+        df.insert(0, 'timestamp', pd.to_datetime(v[0].astype(np.int64), unit='ms'))
+        return df
+
+    # ---- writes ----
+    def write(self, symbol: str, timeframe: str, rows) -> int:
+        """Merge ccxt-style rows [[ts, o, h, l, c, v], ...]; an existing ts is overwritten. -> new bars."""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+        if rows.size == 0:
+            return 0
+        old = self._load(symbol, timeframe)
+        n_old = 0 if old is None else old.shape[1]
+        merged = rows.T if old is None else np.concatenate([np.asarray(old), rows.T], axis=1)
+        # stable sort + keep the last occurrence of each ts: fresh rows win over stored ones
+        order = np.argsort(merged[0], kind='stable')
+        merged = merged[:, order]
+        keep = np.ones(merged.shape[1], dtype=bool)
+        keep[:-1] = merged[0, 1:] != merged[0, :-1]
+        merged = np.ascontiguousarray(merged[:, keep])
+        p = self.path(symbol, timeframe)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = p + '.tmp.npy'
+        np.save(tmp, merged)
+        os.replace(tmp, p)
+        self._maps.pop((symbol, timeframe), None)
+        return merged.shape[1] - n_old
+
+    def backfill(self, fetch: Callable, symbol: str, timeframe: str, since_ms: int, until_ms: int = None,
+                 page: int = 1000, pause: float = 0.0, flush_every: int = 20) -> int:
+        """
+        Download what [since_ms, until_ms) is missing: the part before the stored range and
+        everything after its last bar, page by page. fetch(symbol, timeframe, since, limit)
+        -> ccxt rows (e.g. CCXTBroker.fetch_ohlcv_raw). Pages are saved every flush_every
+        pages, so an interrupted backfill resumes close to where it stopped. -> new bars.
+        """
+        step = timeframe_to_ms(timeframe)
+        until_ms = int(time.time() * 1000) if until_ms is None else int(until_ms)
+        first, last, _ = self.coverage(symbol, timeframe)
+        spans = [(since_ms, until_ms)] if first is None else \
+            [(since_ms, first), (last, until_ms)]     # the stored last bar may still have been forming
+        added, pending = 0, []
+        for lo, hi in spans:
+            cursor = int(lo)
+            while cursor < hi:
+                rows = fetch(symbol, timeframe, cursor, page)
+                rows = [r for r in rows or [] if r[0] < hi]
+                if not rows:
+                    break
+                pending.extend(rows)
+                if len(pending) >= flush_every * page:
+                    added += self.write(symbol, timeframe, pending)
+                    pending = []
+                nxt = int(rows[-1][0]) + step
+                if nxt <= cursor:
+                    break
+                cursor = nxt
+                if pause:
+                    time.sleep(pause)
+        if pending:
+            added += self.write(symbol, timeframe, pending)
+        return added
+
+    def import_csv(self, path: str, symbol: str, timeframe: str) -> int:
+        """CSV with timestamp,open,high,low,close,volume (ms epoch or date strings) -> new bars."""
+        df = pd.read_csv(path)
+        df.columns = [c.strip().lower() for c in df.columns]
+        ts = df['timestamp']
+        if not pd.api.types.is_numeric_dtype(ts):
+            ts = (pd.to_datetime(ts, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)
+        rows = np.column_stack([ts.to_numpy(dtype=np.float64)] + [df[c].to_numpy(dtype=np.float64)
+                                                                  for c in PRICE_FIELDS])
+        return self.write(symbol, timeframe, rows)
+
+
+def _main():
+    from config import CFG
+    parser = argparse.ArgumentParser(description="local OHLCV history store")
+    parser.add_argument('command', choices=['backfill', 'import', 'info'])
+    parser.add_argument('--root', default=HISTORY_DIR)
+    parser.add_argument('--symbols', default=",".join(CFG.data.symbols))
+    parser.add_argument('--timeframes', default="15m,30m,1h")
+    parser.add_argument('--days', type=int, default=365, help="backfill: history to cover, in days")
+    parser.add_argument('--csv', help="import: CSV file (one symbol / timeframe)")
+    args = parser.parse_args()
+    store = HistoryStore(args.root)
+    symbols = [s.strip() for s in args.symbols.split(',') if s.strip()]
+    timeframes = [t.strip() for t in args.timeframes.split(',') if t.strip()]
+    if args.command == 'import':
+        print(f"[History] {symbols[0]} {timeframes[0]}: +{store.import_csv(args.csv, symbols[0], timeframes[0])} bars")
+        return
+    if args.command == 'backfill':
+        import ccxt
+        ex = getattr(ccxt, CFG.data.exchange)({'enableRateLimit': True})
+        since = int(time.time() * 1000) - args.days * 86_400_000
+        for s in symbols:
+            for tf in timeframes:
+                n = store.backfill(lambda sym, t, c, lim: ex.fetch_ohlcv(sym, timeframe=t, since=c, limit=lim), s, tf, since)
+                print(f"[History] {s} {tf}: +{n} bars")
+    for s in symbols:
+        for tf in timeframes:
+            first, last, n = store.coverage(s, tf)
+            if n:
+                print(f"{s} {tf}: {n} bars {pd.to_datetime(first, unit='ms')} -> {pd.to_datetime(last, unit='ms')}")
+
+
+if __name__ == "__main__":
+    _main()
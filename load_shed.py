@@ -0,0 +1,101 @@
+# load_shed.py - per-iteration time budget with stepwise load shedding
+import time
+from collections import Counter
+from typing import List, Sequence
+
+# shedding levels, each one keeps everything the previous one dropped
+NORMAL, CORE_TIMEFRAMES, TOP_UNIVERSE, QUIET = range(4)
+LEVEL_NAMES = ("normal", "core-timeframes", "top-universe", "quiet")
+
+
+class LoadShedder:
+    """
+    Times each runner iteration against budget_secs. An iteration over budget raises the
+    level by one:
+      1  fetch / evaluate only the core timeframes (1h), 15m / 30m count as neutral
+      2  evaluate only the top_n momentum symbols of the last full ranking (+ held ones)
+      3  skip the per-symbol summary logging
+    recover_iters iterations in a row under recover_frac * budget lower it by one again.
+    Exits and risk checks are never shed; over_budget() lets the loop skip new entries when
+    the budget is already gone before the signal stage.
+    """
+
+    def __init__(self, budget_secs: float, recover_iters: int = 3, recover_frac: float = 0.6,
+                 top_n: int = 10, core_timeframes: Sequence[str] = ("1h",), max_level: int = QUIET):
+        self.budget = float(budget_secs)
+        self.recover_iters = max(1, int(recover_iters))
+        self.recover_frac = recover_frac
+        self.top_n = int(top_n)
+        self.core_timeframes = list(core_timeframes)
+        self.max_level = max_level
+        self.level = NORMAL
+        self.ranking: List[str] = []     # last momentum ranking over the full universe
+        self.iterations = Counter()      # level name -> iterations run at that level
+        self.escalations = Counter()     # level name -> times it was entered from below
+        self.recoveries = 0
+        self.over = 0
+        self.skipped_entries = 0
+        self.last_elapsed = 0.0
+        self.ewma_elapsed = 0.0
+        self._calm = 0
+        self._t0 = time.monotonic()
+
+    def start(self):
+        self._t0 = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._t0
+
+    def over_budget(self) -> bool:
+        return self.budget > 0 and self.elapsed() > self.budget
+
+    # ---- policy ----
+    def timeframes(self, timeframes: Sequence[str]) -> List[str]:
+        if self.level >= CORE_TIMEFRAMES:
+            return [tf for tf in timeframes if tf in self.core_timeframes]
+        return list(timeframes)
+
+    def universe(self, symbols: Sequence[str], held: Sequence[str]) -> List[str]:
+        if self.level < TOP_UNIVERSE or not self.ranking:
+            return list(symbols)
+        keep = set(self.ranking[:self.top_n]) | set(held)
+        return [s for s in symbols if s in keep]
+
+    def full_universe(self) -> bool:
+        return self.level < TOP_UNIVERSE
+
+    def quiet(self) -> bool:
+        return self.level >= QUIET
+
+    # ---- feedback ----
+    def finish(self) -> int:
+        """Close the iteration: update metrics and move the level; returns the level change (-1 / 0 / +1)."""
+        e = self.last_elapsed = self.elapsed()
+        self.ewma_elapsed = e if not self.ewma_elapsed else 0.8 * self.ewma_elapsed + 0.2 * e
+        self.iterations[LEVEL_NAMES[self.level]] += 1
+        if self.budget <= 0:
+            return 0
+        if e > self.budget:
+            self.over += 1
+            self._calm = 0
+            if self.level < self.max_level:
+                self.level += 1
+                self.escalations[LEVEL_NAMES[self.level]] += 1
+                return 1
+            return 0
+        if e < self.recover_frac * self.budget:
+            self._calm += 1
+            if self.level > NORMAL and self._calm >= self.recover_iters:
+                self.level -= 1
+                self._calm = 0
+                self.recoveries += 1
+                return -1
+        else:
+            self._calm = 0
+        return 0
+
+    def stats(self) -> dict:
+        return {"level": LEVEL_NAMES[self.level], "last_secs": round(self.last_elapsed, 3),
+                "ewma_secs": round(self.ewma_elapsed, 3), "budget_secs": self.budget, "over_budget": self.over,
+                "escalations": dict(self.escalations), "recoveries": self.recoveries,
+                "iterations": dict(self.iterations), "skipped_entries": self.skipped_entries}
@@ -1,37 +1,90 @@
-import pandas as pd
+import numpy as np
 
 class MetaLearner:
+    """
+    Per-expert performance weights backed by fixed-size arrays (experts x window_trades).
+    One trade updates every expert's decayed score in a single vectorized step.
+    """
+
     def __init__(self, cfg=None, expert_names=None):
         self.cfg = cfg
-        self.expert_names = expert_names or []
-        self.history = pd.DataFrame(columns=self.expert_names)
-        self.weights = {name: 1.0 for name in self.expert_names}
+        self.expert_names = list(expert_names or [])
+        self.index = {name: i for i, name in enumerate(self.expert_names)}
+        n = len(self.expert_names)
 
         # ใช้ getattr แทน .get()
         self.decay = getattr(self.cfg, 'decay', 0.9)
+        self.window = int(getattr(self.cfg, 'window_trades', 50))
+        self.pf_down_threshold = float(getattr(self.cfg, 'pf_down_threshold', 0.0))
+        self.reduce_weight_factor = float(getattr(self.cfg, 'reduce_weight_factor', 1.0))
+
+        self.history = np.zeros((n, self.window))   # per-trade credit contrib * pnl (ring)
+        self._i = 0
+        self._n = 0
+        self.score = np.zeros(n)                    # decayed credit
+        self._seen = np.zeros(n, dtype=bool)
+        self.weights_vec = np.ones(n)
 
+    @property
+    def weights(self):
+        return dict(zip(self.expert_names, self.weights_vec.tolist()))
 
     def get_weight(self, expert_name):
-        return self.weights.get(expert_name, 1.0)
+        i = self.index.get(expert_name)
+        return float(self.weights_vec[i]) if i is not None else 1.0
+
+    def weights_vector(self) -> np.ndarray:
+        return self.weights_vec
+
+    def update_vector(self, contrib, realized_pnl, mask=None):
+        """
+        contrib: (n_experts,) signed vote of each expert for the trade (agreement with the
+        position direction), realized_pnl: trade result (R-multiples work best).
+        """
+        credit = np.asarray(contrib, dtype=float) * float(realized_pnl)
+        mask = np.ones(len(credit), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        first = mask & ~self._seen
+        self.score = np.where(first, credit,
+                              np.where(mask, self.decay * self.score + (1 - self.decay) * credit, self.score))
+        self._seen |= mask
+
+        self.history[:, self._i] = np.where(mask, credit, 0.0)
+        self._i = (self._i + 1) % self.window
+        self._n = min(self._n + 1, self.window)
+
+        w = np.clip(1.0 + self.score, 0.0, 2.0)
+        if self.pf_down_threshold > 0 and self._n >= min(10, self.window):
+            # experts whose recent profit factor fell below the threshold get cut
+            h = self.history[:, :self._n]
+            gains = np.where(h > 0, h, 0.0).sum(axis=1)
+            losses = -np.where(h < 0, h, 0.0).sum(axis=1)
+            pf = np.where(losses > 0, gains / np.maximum(losses, 1e-12), np.inf)
+            w = np.where(pf < self.pf_down_threshold, w * self.reduce_weight_factor, w)
+        self.weights_vec = w
 
     def update(self, signals, realized_pnl):
+        contrib = np.zeros(len(self.expert_names))
+        mask = np.zeros(len(self.expert_names), dtype=bool)
         for name, (direction, strength, reason) in signals.items():
-            if name not in self.weights:
+            i = self.index.get(name)
+            if i is None:
                 continue
-            contrib = direction * strength
-            if name not in self.history.columns:
-                self.history[name] = []
-            if len(self.history) == 0:
-                self.history.loc[0, name] = contrib * realized_pnl
-            else:
-                last = self.history[name].iloc[-1] if not self.history[name].empty else 0
-                new_val = self.decay * last + (1 - self.decay) * contrib * realized_pnl
-                self.history.loc[len(self.history), name] = new_val
-            perf = self.history[name].iloc[-1]
-            w = max(0.0, min(2.0, 1.0 + perf))
-            self.weights[name] = w
+            contrib[i] = direction * strength
+            mask[i] = True
+        self.update_vector(contrib, realized_pnl, mask)
+
+    def state_dict(self):
+        return {"expert_names": list(self.expert_names), "history": self.history.copy(), "i": self._i, "n": self._n,
+                "score": self.score.copy(), "seen": self._seen.copy(), "weights": self.weights_vec.copy()}
+
+    def load_state(self, d):
+        # only when the expert set and window are unchanged; otherwise start fresh
+        if d["expert_names"] != self.expert_names or d["history"].shape != self.history.shape:
+            return False
+        self.history, self._i, self._n = d["history"].copy(), d["i"], d["n"]
+        self.score, self._seen, self.weights_vec = d["score"].copy(), d["seen"].copy(), d["weights"].copy()
+        return True
 
     def normalize_weights(self):
-        total = sum(self.weights.values()) or 1.0
-        for k in self.weights:
-            self.weights[k] /= total
+        total = float(self.weights_vec.sum()) or 1.0
+        self.weights_vec = self.weights_vec / total
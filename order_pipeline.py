@@ -0,0 +1,227 @@
+# order_pipeline.py - asynchronous order submission: intents in, fills / rejects out
+import itertools
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import ccxt
+
+FINAL_STATUSES = ("closed", "canceled", "cancelled", "rejected", "expired", "FILLED")
+
+
+@dataclass
+class OrderIntent:
+    client_id: str
+    symbol: str
+    side: str                   # 'buy' / 'sell'
+    amount: float
+    kind: str                   # 'entry' / 'exit'
+    price: float                # reference price at decision time
+    reduce_only: bool = False
+    attempts: int = 0
+    created: float = field(default_factory=time.time)
+
+
+@dataclass
+class OrderResult:
+    intent: OrderIntent
+    status: str                 # 'filled' / 'partial' / 'rejected'
+    filled: float = 0.0
+    avg_price: float = 0.0
+    order: Optional[dict] = None
+    error: str = ""
+
+
+def _retryable(err: Exception) -> bool:
+    # network trouble / throttling may or may not have reached the exchange; everything else is final
+    return isinstance(err, ccxt.NetworkError)
+
+
+class OrderPipeline:
+    """
+    The runner submits intents and keeps going; a thread pool sends them concurrently
+    (the broker's RequestScheduler keeps them within rate limits). Every intent carries a
+    client order id: after a timeout the order is looked up by that id before being sent
+    again, so a retry never doubles a position. An order still open after fill_timeout is
+    canceled by that id and its final fill reported; if the cancel does not go through it
+    stays in flight and later drain() calls check it again until it is final.
+    Finished orders are collected with drain().
+    paper=True fills every intent at its reference price without touching the broker.
+    """
+
+    def __init__(self, broker, workers: int = 4, max_retries: int = 3, retry_backoff: float = 0.5,
+                 fill_timeout: float = 10.0, paper: bool = False, prefix: str = "ohc"):
+        self.broker = broker
+        self.max_retries = max(1, int(max_retries))
+        self.retry_backoff = retry_backoff
+        self.fill_timeout = fill_timeout
+        self.paper = paper
+        self.prefix = prefix
+        self.pool = None if paper else ThreadPoolExecutor(max_workers=max(1, int(workers)),
+                                                          thread_name_prefix="orders")
+        self.stats = Counter()
+        self._seq = itertools.count()
+        self._done = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._unsettled = {}        # client id -> time of the next check, orders left open after a failed cancel
+
+    def new_client_id(self) -> str:
+        # binance: <= 36 chars of [.A-Z:/a-z0-9_-]
+        return f"{self.prefix}-{int(time.time() * 1000):x}-{next(self._seq)}"
+
+    def busy(self, symbol: str) -> bool:
+        with self._lock:
+            return any(i.symbol == symbol for i in self._in_flight.values())
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+    def _active(self) -> int:
+        # in flight minus the ones parked until their next check
+        with self._lock:
+            return len(self._in_flight) - len(self._unsettled)
+
+    def submit(self, symbol: str, side: str, amount: float, kind: str, price: float,
+               reduce_only: bool = False) -> OrderIntent:
+        intent = OrderIntent(self.new_client_id(), symbol, side, float(amount), kind, float(price), reduce_only)
+        self.stats["submitted"] += 1
+        if self.paper:
+            self._finish(intent, {"filled": intent.amount, "average": intent.price, "status": "closed"})
+            return intent
+        with self._lock:
+            self._in_flight[intent.client_id] = intent
+        self.pool.submit(self._execute, intent)
+        return intent
+
+    def _execute(self, intent: OrderIntent):
+        last = None
+        try:
+            for attempt in range(1, self.max_retries + 1):
+                intent.attempts = attempt
+                try:
+                    order = self.broker.submit_order(intent.symbol, intent.side, intent.amount,
+                                                     intent.client_id, intent.reduce_only)
+                    return self._settle(intent, order)
+                except ccxt.DuplicateOrderId:
+                    # an earlier attempt did land
+                    order = self.broker.fetch_order_by_client_id(intent.symbol, intent.client_id)
+                    if order:
+                        return self._settle(intent, order)
+                    return self._reject(intent, "duplicate client id, order not found")
+                except Exception as e:
+                    last = e
+                    if not _retryable(e):
+                        return self._reject(intent, str(e))
+                    self.stats["retries"] += 1
+                    try:
+                        order = self.broker.fetch_order_by_client_id(intent.symbol, intent.client_id)
+                    except Exception:
+                        order = None
+                    if order:
+                        return self._settle(intent, order)
+                    time.sleep(self.retry_backoff * attempt)
+            return self._reject(intent, f"gave up after {self.max_retries} attempts: {last}")
+        except Exception as e:
+            return self._reject(intent, f"unexpected: {e}")
+
+    def _await_fill(self, intent: OrderIntent, order: dict) -> dict:
+        # market orders can be acknowledged before they fill: poll by client id until final
+        deadline = time.time() + self.fill_timeout
+        while order and order.get("status") not in FINAL_STATUSES and time.time() < deadline:
+            time.sleep(0.25)
+            order = self.broker.fetch_order_by_client_id(intent.symbol, intent.client_id) or order
+        return order
+
+    def _cancel_open(self, intent: OrderIntent) -> Optional[dict]:
+        try:
+            self.broker.cancel_order_by_client_id(intent.symbol, intent.client_id)
+        except ccxt.OrderNotFound:
+            pass            # already final (or never landed): the lookup below tells which
+        return self.broker.fetch_order_by_client_id(intent.symbol, intent.client_id)
+
+    def _settle(self, intent: OrderIntent, order: dict):
+        order = self._await_fill(intent, order)
+        if order.get("status") in FINAL_STATUSES:
+            return self._finish(intent, order)
+        # still open: a timeout is not a reject, the rest of the order could fill any moment
+        try:
+            order = self._cancel_open(intent)
+        except NotImplementedError:
+            return self._finish(intent, order)
+        except Exception:
+            self.stats["cancel_failed"] += 1
+            return self._hold(intent)
+        if order is None:
+            return self._reject(intent, "order not found after cancel")
+        if order.get("status") not in FINAL_STATUSES:
+            return self._hold(intent)
+        return self._finish(intent, order)
+
+    def _hold(self, intent: OrderIntent):
+        self.stats["held"] += 1
+        with self._lock:
+            self._unsettled[intent.client_id] = time.time() + self.fill_timeout
+
+    def _recheck(self, intent: OrderIntent):
+        try:
+            order = self.broker.fetch_order_by_client_id(intent.symbol, intent.client_id)
+            if order is not None and order.get("status") not in FINAL_STATUSES:
+                order = self._cancel_open(intent)
+        except Exception:
+            return self._hold(intent)
+        if order is None:
+            return self._reject(intent, "order not found")
+        if order.get("status") not in FINAL_STATUSES:
+            return self._hold(intent)
+        return self._finish(intent, order)
+
+    def _finish(self, intent: OrderIntent, order: dict):
+        filled = order.get("filled")
+        if filled is None:
+            filled = order.get("size", intent.amount) if order.get("status") in FINAL_STATUSES else 0.0
+        filled = float(filled or 0.0)
+        avg = float(order.get("average") or order.get("price") or intent.price)
+        if filled <= 0:
+            return self._reject(intent, f"nothing filled (status={order.get('status')})", order)
+        status = "filled" if filled >= intent.amount * (1 - 1e-9) else "partial"
+        self.stats[status] += 1
+        self._put(OrderResult(intent, status, filled, avg, order))
+
+    def _reject(self, intent: OrderIntent, error: str, order: dict = None):
+        self.stats["rejected"] += 1
+        self._put(OrderResult(intent, "rejected", 0.0, 0.0, order, error))
+
+    def _put(self, result: OrderResult):
+        with self._lock:
+            self._in_flight.pop(result.intent.client_id, None)
+        self._done.put(result)
+
+    def drain(self, wait: float = 0.0) -> List[OrderResult]:
+        """Finished orders since the last call; waits up to `wait` seconds for in-flight ones."""
+        now = time.time()
+        with self._lock:
+            due = [self._in_flight[cid] for cid, t in self._unsettled.items() if t <= now]
+            for intent in due:
+                del self._unsettled[intent.client_id]
+        for intent in due:
+            self.pool.submit(self._recheck, intent)
+        deadline = now + wait
+        while wait > 0 and self._active() and time.time() < deadline:
+            time.sleep(0.02)
+        out = []
+        while True:
+            try:
+                out.append(self._done.get_nowait())
+            except queue.Empty:
+                return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
@@ -0,0 +1,154 @@
+# parallel.py - symbol-sharded evaluation of the signal pipeline across a process pool
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import pandas as pd
+
+import pipeline
+from signal_cache import SignalMemo
+from signal_matrix import SignalMatrix
+
+# per-worker globals (set once by the pool initializer)
+_experts = None
+_reader = None
+_memo = None
+
+
+def _init_worker(plane_spec=None, memo_size=0):
+    global _experts, _reader, _memo
+    _experts = pipeline.build_experts()
+    _memo = SignalMemo(memo_size) if memo_size else None
+    if plane_spec is not None:
+        from data_plane import DataPlaneReader
+        _reader = DataPlaneReader(plane_spec)
+
+
+def _frames_from_plane(symbol: str, timeframes, skip=()):
+    # zero-copy frames on the shared arrays; caller re-checks versions afterwards. skip: shed timeframes -> None
+    frames, versions = {}, {}
+    for tf in timeframes:
+        if tf in skip:
+            frames[tf] = None
+            continue
+        seq, v = _reader.views(symbol, tf)
+        if len(v['timestamp']) == 0:
+            frames[tf] = None
+        else:
+            v['timestamp'] = v['timestamp'].view('datetime64[ms]')
+            frames[tf] = pipeline.ensure_atr(pd.DataFrame(v, copy=False))
+        versions[tf] = seq
+    return frames, versions
+
+
+def _eval_chunk(symbols: List[str], data, tf_weights: Dict[str, float], expert_weights=None, regime_factors=None,
+                shed_tfs=None):
+    regime_factors = regime_factors or {}
+    shed_tfs = shed_tfs or {}
+    if data is not None:
+        candidates, rejects, contribs, m = pipeline.evaluate_batch(symbols, data, _experts, tf_weights, expert_weights,
+                                                                   regime_factors, _memo)
+    else:
+        candidates, rejects, contribs = [], [], {}
+        m = SignalMatrix(symbols, pipeline._tf_order(tf_weights), [e.name for e in _experts])
+        for s in symbols:
+            # torn read -> evaluate again on the newer candles (the fetcher rarely writes twice in a row)
+            for _ in range(3):
+                frames, versions = _frames_from_plane(s, list(tf_weights), shed_tfs.get(s, ()))
+                cand, reason, contrib = pipeline.evaluate_symbol(s, frames, _experts, tf_weights, expert_weights,
+                                                                 regime_factors.get(s), _memo, m)
+                if all(_reader.unchanged(s, tf, v) for tf, v in versions.items()):
+                    break
+            if cand is None:
+                rejects.append((s, reason))
+            else:
+                candidates.append(cand)
+                contribs[s] = contrib
+    return candidates, rejects, contribs, m, (os.getpid(), _memo.stats() if _memo is not None else None)
+
+
+class ParallelEvaluator:
+    """
+    Distributes symbols over `workers` processes. Workers get candles either from the
+    shared-memory data plane (only symbol names, plus the timeframes the caller left None
+    in data, i.e. shed this loop, cross the process boundary) or as pickled frames. workers <= 1 or any pool failure falls back to in-process evaluation.
+    memo_size > 0 gives every process its own bar-keyed SignalMemo. The signal matrix of the
+    last call is kept in last_matrix.
+    """
+
+    def __init__(self, workers: int = 0, plane_spec=None, logger=None, memo_size: int = 0):
+        self.workers = int(workers) if workers else max(1, (os.cpu_count() or 2) - 1)
+        self.plane_spec = plane_spec
+        self.logger = logger
+        self.pool = None
+        self.local_experts = pipeline.build_experts()
+        self.memo = SignalMemo(memo_size) if memo_size else None
+        self._worker_memo = {}
+        self.last_matrix = None
+        if self.workers > 1:
+            try:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(plane_spec, memo_size))
+            except Exception as e:
+                self._fallback(e)
+
+    def _fallback(self, err):
+        if self.logger:
+            self.logger.warning(f"[Parallel] pool unavailable, evaluating in-process: {err}")
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+
+    def evaluate(self, symbols: List[str], data: Dict[str, Dict], tf_weights: Dict[str, float] = pipeline.TF_WEIGHTS,
+                 expert_weights=None, regime_factors=None):
+        """-> (candidates [(eu, symbol, direction, strength)], rejects [(symbol, reason)], contribs {symbol: votes})"""
+        if self.pool is None or len(symbols) < 2:
+            return self._evaluate_local(symbols, data, tf_weights, expert_weights, regime_factors)
+        n = min(self.workers, len(symbols))
+        shards = [symbols[i::n] for i in range(n)]
+        try:
+            futures = []
+            for shard in shards:
+                payload, shed_tfs = None, None
+                if self.plane_spec is None:
+                    payload = {s: data[s] for s in shard}
+                else:
+                    shed_tfs = {s: [tf for tf in tf_weights if data.get(s, {}).get(tf) is None] for s in shard}
+                shard_regime = {s: regime_factors[s] for s in shard if s in regime_factors} if regime_factors else None
+                futures.append(self.pool.submit(_eval_chunk, shard, payload, dict(tf_weights), expert_weights, shard_regime,
+                                                shed_tfs))
+            candidates, rejects, contribs = [], [], {}
+            matrix = SignalMatrix(symbols, pipeline._tf_order(tf_weights), [e.name for e in self.local_experts])
+            for f in futures:
+                c, r, v, m, (pid, memo_stats) = f.result()
+                if memo_stats is not None:
+                    self._worker_memo[pid] = memo_stats
+                matrix.merge(m)
+                candidates.extend(c)
+                rejects.extend(r)
+                contribs.update(v)
+            self.last_matrix = matrix
+            return candidates, rejects, contribs
+        except Exception as e:
+            self._fallback(e)
+            return self._evaluate_local(symbols, data, tf_weights, expert_weights, regime_factors)
+
+    def _evaluate_local(self, symbols, data, tf_weights, expert_weights, regime_factors):
+        candidates, rejects, contribs, self.last_matrix = pipeline.evaluate_batch(
+            symbols, data, self.local_experts, tf_weights, expert_weights, regime_factors, self.memo)
+        return candidates, rejects, contribs
+
+    def memo_stats(self) -> dict:
+        """Hit/miss counters summed over the local memo and every worker's memo."""
+        parts = list(self._worker_memo.values())
+        if self.memo is not None:
+            parts.append(self.memo.stats())
+        out = {k: sum(p[k] for p in parts) for k in ("hits", "misses", "invalidations", "evictions", "size")}
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / total if total else 0.0
+        return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,257 @@
+# pipeline.py - per-symbol decision core (shared by runner, worker processes and backtests)
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from experts.trend import TrendFollower
+from experts.mean_revert import MeanRevert
+from experts.breakout import Breakout
+from experts.pullback import TrendPullback
+from experts.vol_squeeze import VolSqueezeBreakout
+from signal_cache import bar_key
+from signal_matrix import SignalMatrix
+from utils import atr_wilder
+
+TIMEFRAMES = ["15m", "30m", "1h"]
+TF_WEIGHTS = {"15m": 0.3, "30m": 0.3, "1h": 0.4}
+RR = 1.5
+NEUTRAL_BAND = 0.05
+
+# (eu, symbol, direction, strength)
+Candidate = Tuple[float, str, int, float]
+
+REJECT_FILTER_GATE = "filter gate"
+REJECT_EARLY_NEUTRAL = "neutral after 1h"
+REJECT_NEUTRAL = "neutral signal"
+REJECT_FILTERS = "filters not passed"
+
+
+def build_experts():
+    return [TrendFollower(), MeanRevert(), Breakout(), TrendPullback(), VolSqueezeBreakout()]
+
+
+# helper: map strength -> crude prob (calibrated later via backtest)
+def strength_to_prob(strength: float) -> float:
+    return max(0.45, min(0.66, 0.46 + 0.2 * strength))
+
+
+def strength_to_prob_batch(strength) -> np.ndarray:
+    return np.clip(0.46 + 0.2 * np.asarray(strength, dtype=float), 0.45, 0.66)
+
+
+def expected_utility(strength: float, rr: float = RR) -> float:
+    p = strength_to_prob(strength)
+    return p * rr - (1 - p)
+
+
+def filter_direction(df: pd.DataFrame) -> int:
+    """
+    The only direction pass_filters can accept for this frame (+1 / -1), or 0 if none.
+    Cheapest check first, so most frames are rejected without the EMA/RSI work.
+    """
+    if df is None or len(df) < 50:
+        return 0
+    atr = float(df.get('atr14', pd.Series([0.0])).iloc[-1] or 0.0)
+    volp = atr / max(df['close'].iloc[-1], 1e-9)
+    if not (0.01 <= volp <= 0.06):
+        return 0
+
+    ema50 = df['close'].ewm(span=50).mean().iloc[-1]
+    ema200 = df['close'].ewm(span=200).mean().iloc[-1]
+    trend_dir = 1 if ema50 > ema200 else (-1 if ema50 < ema200 else 0)
+    if trend_dir == 0:
+        return 0
+
+    delta = df['close'].diff().fillna(0)
+    up = delta.clip(lower=0).rolling(14).mean()
+    down = -delta.clip(upper=0).rolling(14).mean()
+    rs = (up / (down + 1e-9)).replace([float('inf')], 0)
+    rsi = 100 - (100 / (1 + rs))
+    rsi_latest = float(rsi.iloc[-1]) if not rsi.isna().iloc[-1] else 50
+    if (trend_dir > 0 and rsi_latest >= 55) or (trend_dir < 0 and rsi_latest <= 45):
+        return trend_dir
+    return 0
+
+
+def filter_direction_series(df: pd.DataFrame) -> np.ndarray:
+    """filter_direction at every bar of a full frame (bar t sees rows <= t) -> int8 array."""
+    close = df['close']
+    atr = df['atr14'] if 'atr14' in df else atr_wilder(df, 14)
+    volp = atr.fillna(0.0).to_numpy() / np.maximum(close.to_numpy(dtype=float), 1e-9)
+    ema50 = close.ewm(span=50).mean().to_numpy()
+    ema200 = close.ewm(span=200).mean().to_numpy()
+    trend_dir = np.sign(ema50 - ema200)
+    delta = close.diff().fillna(0)
+    up = delta.clip(lower=0).rolling(14).mean()
+    down = -delta.clip(upper=0).rolling(14).mean()
+    rs = (up / (down + 1e-9)).replace([float('inf')], 0)
+    rsi = (100 - (100 / (1 + rs))).fillna(50).to_numpy()
+    out = np.where((trend_dir > 0) & (rsi >= 55), 1, np.where((trend_dir < 0) & (rsi <= 45), -1, 0)).astype(np.int8)
+    out[~((volp >= 0.01) & (volp <= 0.06))] = 0
+    out[:49] = 0
+    return out
+
+
+def blend(combined):
+    """Blended vote -> (direction, strength, EU) arrays; |combined| <= NEUTRAL_BAND is neutral."""
+    combined = np.asarray(combined, dtype=float)
+    direction = np.where(combined > NEUTRAL_BAND, 1, np.where(combined < -NEUTRAL_BAND, -1, 0))
+    strength = np.minimum(1.0, np.abs(combined))
+    p = strength_to_prob_batch(strength)
+    return direction, strength, p * RR - (1 - p)
+
+
+def pass_filters(df: pd.DataFrame, direction: int) -> bool:
+    return direction != 0 and filter_direction(df) == direction
+
+
+def ensure_atr(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    if df is not None and 'atr14' not in df:
+        try:
+            df['atr14'] = atr_wilder(df, 14)
+        except Exception:
+            df['atr14'] = 0.0
+    return df
+
+
+def _tf_order(tf_weights: Dict[str, float]):
+    # 1h first: it carries the filters and the largest weight
+    return sorted(tf_weights, key=lambda tf: tf != "1h")
+
+
+def _regime_array(symbols, m: SignalMatrix, regime_factors) -> np.ndarray:
+    fac = np.ones((len(symbols),) + m.shape[1:])
+    for i, s in enumerate(symbols):
+        for tf, f in (regime_factors.get(s) or {}).items():
+            t = m.tf_index.get(tf)
+            if t is not None and f is not None:
+                fac[i, t] = f
+    return fac
+
+
+def evaluate_batch(symbols: List[str], data: Dict[str, Dict[str, pd.DataFrame]], experts,
+                   tf_weights: Dict[str, float] = TF_WEIGHTS, expert_weights=None, regime_factors=None,
+                   memo=None, matrix: Optional[SignalMatrix] = None):
+    """
+    Lazy over all symbols: 1h filter gate -> 1h experts -> early neutral exit -> other
+    timeframes, each stage filling a SignalMatrix; the TF blend and EU are then one vectorized
+    reduction. Expert weights (MetaLearner) scale the votes, regime_factors {symbol: {tf:
+    per-expert multipliers}} (RegimeService) tilt them. memo (SignalMemo) serves unchanged frames.
+    Accepts exactly the candidates of the eager blend -> pass_filters -> EU order.
+    -> (candidates, rejects [(symbol, reason)], contribs {symbol: votes} of candidates, matrix)
+    """
+    order = _tf_order(tf_weights)
+    m = matrix if matrix is not None else SignalMatrix(symbols, order, [e.name for e in experts])
+    rows = np.array([m.sym_index[s] for s in symbols], dtype=int)
+    m.reset(rows)
+    n = len(symbols)
+    ew = np.ones(len(experts)) if expert_weights is None else np.asarray(expert_weights, dtype=float)
+    fac = _regime_array(symbols, m, regime_factors or {})
+    reasons = [""] * n
+
+    if memo is None:
+        allowed = np.array([filter_direction(data[s].get("1h")) for s in symbols], dtype=int)
+    else:
+        allowed = np.array([memo.filter_direction(s, "1h", data[s].get("1h"), filter_direction)
+                            for s in symbols], dtype=int)
+    alive = allowed != 0
+    for i in np.flatnonzero(~alive):
+        reasons[i] = REJECT_FILTER_GATE
+
+    # largest |vote| each timeframe could still add (every expert at full strength)
+    w = m.tf_weight_vector(tf_weights)
+    reach = w[None, :] * np.abs(fac * ew).sum(axis=2)
+    for j, tf in enumerate(order):
+        t = m.tf_index[tf]
+        for i in np.flatnonzero(alive):
+            s = symbols[i]
+            df_tf = data[s].get(tf)
+            if df_tf is None:
+                continue
+            bkey = bar_key(df_tf) if memo is not None else None
+            cell = m.data[rows[i], t]
+            for k, e in enumerate(experts):
+                try:
+                    d, st, code = e.signal_code(df_tf) if memo is None else memo.signal(e, s, tf, df_tf, bkey)
+                    cell[k] = (int(d), st, code)
+                except Exception:
+                    pass
+        rest = [m.tf_index[x] for x in order[j + 1:]]
+        if not rest or not alive.any():
+            continue
+        remaining = reach[:, rest].sum(axis=1)
+        partial = m.reduce(tf_weights, fac, rows) @ ew
+        # even full agreement on the remaining timeframes cannot pass the threshold
+        dead = alive & (remaining > 0) & (allowed * partial + remaining <= NEUTRAL_BAND)
+        for i in np.flatnonzero(dead):
+            reasons[i] = REJECT_EARLY_NEUTRAL
+        alive &= ~dead
+
+    contrib = m.reduce(tf_weights, fac, rows)
+    combined = contrib @ ew
+    direction, strength, eu = blend(combined)
+    summ = m.summary
+    summ['allowed'][rows] = allowed
+    summ['combined'][rows] = combined
+    summ['direction'][rows] = direction
+    summ['strength'][rows] = strength
+    summ['eu'][rows] = eu
+    summ['evaluated'][rows] = True
+
+    candidates, rejects, contribs = [], [], {}
+    for i, s in enumerate(symbols):
+        if not reasons[i]:
+            if direction[i] == 0:
+                reasons[i] = REJECT_NEUTRAL
+            elif direction[i] != allowed[i]:
+                reasons[i] = REJECT_FILTERS
+            elif eu[i] <= 0:
+                reasons[i] = f"EU={eu[i]:.2f}"
+        if reasons[i]:
+            rejects.append((s, reasons[i]))
+        else:
+            candidates.append((float(eu[i]), s, int(direction[i]), float(strength[i])))
+            contribs[s] = contrib[i]
+    return candidates, rejects, contribs, m
+
+
+def evaluate_symbol(symbol: str, frames: Dict[str, pd.DataFrame], experts,
+                    tf_weights: Dict[str, float] = TF_WEIGHTS, expert_weights=None, regime_factors=None,
+                    memo=None, matrix: Optional[SignalMatrix] = None):
+    """One symbol through evaluate_batch -> (candidate, "", contrib) or (None, reject reason, contrib)."""
+    cands, rejects, contribs, m = evaluate_batch([symbol], {symbol: frames}, experts, tf_weights, expert_weights,
+                                                 {symbol: regime_factors}, memo, matrix)
+    if cands:
+        return cands[0], "", contribs[symbol]
+    contrib = m.reduce(tf_weights, _regime_array([symbol], m, {symbol: regime_factors}),
+                       [m.sym_index[symbol]])[0]
+    return None, rejects[0][1], contrib
+
+
+def gate_symbols(symbols: List[str], tradables, held, is_cooldown, slots_left: int, stats: Counter) -> List[str]:
+    """Cheap portfolio gates before any signal work; counts what each stage dropped."""
+    stats["universe"] += len(symbols)
+    if slots_left <= 0:
+        stats["capacity"] += len(symbols)
+        return []
+    tradables, held = set(tradables), set(held)
+    out = []
+    for s in symbols:
+        if s not in tradables:
+            stats["not tradable"] += 1
+        elif s in held:
+            stats["held"] += 1
+        elif is_cooldown(s):
+            stats["cooldown"] += 1
+        else:
+            out.append(s)
+    stats["evaluated"] += len(out)
+    return out
+
+
+def evaluate_symbols(symbols: List[str], data: Dict[str, Dict[str, pd.DataFrame]], experts,
+                     tf_weights: Dict[str, float] = TF_WEIGHTS, expert_weights=None, regime_factors=None, memo=None):
+    """In-process evaluation -> (candidates, rejects[(symbol, reason)], contribs{symbol: votes} of candidates)."""
+    return evaluate_batch(symbols, data, experts, tf_weights, expert_weights, regime_factors, memo)[:3]
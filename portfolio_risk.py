@@ -0,0 +1,97 @@
+# portfolio_risk.py - vectorized correlation-aware exposure checks (open book as arrays)
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+class PortfolioRisk:
+    """
+    Open positions as arrays over a fixed symbol universe, next to a cached covariance
+    matrix of bar returns. Sigma @ w is maintained incrementally, so the marginal
+    portfolio variance of a candidate is O(1). Admission stays sequential (each accepted
+    entry changes the book the next candidate is checked against), through
+    RiskGovernor.can_open; symbols outside the universe add no variance.
+    """
+
+    def __init__(self, symbols: Sequence[str], var_z: float = 2.326, window: int = 120):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self.var_z = float(var_z)
+        self.window = int(window)
+        self.notional = np.zeros(n)        # signed USD (direction * |notional|)
+        self.stop_risk = np.zeros(n)       # USD lost if the ATR stop is hit
+        self.cov = np.zeros((n, n))        # per-bar covariance of log returns
+        self._sigma_w = np.zeros(n)        # cov @ notional
+        self.cov_key = None                # e.g. last closed 1h timestamp the cov was built on
+
+    # ---- covariance ----
+    def update_covariance(self, closes: Dict[str, np.ndarray], key=None):
+        """Rebuild the covariance from the last `window` returns of every symbol's closes."""
+        if key is not None and key == self.cov_key:
+            return
+        n = len(self.symbols)
+        lens = [len(closes[s]) for s in self.symbols if closes.get(s) is not None]
+        m = min(min(lens, default=0), self.window + 1)
+        if m < 3:
+            return
+        px = np.full((n, m), np.nan)
+        for s, i in self.index.items():
+            c = closes.get(s)
+            if c is not None and len(c) >= m:
+                px[i] = np.asarray(c, dtype=float)[-m:]
+        r = np.diff(np.log(px), axis=1)
+        r = np.where(np.isfinite(r), r, 0.0)        # missing symbols -> zero variance
+        r -= r.mean(axis=1, keepdims=True)
+        self.cov = (r @ r.T) / max(1, r.shape[1] - 1)
+        self._sigma_w = self.cov @ self.notional
+        self.cov_key = key
+
+    # ---- book ----
+    def open(self, symbol: str, signed_notional: float, stop_risk: float = 0.0):
+        i = self.index.get(symbol)
+        if i is None:
+            return
+        delta = float(signed_notional) - self.notional[i]
+        self.notional[i] = float(signed_notional)
+        self.stop_risk[i] = abs(float(stop_risk))
+        self._sigma_w += self.cov[:, i] * delta
+
+    def close(self, symbol: str):
+        self.open(symbol, 0.0, 0.0)
+
+    def state_dict(self) -> dict:
+        return {"symbols": self.symbols, "notional": self.notional.copy(), "stop_risk": self.stop_risk.copy(),
+                "cov": self.cov.copy(), "cov_key": self.cov_key}
+
+    def load_state(self, d: dict):
+        """Restore by symbol, so a changed universe keeps the overlap."""
+        old = {s: i for i, s in enumerate(d["symbols"])}
+        both = [(i, old[s]) for s, i in self.index.items() if s in old]
+        if not both:
+            return
+        new_i, old_i = map(np.array, zip(*both))
+        self.notional[new_i] = d["notional"][old_i]
+        self.stop_risk[new_i] = d["stop_risk"][old_i]
+        self.cov[np.ix_(new_i, new_i)] = d["cov"][np.ix_(old_i, old_i)]
+        self.cov_key = d["cov_key"] if len(both) == len(self.symbols) == len(old) else None
+        self._sigma_w = self.cov @ self.notional
+
+    # ---- metrics ----
+    def variance(self) -> float:
+        return float(max(0.0, self.notional @ self._sigma_w))
+
+    def var_usd(self) -> float:
+        return self.var_z * self.variance() ** 0.5
+
+    def total_stop_risk(self) -> float:
+        return float(self.stop_risk.sum())
+
+    def marginal(self, symbols: Sequence[str], signed_notionals) -> np.ndarray:
+        """Portfolio VaR (USD) after adding each candidate on its own, vectorized."""
+        idx = np.array([self.index.get(s, -1) for s in symbols], dtype=int)
+        x = np.asarray(signed_notionals, dtype=float)
+        ok = idx >= 0
+        j = np.where(ok, idx, 0)
+        var = self.variance() + np.where(ok, 2.0 * x * self._sigma_w[j] + x * x * self.cov[j, j], 0.0)
+        return self.var_z * np.sqrt(np.maximum(0.0, var))
@@ -1,48 +1,174 @@
-# position_registry.py - simple in-memory position registry with cooldown & TTL
+# position_registry.py - position lifecycle: open records, TTL in candles and cooldowns on min-heaps
+import heapq
+import itertools
 import time
-from collections import defaultdict
+from typing import Dict, List, Optional
+
+from utils import timeframe_to_ms
+
+# fields every position record carries (the runner's former per-symbol state dict)
+FLAT = {"pos": 0.0, "entry": None, "sl": None, "tp1": None, "tp2": None, "risk_usd": 0.0, "contrib": None,
+        "pending": None, "closed_pnl": 0.0}
+
+
+class ExpiryHeap:
+    """
+    key -> deadline with a min-heap of (deadline, seq, key). Setting a key again just pushes a
+    new entry; superseded ones are dropped when they reach the top, so expire(now) costs
+    O(k log n) for the k entries that are due instead of a scan over every key.
+    """
 
-class PositionRegistry:
     def __init__(self):
-        # symbol -> position info dict:
-        # { symbol, entry_time, entry_price, notional, qty, side, tf_origin, ttl_candles, last_update }
-        self._open = {}
-        # symbol -> cooldown_until timestamp
-        self._cooldowns = defaultdict(float)
+        self._heap = []
+        self._due: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    def set(self, key: str, when: float):
+        self._due[key] = float(when)
+        heapq.heappush(self._heap, (float(when), next(self._seq), key))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            # too many superseded entries: rebuild from the live ones
+            self._heap = [(w, next(self._seq), k) for k, w in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def get(self, key: str, default: float = 0.0) -> float:
+        return self._due.get(key, default)
+
+    def discard(self, key: str):
+        self._due.pop(key, None)
+
+    def expire(self, now: float) -> List[str]:
+        """Remove and return the keys whose deadline is <= now."""
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key = heapq.heappop(self._heap)
+            if self._due.get(key) == when:
+                del self._due[key]
+                out.append(key)
+        return out
+
+    def next_deadline(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def items(self) -> Dict[str, float]:
+        return dict(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def __len__(self):
+        return len(self._due)
+
+
+class PositionRegistry:
+    """
+    Open positions by symbol plus two expiry heaps: time-in-trade deadlines (ttl_candles bars
+    of the timeframe the trade originated on) and re-entry cooldowns. tick(now) pops only what
+    is due, so housekeeping cost follows the expiring items, not the universe size.
+    """
+
+    def __init__(self, ttl_candles: Dict[str, int] = None):
+        # symbol -> position record: FLAT fields + side, tf_origin, ttl_candles, entry_time, deadline, last_update
+        self._open: Dict[str, dict] = {}
+        self._cooldowns = ExpiryHeap()
+        self._ttl = ExpiryHeap()
+        self.ttl_candles = dict(ttl_candles or {})
+        self.expired = 0
+
+    # ---- queries ----
+    def get(self, symbol: str) -> Optional[dict]:
+        return self._open.get(symbol)
+
+    def symbols(self) -> List[str]:
+        return list(self._open)
 
     def list_open(self):
         return list(self._open.values())
 
+    def __contains__(self, symbol):
+        return symbol in self._open
+
+    def __len__(self):
+        return len(self._open)
+
     def symbol_exposure(self, symbol: str) -> float:
         p = self._open.get(symbol)
         return float(p.get('notional', 0.0)) if p else 0.0
 
-    def can_open(self, symbol: str) -> bool:
-        now = time.time()
-        if symbol in self._open:
-            return False
-        if now < self._cooldowns.get(symbol, 0.0):
-            return False
-        return True
-
-    def open(self, symbol: str, info: dict):
-        # info must include 'notional'
-        info = dict(info)
-        info['entry_time'] = time.time()
-        info['last_update'] = time.time()
-        self._open[symbol] = info
-
-    def close(self, symbol: str, reason: str = None, cooldown_seconds: int = 0):
-        if symbol in self._open:
-            del self._open[symbol]
+    def in_cooldown(self, symbol: str, now: float = None) -> bool:
+        return (time.time() if now is None else now) < self._cooldowns.get(symbol, 0.0)
+
+    def can_open(self, symbol: str, now: float = None) -> bool:
+        return symbol not in self._open and not self.in_cooldown(symbol, now)
+
+    # ---- lifecycle ----
+    def open(self, symbol: str, info: dict, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        rec = dict(FLAT, symbol=symbol, tf_origin=None, ttl_candles=None)
+        rec.update(info)
+        rec['side'] = 1 if rec['pos'] > 0 else -1
+        rec['entry_time'] = rec['last_update'] = now
+        rec['deadline'] = None
+        self._open[symbol] = rec
+        n = rec['ttl_candles'] if rec['ttl_candles'] is not None else self.ttl_candles.get(rec['tf_origin'])
+        if n and rec['tf_origin']:
+            rec['ttl_candles'] = int(n)
+            rec['deadline'] = now + int(n) * timeframe_to_ms(rec['tf_origin']) / 1000.0
+            self._ttl.set(symbol, rec['deadline'])
+        else:
+            self._ttl.discard(symbol)
+        return rec
+
+    def update(self, symbol: str, **fields) -> dict:
+        rec = self._open[symbol]
+        rec.update(fields)
+        rec['last_update'] = time.time()
+        return rec
+
+    def close(self, symbol: str, reason: str = None, cooldown_seconds: float = 0, now: float = None) -> Optional[dict]:
+        rec = self._open.pop(symbol, None)
+        self._ttl.discard(symbol)
         if cooldown_seconds > 0:
-            self._cooldowns[symbol] = time.time() + float(cooldown_seconds)
+            self.set_cooldown(symbol, cooldown_seconds, now)
+        return rec
+
+    def set_cooldown(self, symbol: str, seconds: float, now: float = None):
+        until = (time.time() if now is None else now) + float(seconds)
+        if until > self._cooldowns.get(symbol, 0.0):
+            self._cooldowns.set(symbol, until)
 
-    def enforce_ttl(self, now_timestamp: float, candle_age_map: dict):
-        # candle_age_map: symbol -> age_in_seconds per TF candle count, optional for TTL enforcement
-        # For simple use we skip detailed TTL enforcement here
-        pass
+    # ---- housekeeping ----
+    def enforce_ttl(self, now_timestamp: float = None) -> List[str]:
+        """Open symbols whose time in trade ran out since the last call (each reported once)."""
+        now = time.time() if now_timestamp is None else now_timestamp
+        out = [s for s in self._ttl.expire(now) if s in self._open]
+        self.expired += len(out)
+        return out
+
+    def tick(self, now: float = None) -> List[str]:
+        """Drop lapsed cooldowns and return the TTL-expired symbols."""
+        now = time.time() if now is None else now
+        self._cooldowns.expire(now)
+        return self.enforce_ttl(now)
 
     def clear_all(self):
         self._open = {}
-        self._cooldowns = defaultdict(float)
+        self._cooldowns = ExpiryHeap()
+        self._ttl = ExpiryHeap()
+
+    # ---- warm restart ----
+    def state_dict(self) -> dict:
+        return {"open": {s: dict(r) for s, r in self._open.items()}, "cooldowns": self._cooldowns.items()}
+
+    def load_state(self, d: dict, symbols=None, now: float = None):
+        now = time.time() if now is None else now
+        for s, rec in d["open"].items():
+            if symbols is None or s in symbols:
+                self._open[s] = dict(rec)
+                if rec.get('deadline'):
+                    self._ttl.set(s, rec['deadline'])
+        for s, until in d["cooldowns"].items():
+            if until > now:
+                self._cooldowns.set(s, until)
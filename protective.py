@@ -0,0 +1,258 @@
+# protective.py - exchange-side stop-loss / take-profit orders for open positions
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from fill_sim import EXIT_NAMES, EXIT_NONE, SLIPPAGE, STOP_FIRST, resolve_triggers
+from order_pipeline import OrderIntent, OrderResult
+
+
+class PaperStopBook:
+    """
+    In-memory stand-in for the exchange's conditional orders (DRY_RUN / offline tests).
+    mark() plays the role of the exchange's price feed: a crossed trigger fills at that price.
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, dict] = {}
+        self._bars: Dict[str, tuple] = {}     # symbol -> (ts, high, low, close) seen at the last mark_bars
+
+    def place_stops(self, specs: List[dict]):
+        out = []
+        for s in {sp["symbol"] for sp in specs}:
+            if not self.open_stop_ids(s):
+                # fresh protection: the first mark_bars after this only sets the range baseline
+                self._bars.pop(s, None)
+        for sp in specs:
+            self.orders[sp["client_id"]] = dict(sp, status="open", filled=0.0, average=None)
+            out.append((sp, self.orders[sp["client_id"]], ""))
+        return out
+
+    def cancel_stops(self, symbol: str, client_ids: List[str]):
+        for cid in client_ids:
+            o = self.orders.get(cid)
+            if o is not None and o["status"] == "open":
+                o["status"] = "canceled"
+        if not self.open_stop_ids(symbol):
+            self._bars.pop(symbol, None)
+
+    def open_stop_ids(self, symbol: str):
+        return {cid for cid, o in self.orders.items() if o["symbol"] == symbol and o["status"] == "open"}
+
+    def fetch_order_by_client_id(self, symbol: str, client_id: str):
+        return self.orders.get(client_id)
+
+    def mark(self, prices: Dict[str, float]):
+        for o in self.orders.values():
+            price = prices.get(o["symbol"])
+            if o["status"] != "open" or price is None:
+                continue
+            # a sell stop sits below a long, a sell take-profit above it (mirrored for shorts)
+            below = (o["kind"] == "sl") == (o["side"] == "sell")
+            if (below and price <= o["trigger"]) or (not below and price >= o["trigger"]):
+                o.update(status="closed", filled=o["amount"], average=float(price))
+
+    def mark_bars(self, bars: Dict[str, tuple], policy: str = STOP_FIRST, slippage: float = SLIPPAGE):
+        """
+        mark() from the forming bar's range instead of the last price. bars: symbol -> (bar ts,
+        high, low, close). Only the part of the range traded since the previous call counts: a
+        high / low that moved since then (or a whole bar that started since then) plus the last
+        and current prices. Stop and target of a position are resolved together by fill_sim,
+        a crossed trigger fills at its level (or the previous price on a gap) less slippage.
+        """
+        by_symbol: Dict[str, dict] = {}
+        for o in self.orders.values():
+            if o["status"] == "open" and o["symbol"] in bars:
+                by_symbol.setdefault(o["symbol"], {})[o["kind"]] = o
+        for s in [s for s in self._bars if s not in by_symbol]:
+            del self._bars[s]      # nothing resting: a later re-entry must not see this holding's range
+        for s, (ts, high, low, close) in bars.items():
+            if s not in by_symbol:
+                continue
+            prev = self._bars.get(s)
+            self._bars[s] = (ts, high, low, close)
+            if prev is None:
+                continue
+            new_bar = ts != prev[0]
+            hi = max(prev[3], close, high if new_bar or high > prev[1] else close)
+            lo = min(prev[3], close, low if new_bar or low < prev[2] else close)
+            legs = by_symbol[s]
+            any_leg = next(iter(legs.values()))
+            side = 1 if any_leg["side"] == "sell" else -1      # the orders close the position: sell -> long
+            sl = legs["sl"]["trigger"] if "sl" in legs else np.nan
+            tp = legs["tp"]["trigger"] if "tp" in legs else np.nan
+            code, level = resolve_triggers(prev[3], hi, lo, sl, tp, side, policy)
+            if code == EXIT_NONE:
+                continue
+            o = legs.get(EXIT_NAMES[code])
+            if o is not None:
+                o.update(status="closed", filled=o["amount"], average=float(level * (1 - side * slippage)))
+
+
+class ProtectionManager:
+    """
+    Keeps one reduce-only STOP_MARKET (sl) and TAKE_PROFIT_MARKET (tp) per open position on
+    the backend (CCXTBroker live, PaperStopBook offline). Stop moves (break-even, trailing)
+    are only recorded by update_stop(); flush() sends the ones that moved at least min_move
+    (fraction of the stop) and whose last amend is min_interval seconds old, all in one batch.
+    poll() turns triggered orders into exit OrderResults for the runner's reconcile.
+    """
+
+    def __init__(self, backend, min_interval: float = 30.0, min_move: float = 0.001, poll_secs: float = 5.0,
+                 logger=None, prefix: str = "ohcp"):
+        self.backend = backend
+        self.min_interval = min_interval
+        self.min_move = min_move
+        self.poll_secs = poll_secs
+        self.logger = logger
+        self.prefix = prefix
+        self.positions: Dict[str, dict] = {}
+        self.amends = 0
+        self.skipped_amends = 0
+        self._seq = itertools.count()
+        self._last_poll = 0.0
+
+    def _log(self, msg: str):
+        if self.logger:
+            self.logger.warning(msg)
+        else:
+            print(msg)
+
+    def _cid(self, kind: str) -> str:
+        return f"{self.prefix}-{kind}-{int(time.time() * 1000):x}-{next(self._seq)}"
+
+    def _spec(self, symbol: str, p: dict, kind: str, trigger: float) -> dict:
+        return {"symbol": symbol, "kind": kind, "side": "sell" if p["side_sign"] > 0 else "buy",
+                "amount": p["amount"], "trigger": float(trigger), "client_id": self._cid(kind)}
+
+    def _send(self, specs: List[dict]) -> Dict[tuple, Optional[str]]:
+        placed = {}
+        if not specs:
+            return placed
+        try:
+            results = self.backend.place_stops(specs)
+        except Exception as e:
+            results = [(sp, None, str(e)) for sp in specs]
+        for sp, order, err in results:
+            if order is None:
+                self._log(f"[Protect] {sp['kind']} {sp['symbol']} @ {sp['trigger']} not placed: {err}")
+            placed[(sp["symbol"], sp["kind"])] = sp["client_id"] if order is not None else None
+        return placed
+
+    def _cancel(self, symbol: str, cids):
+        cids = [c for c in cids if c]
+        if not cids:
+            return
+        try:
+            self.backend.cancel_stops(symbol, cids)
+        except Exception as e:
+            self._log(f"[Protect] cancel {symbol} {cids} failed: {e}")
+
+    # ---- position lifecycle ----
+    def protect(self, symbol: str, side_sign: int, amount: float, sl: Optional[float], tp: Optional[float]):
+        old = self.positions.pop(symbol, None)
+        p = {"side_sign": side_sign, "amount": float(amount), "sl": sl, "tp": tp, "placed_sl": None,
+             "sl_cid": None, "tp_cid": None, "last_amend": time.time()}
+        specs = [self._spec(symbol, p, k, v) for k, v in (("sl", sl), ("tp", tp)) if v]
+        placed = self._send(specs)
+        p["sl_cid"], p["tp_cid"] = placed.get((symbol, "sl")), placed.get((symbol, "tp"))
+        p["placed_sl"] = sl if p["sl_cid"] else None
+        self.positions[symbol] = p
+        if old:
+            self._cancel(symbol, [old["sl_cid"], old["tp_cid"]])
+
+    def resize(self, symbol: str, amount: float):
+        p = self.positions.get(symbol)
+        if p is not None:
+            self.protect(symbol, p["side_sign"], amount, p["sl"], p["tp"])
+
+    def release(self, symbol: str):
+        p = self.positions.pop(symbol, None)
+        if p is not None:
+            self._cancel(symbol, [p["sl_cid"], p["tp_cid"]])
+
+    # ---- warm restart ----
+    def state_dict(self) -> dict:
+        d = {"positions": {s: dict(p) for s, p in self.positions.items()}}
+        if isinstance(self.backend, PaperStopBook):
+            d["paper_orders"] = {cid: dict(o) for cid, o in self.backend.orders.items()}
+        return d
+
+    def load_state(self, d: dict):
+        # the ids still point at the orders resting on the exchange; poll() sorts out any that went away
+        self.positions = {s: dict(p) for s, p in d["positions"].items()}
+        if isinstance(self.backend, PaperStopBook) and "paper_orders" in d:
+            self.backend.orders = {cid: dict(o) for cid, o in d["paper_orders"].items()}
+
+    # ---- stop moves ----
+    def update_stop(self, symbol: str, sl: float):
+        p = self.positions.get(symbol)
+        if p is not None and sl is not None:
+            p["sl"] = float(sl)
+
+    def flush(self, now: float = None) -> int:
+        """Send due stop amendments in one batch (new order first, then cancel the old one)."""
+        now = time.time() if now is None else now
+        specs, old = [], {}
+        for s, p in self.positions.items():
+            if p["sl"] is None or p["sl"] == p["placed_sl"]:
+                continue
+            ref = abs(p["placed_sl"]) if p["placed_sl"] else abs(p["sl"])
+            moved = p["placed_sl"] is None or abs(p["sl"] - p["placed_sl"]) >= self.min_move * ref
+            if not moved or now - p["last_amend"] < self.min_interval:
+                self.skipped_amends += 1
+                continue
+            specs.append(self._spec(s, p, "sl", p["sl"]))
+            old[s] = p["sl_cid"]
+        placed = self._send(specs)
+        for s, cid_old in old.items():
+            cid = placed.get((s, "sl"))
+            p = self.positions[s]
+            p["last_amend"] = now
+            if cid is None:
+                continue            # keep the old stop working
+            p["sl_cid"], p["placed_sl"] = cid, p["sl"]
+            self.amends += 1
+            self._cancel(s, [cid_old])
+        return len(specs)
+
+    # ---- fills ----
+    def poll(self, now: float = None) -> List[OrderResult]:
+        """Triggered protective orders as exit fills; the sibling order is left to release()."""
+        now = time.time() if now is None else now
+        if now - self._last_poll < self.poll_secs:
+            return []
+        self._last_poll = now
+        out = []
+        for s, p in list(self.positions.items()):
+            cids = {k: p[f"{k}_cid"] for k in ("sl", "tp") if p[f"{k}_cid"]}
+            if not cids:
+                continue
+            try:
+                open_ids = self.backend.open_stop_ids(s)
+            except Exception as e:
+                self._log(f"[Protect] poll {s} failed: {e}")
+                continue
+            for kind, cid in cids.items():
+                if cid in open_ids:
+                    continue
+                try:
+                    order = self.backend.fetch_order_by_client_id(s, cid)
+                except Exception as e:
+                    self._log(f"[Protect] lookup {s} {cid} failed: {e}")
+                    continue
+                filled = float((order or {}).get("filled") or 0.0)
+                if filled > 0:
+                    side = "sell" if p["side_sign"] > 0 else "buy"
+                    intent = OrderIntent(cid, s, side, p["amount"], "exit", float(order.get("average") or 0.0), True)
+                    status = "filled" if filled >= p["amount"] * (1 - 1e-9) else "partial"
+                    out.append(OrderResult(intent, status, filled, float(order.get("average") or 0.0), order))
+                    break
+                # canceled / expired outside our control: fall back to the runner's own checks
+                p[f"{kind}_cid"] = None
+                if kind == "sl":
+                    p["placed_sl"] = None
+                self._log(f"[Protect] {kind} {s} {cid} no longer working ({(order or {}).get('status')})")
+        return out
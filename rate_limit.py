@@ -0,0 +1,152 @@
+# rate_limit.py - weighted token-bucket request scheduler with priorities
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Optional
+
+# lower value = served first
+PRIORITY_ORDER = 0      # entries / exits / cancels
+PRIORITY_EXIT = 1       # price checks for open positions
+PRIORITY_DATA = 2       # candle refreshes, housekeeping
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period_secs: float):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(period_secs)   # tokens per second
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def refill(self, now: float, factor: float = 1.0):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate * factor)
+        self.last = now
+
+    def wait_time(self, cost: float, factor: float = 1.0) -> float:
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / max(1e-9, self.rate * factor)
+
+    def sync_used(self, used: float):
+        # exchange reported usage (e.g. X-MBX-USED-WEIGHT-1M) wins over our own estimate
+        self.tokens = min(self.tokens, self.capacity - float(used))
+
+
+def binance_klines_weight(limit: int) -> int:
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+# USD-M futures limits; `safety` keeps headroom for anything we do not account for
+BINANCE_FUTURES_BUCKETS = {
+    "weight": (2400, 60.0),
+    "orders_10s": (300, 10.0),
+    "orders_1m": (1200, 60.0),
+}
+
+# response header -> bucket it reports on
+BINANCE_USAGE_HEADERS = {
+    "x-mbx-used-weight-1m": "weight",
+    "x-mbx-order-count-10s": "orders_10s",
+    "x-mbx-order-count-1m": "orders_1m",
+}
+
+
+class RequestScheduler:
+    """
+    Central gate for exchange calls. Callers wait in priority order until every bucket they
+    draw from has tokens. A 429/418 pauses everyone for the retry-after window and halves
+    the refill rate; the rate recovers gradually while no further throttling happens.
+    """
+
+    def __init__(self, buckets: Dict[str, tuple] = None, safety: float = 0.9,
+                 usage_headers: Dict[str, str] = None, recover_secs: float = 60.0):
+        buckets = buckets or BINANCE_FUTURES_BUCKETS
+        self.buckets = {k: TokenBucket(cap * safety, period) for k, (cap, period) in buckets.items()}
+        self.usage_headers = usage_headers or {}
+        self.recover_secs = recover_secs
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.last_penalty = 0.0
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        # counters for monitoring
+        self.calls = 0
+        self.throttled = 0
+        self.waited_secs = 0.0
+
+    @classmethod
+    def for_exchange(cls, exchange: str) -> "RequestScheduler":
+        if exchange == "binance":
+            return cls(BINANCE_FUTURES_BUCKETS, usage_headers=BINANCE_USAGE_HEADERS)
+        # unknown venue: one conservative generic bucket
+        return cls({"weight": (600, 60.0)})
+
+    def _refill(self, now: float):
+        if self.factor < 1.0 and now - self.last_penalty > self.recover_secs:
+            self.factor = min(1.0, self.factor * 1.25)
+            self.last_penalty = now
+        for b in self.buckets.values():
+            b.refill(now, self.factor)
+
+    def acquire(self, costs: Dict[str, float], priority: int = PRIORITY_DATA):
+        t0 = time.monotonic()
+        with self._cond:
+            me = (priority, next(self._seq))
+            heapq.heappush(self._waiters, me)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = max(0.0, self.paused_until - now)
+                    if self._waiters[0] == me and wait == 0.0:
+                        wait = max((self.buckets[k].wait_time(c, self.factor) for k, c in costs.items()
+                                    if k in self.buckets), default=0.0)
+                        if wait == 0.0:
+                            for k, c in costs.items():
+                                if k in self.buckets:
+                                    self.buckets[k].tokens -= c
+                            break
+                    # woken early whenever the head of the queue changes
+                    self._cond.wait(timeout=wait if wait > 0 else 0.05)
+            finally:
+                self._waiters.remove(me)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+        self.calls += 1
+        self.waited_secs += time.monotonic() - t0
+
+    def penalize(self, retry_after: Optional[float] = None, banned: bool = False):
+        with self._cond:
+            now = time.monotonic()
+            secs = retry_after if retry_after else (120.0 if banned else 10.0)
+            self.paused_until = max(self.paused_until, now + secs)
+            self.factor = max(0.1, self.factor * 0.5)
+            self.last_penalty = now
+            self.throttled += 1
+            for b in self.buckets.values():
+                b.tokens = 0.0
+            self._cond.notify_all()
+
+    def observe_headers(self, headers):
+        if not headers or not self.usage_headers:
+            return
+        with self._cond:
+            for h, v in headers.items():
+                k = self.usage_headers.get(str(h).lower())
+                if k in self.buckets:
+                    try:
+                        self.buckets[k].sync_used(float(v))
+                    except (TypeError, ValueError):
+                        pass
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "throttled": self.throttled, "waited_secs": round(self.waited_secs, 3),
+                "factor": self.factor,
+                "tokens": {k: round(b.tokens, 1) for k, b in self.buckets.items()}}
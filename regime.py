@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from utils import ema, atr_wilder, adx_wilder
+from utils import ema, atr_wilder, adx_wilder, ema_2d, atr_2d, adx_2d
 from config import CFG
 
 class RegimeDetector:
@@ -24,3 +25,144 @@ class RegimeDetector:
         df['w_range'] = (df['is_range'] * ((self.cfg.adx_range_off - df['adx14']).abs() / self.cfg.adx_range_off)).clip(0, 1)
         df['w_breakout'] = (df['is_breakout'] * df['atr_ratio'] / (self.cfg.atr_expansion_ratio + 1e-9)).clip(0, 1)
         return df
+
+
+# expert -> regime weight that scales its vote in the live blend
+EXPERT_REGIME = {
+    "trend": "w_trend",
+    "pullback": "w_trend",
+    "mean_revert": "w_range",
+    "breakout": "w_breakout",
+    "vol_squeeze": "w_breakout",
+}
+
+TREND, RANGE, NEUTRAL = 1, -1, 0
+
+
+def regime_features(high, low, close, cfg=CFG.regime) -> dict:
+    """
+    Last-bar regime features for K stacked series in one pass. Inputs are (K, n) arrays;
+    returns {name: (K,) array}. Same formulas as RegimeDetector.detect.
+    """
+    ema50 = ema_2d(close, 50)[:, -1]
+    ema200 = ema_2d(close, 200)[:, -1]
+    atr20 = atr_2d(high, low, close, 20)
+    atr20_ma = atr20[:, -20:].mean(axis=1)
+    atr_ratio = atr20[:, -1] / atr20_ma
+    adx14 = adx_2d(high, low, close, 14)[:, -1]
+    return {"ema50": ema50, "ema200": ema200, "atr_ratio": atr_ratio, "adx14": adx14}
+
+
+def regime_factor_series(high, low, close, expert_names, cfg=CFG.regime, min_bars: int = 220) -> np.ndarray:
+    """
+    RegimeService.expert_factors after every closed bar of one full series -> (n, experts);
+    bar t sees bars <= t, the ADX hysteresis runs from min_bars on, earlier bars get 1.0.
+    """
+    h, l, c = (np.asarray(x, dtype=float)[None, :] for x in (high, low, close))
+    n = c.shape[1]
+    ema50, ema200 = ema_2d(c, 50)[0], ema_2d(c, 200)[0]
+    atr20 = atr_2d(h, l, c, 20)[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = atr20 / pd.Series(atr20).rolling(20).mean().to_numpy()
+    adx = adx_2d(h, l, c, 14)[0]
+    start = max(0, min_bars - 1)
+    raw = np.where(adx > cfg.adx_trend_on, TREND, np.where(adx < cfg.adx_range_off, RANGE, NEUTRAL))
+    raw[:start] = NEUTRAL
+    # hysteresis: between the thresholds the last trend / range call holds
+    last = np.maximum.accumulate(np.where(raw != NEUTRAL, np.arange(n), -1))
+    st = np.where(last >= 0, raw[np.maximum(last, 0)], NEUTRAL)
+    w = {
+        "w_trend": np.where((st == TREND) & (ema50 > ema200), np.clip(adx / (cfg.adx_trend_on + 1e-9), 0.0, 1.0), 0.0),
+        "w_range": np.where(st == RANGE, np.clip(np.abs(cfg.adx_range_off - adx) / cfg.adx_range_off, 0.0, 1.0), 0.0),
+        "w_breakout": np.where(ratio > cfg.atr_expansion_ratio,
+                               np.clip(ratio / (cfg.atr_expansion_ratio + 1e-9), 0.0, 1.0), 0.0),
+    }
+    fac = np.column_stack([0.5 + w[EXPERT_REGIME[e]] if e in EXPERT_REGIME else np.ones(n) for e in expert_names]) \
+        if len(expert_names) else np.ones((n, 0))
+    if fac.shape[1]:
+        fac = fac / fac.mean(axis=1, keepdims=True)
+    fac[:start] = 1.0
+    return fac
+
+
+class RegimeService:
+    """
+    Regime state for every (symbol, timeframe), computed in one batched pass over stacked
+    arrays of closed bars and cached until the next bar closes. Between adx_range_off and
+    adx_trend_on the previous trend/range state is kept (hysteresis).
+    """
+
+    def __init__(self, cfg=CFG.regime, expert_names=None, min_bars: int = 220):
+        self.cfg = cfg
+        self.expert_names = list(expert_names or [])
+        self.min_bars = min_bars
+        self._bar = {}        # key -> last closed bar timestamp used
+        self._adx_state = {}  # key -> TREND / RANGE / NEUTRAL
+        self._state = {}      # key -> {"w_trend", "w_range", "w_breakout", "adx14", ...}
+        self._factors = {}    # key -> per-expert vote multipliers
+        self.batches = 0
+        self.recomputed = 0
+
+    def update(self, frames: dict):
+        """frames: {(symbol, timeframe): DataFrame incl. the forming bar}. Only keys with a new closed bar are computed."""
+        stale = []
+        for key, df in frames.items():
+            if df is None or len(df) < self.min_bars + 1:
+                continue
+            closed_ts = df['timestamp'].iloc[-2]
+            if self._bar.get(key) != closed_ts:
+                stale.append((key, df, closed_ts))
+        if not stale:
+            return
+        # one rectangular batch per history length, so every key keeps its full history of closed bars
+        groups = {}
+        for item in stale:
+            groups.setdefault(len(item[1]) - 1, []).append(item)
+        for n, group in groups.items():
+            def stack(col):
+                return np.vstack([df[col].to_numpy(dtype=float)[-n - 1:-1] for _, df, _ in group])
+            self._apply(group, regime_features(stack('high'), stack('low'), stack('close'), self.cfg))
+        self.batches += len(groups)
+        self.recomputed += len(stale)
+
+    def _apply(self, group, f):
+        c = self.cfg
+        for j, (key, _, closed_ts) in enumerate(group):
+            adx, ratio = float(f['adx14'][j]), float(f['atr_ratio'][j])
+            prev = self._adx_state.get(key, NEUTRAL)
+            st = TREND if adx > c.adx_trend_on else (RANGE if adx < c.adx_range_off else prev)
+            self._adx_state[key] = st
+            is_trend = st == TREND and f['ema50'][j] > f['ema200'][j]
+            is_range = st == RANGE
+            is_breakout = ratio > c.atr_expansion_ratio
+            w = {
+                "w_trend": min(1.0, max(0.0, adx / (c.adx_trend_on + 1e-9))) if is_trend else 0.0,
+                "w_range": min(1.0, max(0.0, abs(c.adx_range_off - adx) / c.adx_range_off)) if is_range else 0.0,
+                "w_breakout": min(1.0, max(0.0, ratio / (c.atr_expansion_ratio + 1e-9))) if is_breakout else 0.0,
+            }
+            self._state[key] = dict(w, adx14=adx, atr_ratio=ratio, state=st, bar=closed_ts)
+            # vote multiplier 0.5 + w, rescaled to mean 1: the regime tilts the blend between
+            # experts without changing its overall scale or silencing anyone
+            fac = np.array([0.5 + w[EXPERT_REGIME[e]] if e in EXPERT_REGIME else 1.0 for e in self.expert_names])
+            self._factors[key] = fac / fac.mean() if len(fac) else fac
+            self._bar[key] = closed_ts
+
+    def state_dict(self) -> dict:
+        return {"expert_names": list(self.expert_names), "bar": dict(self._bar), "adx_state": dict(self._adx_state),
+                "state": {k: dict(v) for k, v in self._state.items()},
+                "factors": {k: v.copy() for k, v in self._factors.items()}}
+
+    def load_state(self, d: dict):
+        # hysteresis state carries over; factors only when they line up with our experts
+        self._adx_state.update(d["adx_state"])
+        if d["expert_names"] == self.expert_names:
+            self._bar.update(d["bar"])
+            self._state.update(d["state"])
+            self._factors.update(d["factors"])
+
+    def state(self, symbol: str, timeframe: str):
+        return self._state.get((symbol, timeframe))
+
+    def expert_factors(self, symbol: str, timeframes) -> dict:
+        """{timeframe: (n_experts,) multipliers} for the timeframes with a known regime."""
+        return {tf: self._factors[(symbol, tf)] for tf in timeframes if (symbol, tf) in self._factors}
@@ -0,0 +1,167 @@
+# result_cache.py - content-addressed on-disk cache of backtest features and results
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join('data', 'backtest_cache')
+
+# source files whose code decides what build_features / run_backtest produce
+FEATURE_MODULES = ('experts/*.py', 'pipeline.py', 'regime.py', 'utils.py', 'backtest_engine.py')
+RESULT_MODULES = FEATURE_MODULES + ('risk.py', 'risk_metrics.py', 'portfolio_risk.py', 'trade_selectors.py',
+                                    'buckets.py', 'meta.py', 'autoscaler.py', 'position_registry.py',
+                                    'utils_sizing.py', 'fill_sim.py')
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _blake(*parts) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else str(p).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def code_version(patterns: Sequence[str] = RESULT_MODULES) -> str:
+    """Hash of the named source files' contents (not mtimes: a checkout / touch does not invalidate)."""
+    import glob
+    files = sorted({f for p in patterns for f in glob.glob(os.path.join(_ROOT, p))})
+    h = hashlib.blake2b(digest_size=20)
+    for f in files:
+        h.update(os.path.relpath(f, _ROOT).encode())
+        with open(f, 'rb') as fh:
+            h.update(fh.read())
+    return h.hexdigest()
+
+
+def config_digest(cfg) -> str:
+    """CommanderConfig (or any dataclass / plain object) -> stable hash of its field values."""
+    d = dataclasses.asdict(cfg) if dataclasses.is_dataclass(cfg) else cfg
+    return _blake(json.dumps(d, sort_keys=True, default=str))
+
+
+def data_digest(data: Dict[str, Dict[str, pd.DataFrame]], symbols: Sequence[str], timeframes: Sequence[str]) -> str:
+    """Hash of the exact bars fed to the backtest: timestamps and OHLCV of every (symbol, timeframe)."""
+    h = hashlib.blake2b(digest_size=20)
+    for s in symbols:
+        for tf in timeframes:
+            df = data.get(s, {}).get(tf)
+            h.update(f"{s}|{tf}|".encode())
+            if df is None:
+                continue
+            ts = df['timestamp']
+            ts = ts.astype('int64') if pd.api.types.is_datetime64_any_dtype(ts) else ts
+            h.update(np.ascontiguousarray(ts.to_numpy(dtype=np.int64)).tobytes())
+            for c in ('open', 'high', 'low', 'close', 'volume'):
+                h.update(np.ascontiguousarray(df[c].to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Two content-addressed stores under root: features/ (build_features output, keyed by data +
+    regime config + timeframe weights + feature code) and results/ (equity, trades, metrics,
+    keyed by the feature key + full config + run parameters + engine / risk / selector code).
+    Equal inputs give equal keys, so there is nothing to invalidate: a change anywhere makes a
+    new key and the stale entry ages out. Entries are pickles written via temp file + rename;
+    a hit touches the file, and a put evicts least recently used entries (by mtime) once the
+    total passes max_bytes.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = 2 << 30):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._code = {}
+
+    def _version(self, patterns) -> str:
+        # once per process: code does not change under a running sweep
+        if patterns not in self._code:
+            self._code[patterns] = code_version(patterns)
+        return self._code[patterns]
+
+    # ---- keys ----
+    def feature_key(self, data_key: str, timeframes, tf_weights, regime_cfg) -> str:
+        return _blake("features", data_key, list(timeframes), json.dumps(tf_weights, sort_keys=True),
+                      config_digest(regime_cfg), self._version(FEATURE_MODULES))
+
+    def result_key(self, feature_key: str, cfg, params: dict) -> str:
+        return _blake("result", feature_key, config_digest(cfg), json.dumps(params, sort_keys=True, default=str),
+                      self._version(RESULT_MODULES))
+
+    # ---- storage ----
+    def path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], key + '.pkl')
+
+    def get(self, kind: str, key: str):
+        p = self.path(kind, key)
+        try:
+            with open(p, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"[Cache] unreadable {p}, dropped: {e}")
+            self._remove(p)
+            self.misses += 1
+            return None
+        os.utime(p)
+        self.hits += 1
+        return value
+
+    def put(self, kind: str, key: str, value) -> int:
+        p = self.path(kind, key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.tmp{os.getpid()}"
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+        self.evict()
+        return os.path.getsize(p) if os.path.exists(p) else 0
+
+    def entries(self):
+        """[(mtime, bytes, path)] of every cached entry, oldest use first."""
+        out = []
+        for dirpath, _, files in os.walk(self.root):
+            for fn in files:
+                if fn.endswith('.pkl'):
+                    p = os.path.join(dirpath, fn)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:
+                        continue
+                    out.append((st.st_mtime, st.st_size, p))
+        return sorted(out)
+
+    def size(self) -> int:
+        return sum(b for _, b, _ in self.entries())
+
+    def evict(self) -> int:
+        entries = self.entries()
+        total = sum(b for _, b, _ in entries)
+        removed = 0
+        for _, b, p in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(p)
+            total -= b
+            removed += 1
+        return removed
+
+    def _remove(self, p: str):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {"entries": len(entries), "bytes": sum(b for _, b, _ in entries), "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
@@ -1,10 +1,10 @@
 # risk.py
-import time
-from collections import defaultdict
 from dataclasses import dataclass
 from typing import Dict
 import math
 
+from risk_metrics import StreamingRiskMetrics
+
 @dataclass
 class OrderDecision:
     side: str
@@ -19,10 +19,14 @@ class RiskGovernor:
         self.cfg = cfg
         self.daily_pnl = 0.0          # USD
         self.current_day = None
-        self.cooldown_until = defaultdict(float)
         self.positions: Dict[str, dict] = {}  # symbol -> {size, entry, sl, tp}
         self.gross_exposure = 0.0     # notional USD
-        self.equity_history = []
+        # equity returns on a fixed grid of risk_sample_secs (not per loop), over their own window
+        self.metrics = StreamingRiskMetrics(int(getattr(cfg, 'risk_metrics_window', 168)),
+                                            float(getattr(cfg, 'var_z', 2.326)),
+                                            float(getattr(cfg, 'risk_sample_secs', 3600.0)))
+        # optional PortfolioRisk (arrays + covariance) for correlation-aware admission
+        self.portfolio = None
 
     # ---- day lifecycle ----
     def reset_day(self, day_key):
@@ -38,19 +42,30 @@ class RiskGovernor:
             print("[Risk] Daily loss limit hit. Disabling trading for today.")
             return
 
-    def on_equity(self, equity: float):
-        # call periodically to feed equity values (mark-to-market)
-        self.equity_history.append(float(equity))
-        if len(self.equity_history) > 1000:
-            self.equity_history.pop(0)
+    def on_equity(self, equity: float, day_key=None, now: float = None):
+        # call periodically to feed equity values (mark-to-market), O(1); returns are sampled per risk_sample_secs
+        self.metrics.update(equity, day_key, now)
 
-    # ---- internal helpers ----
-    def set_cooldown(self, symbol: str, secs: int):
-        self.cooldown_until[symbol] = max(self.cooldown_until[symbol], time.time() + secs)
+    # ---- warm restart ----
+    def state_dict(self) -> dict:
+        return {"daily_pnl": self.daily_pnl, "current_day": self.current_day,
+                "last_day": getattr(self, '_last_day', None),
+                "positions": {k: dict(v) for k, v in self.positions.items()},
+                "gross_exposure": self.gross_exposure, "metrics": self.metrics.state_dict(),
+                "portfolio": self.portfolio.state_dict() if self.portfolio is not None else None}
 
-    def is_cooldown(self, symbol: str) -> bool:
-        return time.time() < self.cooldown_until.get(symbol, 0)
+    def load_state(self, d: dict):
+        self.daily_pnl = float(d["daily_pnl"])
+        self.current_day = d["current_day"]
+        if d.get("last_day") is not None:
+            self._last_day = d["last_day"]
+        self.positions = {k: dict(v) for k, v in d["positions"].items()}
+        self.gross_exposure = float(d["gross_exposure"])
+        self.metrics.load_state(d["metrics"])
+        if self.portfolio is not None and d.get("portfolio") is not None:
+            self.portfolio.load_state(d["portfolio"])
 
+    # ---- internal helpers ----
     def current_open_count(self) -> int:
         return sum(1 for v in self.positions.values() if abs(v.get("size", 0)) > 0)
 
@@ -62,44 +77,59 @@ class RiskGovernor:
         # check daily drawdown limit (frac)
         if not hasattr(self.cfg, 'max_risk_per_day'):
             return True
-        dd_frac = (-self.daily_pnl / max(1.0, equity)) if self.daily_pnl < 0 else 0.0
+        # open losses count too: use the worse of realized and mark-to-market daily pnl
+        day_pnl = min(self.daily_pnl, self.metrics.daily_pnl) if len(self.metrics) else self.daily_pnl
+        dd_frac = (-day_pnl / max(1.0, equity)) if day_pnl < 0 else 0.0
         return dd_frac < float(self.cfg.max_risk_per_day)
 
-    def can_open(self, equity: float, symbol: str, symbol_notional: float, corr_bucket_count: dict, open_positions_count: int):
+    def can_open(self, equity: float, symbol: str, symbol_notional: float, corr_bucket_count: dict, open_positions_count: int,
+                 direction: int = 0, stop_risk: float = 0.0):
         if not self.can_trade_today(equity):
             return False, "day-paused"
         if open_positions_count >= int(self.cfg.max_positions):
             return False, "too-many-positions"
         if (self.gross_exposure + abs(symbol_notional)) / max(1.0, equity) > float(self.cfg.max_gross_exposure):
             return False, "gross-exposure"
+        if self.portfolio is not None and direction:
+            max_pvar = getattr(self.cfg, 'max_portfolio_var_frac', None)
+            if max_pvar and self.portfolio.marginal([symbol], [direction * abs(symbol_notional)])[0] > float(max_pvar) * max(1.0, equity):
+                return False, "portfolio-var"
+            max_open_risk = getattr(self.cfg, 'max_open_risk_frac', None)
+            if max_open_risk and self.portfolio.total_stop_risk() + abs(stop_risk) > float(max_open_risk) * max(1.0, equity):
+                return False, "open-risk"
+        max_var = getattr(self.cfg, 'max_var_frac', None)
+        if max_var and self.metrics.var(equity) / max(1.0, equity) > float(max_var):
+            return False, "var-limit"
         # correlation bucket check
         bucket = getattr(self.cfg, 'buckets_map', {}).get(symbol, None)
         if bucket:
             if corr_bucket_count.get(bucket, 0) >= int(self.cfg.max_per_bucket):
                 return False, "corr-bucket"
-        if self.is_cooldown(symbol):
-            return False, "cooldown"
         return True, ""
 
-    def on_open(self, symbol: str, notional: float, size: float, entry: float, sl: float, tp: float | None = None):
+    def on_open(self, symbol: str, notional: float, size: float, entry: float, sl: float, tp: float | None = None,
+                direction: int = 1):
         self.gross_exposure += abs(notional)
         self.positions[symbol] = {"size": size, "entry": entry, "sl": sl, "tp": tp, "notional": notional}
+        if self.portfolio is not None:
+            self.portfolio.open(symbol, direction * abs(notional), abs(entry - sl) * abs(size) if sl else 0.0)
 
     def on_close(self, symbol: str):
         if symbol in self.positions:
             notional = self.positions[symbol].get("notional", 0.0)
             self.gross_exposure = max(0.0, self.gross_exposure - abs(notional))
             del self.positions[symbol]
+        if self.portfolio is not None:
+            self.portfolio.close(symbol)
 
     # dynamic budget (simple volatility scaling)
     def dynamic_budget(self) -> float:
-        # returns USD per-slot budget (approx)
+        # USD risk budget per position: portfolio_risk_unit scaled to 2% equity vol over dyn_budget_lookback samples
         base_unit = float(getattr(self.cfg, 'portfolio_risk_unit', 100.0))
         lookback = int(getattr(self.cfg, 'dyn_budget_lookback', 20))
-        if len(self.equity_history) < lookback:
+        if len(self.metrics) < min(lookback, self.metrics.window):
             return base_unit
-        import numpy as np
-        r = np.diff(np.log(self.equity_history[-lookback:]))
-        rv = float(np.std(r)) * (len(r) ** 0.5) if len(r) > 1 else 0.0
+        # equity vol over dyn_budget_lookback sample steps
+        rv = self.metrics.realized_vol(lookback)
         adj = base_unit * (0.02 / max(0.005, rv))
         return max(float(getattr(self.cfg, 'dyn_budget_min', base_unit*0.5)), min(float(getattr(self.cfg, 'dyn_budget_max', base_unit*5)), adj))
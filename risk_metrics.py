@@ -0,0 +1,113 @@
+# risk_metrics.py - O(1) streaming portfolio risk metrics on a ring buffer of equity returns
+import math
+import time
+
+import numpy as np
+
+
+class StreamingRiskMetrics:
+    """
+    Feed mark-to-market equity every loop. Peak / drawdown and daily PnL follow every update;
+    returns are sampled on a fixed time grid of sample_secs (the equity at the first update in
+    each new grid slot vs the last sample), so volatility and VaR describe one sample_secs step
+    however fast the loop runs (sample_secs=0: every update is a step). Keeps rolling realized
+    volatility of log returns (running sums over a fixed window) and a one-step parametric VaR.
+    Every update is O(1); sums are re-based once per window against drift.
+    """
+
+    def __init__(self, window: int = 200, var_z: float = 2.326, sample_secs: float = 0.0):
+        self.window = max(2, int(window))
+        self.var_z = float(var_z)            # 2.326 -> 99% one-sided
+        self.sample_secs = float(sample_secs)
+        self._slot = None                    # grid slot of the last sampled equity
+        self._sampled = None                 # equity at the last sample
+        self._r = np.zeros(self.window)
+        self._i = 0
+        self._n = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._since_rebase = 0
+        self.equity = None
+        self.peak = 0.0
+        self.drawdown = 0.0                  # fraction below peak
+        self.max_drawdown = 0.0
+        self.day_key = None
+        self.day_start_equity = None
+        self.daily_pnl = 0.0                 # mark-to-market, USD
+
+    def __len__(self):
+        return self._n
+
+    def update(self, equity: float, day_key=None, now: float = None):
+        equity = float(equity)
+        slot = None
+        if self.sample_secs > 0:
+            slot = int((time.time() if now is None else now) // self.sample_secs)
+        if slot is None or slot != self._slot:
+            self._sample(equity)
+            self._slot = slot
+        self.equity = equity
+
+        self.peak = max(self.peak, equity)
+        self.drawdown = 1.0 - equity / self.peak if self.peak > 0 else 0.0
+        self.max_drawdown = max(self.max_drawdown, self.drawdown)
+
+        if day_key is not None and day_key != self.day_key:
+            self.day_key = day_key
+            self.day_start_equity = equity
+        if self.day_start_equity is None:
+            self.day_start_equity = equity
+        self.daily_pnl = equity - self.day_start_equity
+
+    def _sample(self, equity: float):
+        if self._sampled is not None and self._sampled > 0 and equity > 0:
+            r = math.log(equity / self._sampled)
+            old = self._r[self._i] if self._n == self.window else 0.0
+            self._r[self._i] = r
+            self._i = (self._i + 1) % self.window
+            self._n = min(self._n + 1, self.window)
+            self._sum += r - old
+            self._sumsq += r * r - old * old
+            self._since_rebase += 1
+            if self._since_rebase >= self.window:
+                self._rebase()
+        self._sampled = equity
+
+    def _rebase(self):
+        r = self._r if self._n == self.window else self._r[:self._n]
+        self._sum = float(r.sum())
+        self._sumsq = float(np.dot(r, r))
+        self._since_rebase = 0
+
+    def std(self) -> float:
+        """Population stdev of the windowed log returns (same as np.std)."""
+        if self._n < 2:
+            return 0.0
+        mean = self._sum / self._n
+        return math.sqrt(max(0.0, self._sumsq / self._n - mean * mean))
+
+    def realized_vol(self, steps: int = None) -> float:
+        """Volatility over `steps` sample steps (default: the whole window): std * sqrt(steps)."""
+        if self._n < 2:
+            return 0.0
+        return self.std() * math.sqrt(self._n if steps is None else steps)
+
+    def var(self, equity: float = None, steps: int = 1) -> float:
+        """Parametric VaR in USD at var_z over `steps` sample steps (sample_secs each)."""
+        eq = self.equity if equity is None else equity
+        return self.var_z * self.std() * math.sqrt(steps) * float(eq or 0.0)
+
+    def state_dict(self) -> dict:
+        """Everything needed to resume the stream after a restart."""
+        return {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in vars(self).items()}
+
+    def load_state(self, d: dict):
+        if int(d.get("window", -1)) != self.window or float(d.get("sample_secs", 0.0)) != self.sample_secs:
+            return
+        for k, v in d.items():
+            setattr(self, k, v.copy() if isinstance(v, np.ndarray) else v)
+
+    def snapshot(self) -> dict:
+        return {"equity": self.equity, "vol": self.std(), "realized_vol": self.realized_vol(),
+                "drawdown": self.drawdown, "max_drawdown": self.max_drawdown,
+                "daily_pnl": self.daily_pnl, "var": self.var()}
@@ -0,0 +1,189 @@
+# risk_of_ruin.py - Monte Carlo / block-bootstrap drawdown and risk-of-ruin analysis of trade results
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+BANGKOK_OFFSET = pd.Timedelta(hours=7)     # the runner's trading day
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+# ---- inputs ----
+def trades_from_fills(fills: pd.DataFrame) -> pd.DataFrame:
+    """
+    Round trips from a fill log (broker paper log: timestamp, symbol, side, size, price).
+    Per symbol a running signed position with average entry; every fill that reduces it
+    realizes (price - avg entry) * closed size. -> DataFrame[exit_time, symbol, pnl]
+    """
+    out = []
+    book: Dict[str, list] = {}     # symbol -> [signed qty, avg entry]
+    for ts, sym, side, size, price in fills[['timestamp', 'symbol', 'side', 'size', 'price']].itertuples(index=False):
+        q = float(size) * (1 if str(side).lower() == 'buy' else -1)
+        pos, avg = book.get(sym, [0.0, 0.0])
+        if pos == 0 or np.sign(q) == np.sign(pos):
+            avg = (avg * abs(pos) + float(price) * abs(q)) / (abs(pos) + abs(q))
+            book[sym] = [pos + q, avg]
+            continue
+        closed = min(abs(q), abs(pos))
+        out.append((ts, sym, (float(price) - avg) * closed * np.sign(pos)))
+        rest = pos + q
+        # a fill larger than the position flips it at this price
+        book[sym] = [rest, avg if np.sign(rest) == np.sign(pos) else float(price)]
+    return pd.DataFrame(out, columns=['exit_time', 'symbol', 'pnl'])
+
+
+def load_trades(path: str) -> pd.DataFrame:
+    """Backtest trade list (trades_portfolio.csv: pnl, exit_time in epoch secs) or the paper fill log."""
+    df = pd.read_csv(path)
+    if 'pnl' in df:
+        t = df['exit_time']
+        t = pd.to_datetime(t, unit='s') if pd.api.types.is_numeric_dtype(t) else pd.to_datetime(t)
+        return pd.DataFrame({'exit_time': t, 'pnl': df['pnl'].astype(float)})
+    trades = trades_from_fills(df)
+    trades['exit_time'] = pd.to_datetime(trades['exit_time'])
+    return trades
+
+
+def trades_per_day(exit_times: pd.Series) -> float:
+    days = (pd.to_datetime(exit_times) + BANGKOK_OFFSET).dt.floor('D')
+    span = max(1, (days.max() - days.min()).days + 1) if len(days) else 1
+    return len(days) / span
+
+
+# ---- simulation ----
+def resample(pnl: np.ndarray, n_paths: int, horizon: int, block: int, rng: np.random.Generator) -> np.ndarray:
+    """(n_paths, horizon) trade sequences: iid bootstrap (block=1) or circular moving blocks of `block` trades."""
+    n = len(pnl)
+    if block <= 1:
+        return pnl[rng.integers(0, n, size=(n_paths, horizon))]
+    n_blocks = -(-horizon // block)
+    starts = rng.integers(0, n, size=(n_paths, n_blocks, 1))
+    idx = (starts + np.arange(block)) % n
+    return pnl[idx.reshape(n_paths, -1)[:, :horizon]]
+
+
+def path_stats(paths: np.ndarray, capital: float, per_day: int, daily_loss_limit: float, max_risk_per_day: float,
+               ruin_frac: float) -> Dict[str, np.ndarray]:
+    """Per-path drawdown, recovery, daily-limit and ruin statistics of (paths, horizon) trade PnLs."""
+    m, h = paths.shape
+    equity = capital + np.cumsum(paths, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), capital)
+    dd = peak - equity
+    dd_frac = dd / peak
+    # underwater stretches: trades since the last equity high
+    steps = np.arange(1, h + 1)
+    at_high = np.where(dd <= 0, steps, 0)
+    since_high = steps - np.maximum.accumulate(at_high, axis=1)
+    trough = dd.argmax(axis=1)
+    after = (steps[None, :] > trough[:, None] + 1) & (dd <= 0)
+    recovered = after.any(axis=1) | (dd.max(axis=1) <= 0)
+    recovery = np.where(recovered, np.where(after.any(axis=1), after.argmax(axis=1) - trough, 0), np.nan)
+    # trading days of per_day trades each; intraday running pnl against the limits
+    d = h // per_day
+    day = paths[:, :d * per_day].reshape(m, d, per_day).cumsum(axis=2)
+    day_low = day.min(axis=2)
+    day_start = np.concatenate([np.full((m, 1), capital), equity[:, per_day - 1:d * per_day - 1:per_day]], axis=1)
+    return {"max_dd": dd.max(axis=1), "max_dd_frac": dd_frac.max(axis=1), "final_pnl": equity[:, -1] - capital,
+            "underwater": since_high.max(axis=1).astype(float), "recovery": recovery,
+            "limit_days": (day_low <= -abs(daily_loss_limit)).sum(axis=1),
+            "paused_days": (-day_low >= max_risk_per_day * np.maximum(1.0, day_start[:, :d])).sum(axis=1),
+            "days": np.full(m, d), "ruined": (equity <= capital * (1 - ruin_frac)).any(axis=1)}
+
+
+def _simulate_chunk(args) -> Dict[str, np.ndarray]:
+    pnl, n_paths, horizon, block, seed, kw, batch = args
+    rng = np.random.default_rng(seed)
+    parts = []
+    for lo in range(0, n_paths, batch):
+        parts.append(path_stats(resample(pnl, min(batch, n_paths - lo), horizon, block, rng), **kw))
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def simulate(pnl: Sequence[float], n_paths: int = 100_000, horizon: int = None, block: int = 1,
+             per_day: int = 1, capital: float = 10000.0, daily_loss_limit: float = 500.0,
+             max_risk_per_day: float = 0.02, ruin_frac: float = 0.5, workers: int = None, seed: int = 0,
+             batch: int = 2000) -> Dict[str, np.ndarray]:
+    """
+    n_paths resampled trade sequences of `horizon` trades (default: as many as observed), split
+    over a process pool with independent seeds. Each worker draws and scores `batch` paths at a
+    time as one array, so memory stays at batch x horizon per worker. -> per-path statistics
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    pnl = pnl[np.isfinite(pnl)]
+    if len(pnl) == 0:
+        raise ValueError("no trade results to resample")
+    horizon = int(horizon or len(pnl))
+    per_day = max(1, min(int(per_day), horizon))
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    kw = {"capital": capital, "per_day": per_day, "daily_loss_limit": daily_loss_limit,
+          "max_risk_per_day": max_risk_per_day, "ruin_frac": ruin_frac}
+    sizes = [len(c) for c in np.array_split(np.arange(n_paths), workers) if len(c)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(pnl, n, horizon, block, sd, kw, batch) for n, sd in zip(sizes, seeds)]
+    if len(jobs) == 1:
+        parts = [_simulate_chunk(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            parts = list(pool.map(_simulate_chunk, jobs))
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def report(stats: Dict[str, np.ndarray], per_day: int, quantiles=QUANTILES) -> dict:
+    q = lambda x: {f"p{int(p * 100)}": float(np.nanquantile(x, p)) if np.isfinite(x).any() else None for p in quantiles}
+    rec = stats["recovery"]
+    days = np.maximum(stats["days"], 1)
+    return {"paths": int(len(rec)), "max_dd_usd": q(stats["max_dd"]), "max_dd_frac": q(stats["max_dd_frac"]),
+            "final_pnl": q(stats["final_pnl"]), "p_loss": float((stats["final_pnl"] < 0).mean()),
+            "p_daily_loss_limit": float((stats["limit_days"] > 0).mean()),
+            "daily_loss_limit_day_rate": float((stats["limit_days"] / days).mean()),
+            "p_day_paused": float((stats["paused_days"] > 0).mean()),
+            "day_paused_rate": float((stats["paused_days"] / days).mean()),
+            "p_ruin": float(stats["ruined"].mean()),
+            "recovery_days": q(rec / per_day), "p_not_recovered": float(np.isnan(rec).mean()),
+            "longest_underwater_days": q(stats["underwater"] / per_day)}
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="bootstrap drawdown / risk-of-ruin from trade results")
+    parser.add_argument('trades', nargs='?', default='trades_portfolio.csv',
+                        help="backtest trades CSV (pnl column) or the paper fill log (data/paper_trades.csv)")
+    parser.add_argument('--sims', type=int, default=100_000)
+    parser.add_argument('--horizon', type=int, default=0, help="trades per path (0 = as many as observed)")
+    parser.add_argument('--block', type=int, default=1, help="block length in trades (1 = iid bootstrap)")
+    parser.add_argument('--capital', type=float, default=float(os.getenv('CAPITAL_TOTAL', '10000')))
+    parser.add_argument('--daily-loss-limit', type=float, default=float(os.getenv('DAILY_LOSS_LIMIT', '0.05')),
+                        help="fraction of capital, like the runner's DAILY_LOSS_LIMIT")
+    parser.add_argument('--max-risk-per-day', type=float, default=float(os.getenv('MAX_RISK_PER_DAY', '0.02')))
+    parser.add_argument('--ruin', type=float, default=0.5, help="ruin = equity down this fraction of capital")
+    parser.add_argument('--scales', default="1", help="comma list of PnL multipliers (risk per trade vs. the input)")
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the report here")
+    args = parser.parse_args()
+
+    trades = load_trades(args.trades).sort_values('exit_time')
+    per_day = max(1, int(round(trades_per_day(trades['exit_time']))))
+    print(f"[MonteCarlo] {len(trades)} trades, ~{per_day}/day, {args.sims} paths, block={args.block}")
+    out = {}
+    for k in [float(x) for x in args.scales.split(',') if x.strip()]:
+        stats = simulate(trades['pnl'].to_numpy() * k, args.sims, args.horizon or None, args.block, per_day,
+                         args.capital, args.daily_loss_limit * args.capital, args.max_risk_per_day, args.ruin,
+                         args.workers or None, args.seed)
+        r = out[f"x{k:g}"] = report(stats, per_day)
+        print(f"x{k:g}: maxDD p50 {r['max_dd_frac']['p50']*100:.1f}% p95 {r['max_dd_frac']['p95']*100:.1f}% "
+              f"p99 {r['max_dd_frac']['p99']*100:.1f}% | P(daily limit) {r['p_daily_loss_limit']*100:.1f}% "
+              f"P(day paused) {r['p_day_paused']*100:.1f}% | P(ruin) {r['p_ruin']*100:.2f}% | "
+              f"recovery p50 {r['recovery_days']['p50'] or 0:.1f}d p95 {r['recovery_days']['p95'] or 0:.1f}d "
+              f"(not recovered {r['p_not_recovered']*100:.1f}%)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(out, f, indent=2)
+        print(f"Saved: {args.json}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,6 +1,9 @@
 import sys
 import os
+import atexit
 import time
+from collections import Counter
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from math import floor
@@ -15,19 +18,27 @@ if project_path not in sys.path:
 # --- imports ---
 from config import CFG
 from broker import CCXTBroker
-from regime import RegimeDetector
-from experts.trend import TrendFollower
-from experts.mean_revert import MeanRevert
-from experts.breakout import Breakout
-from experts.pullback import TrendPullback
-from experts.vol_squeeze import VolSqueezeBreakout
+from regime import RegimeService
 from meta import MetaLearner
 from risk import RiskGovernor
 from utils import atr_wilder
 from trade_selectors import rank_by_momentum, pick_diversified
 from logger import CommanderLogger
-from utils_sizing import compute_sl_tp, position_size_by_risk
+from utils_sizing import compute_sl_tp_batch, position_size_by_risk_batch, kelly_multiplier_batch, trail_stop_batch
 from autoscaler import AutoScaler
+from candle_store import CandleStore
+from data_plane import PlaneSpec, DataPlaneReader, start_data_plane
+from pipeline import TIMEFRAMES, TF_WEIGHTS, RR, build_experts, gate_symbols, strength_to_prob_batch
+from parallel import ParallelEvaluator
+from portfolio_risk import PortfolioRisk
+from buckets import BucketService
+from signal_recorder import SignalRecorder
+from order_pipeline import OrderPipeline
+from protective import PaperStopBook, ProtectionManager
+from fill_sim import STOP_FIRST
+from snapshot import SnapshotWriter, load_snapshot
+from position_registry import FLAT, PositionRegistry
+from load_shed import LEVEL_NAMES, LoadShedder
 
 logger = CommanderLogger()
 load_dotenv()
@@ -40,31 +51,6 @@ MAX_GROSS_EXPOSURE = float(os.getenv('MAX_GROSS_EXPOSURE', '0.6'))
 MAX_RISK_PER_DAY = float(os.getenv('MAX_RISK_PER_DAY', '0.02'))
 MAX_PER_BUCKET = int(os.getenv('MAX_PER_BUCKET', '2'))
 
-# helper: map strength -> crude prob (calibrated later via backtest)
-def strength_to_prob(strength: float) -> float:
-    return max(0.45, min(0.66, 0.46 + 0.2 * strength))
-
-def pass_filters(df: pd.DataFrame, direction: int) -> bool:
-    if df is None or len(df) < 50:
-        return False
-    ema50 = df['close'].ewm(span=50).mean().iloc[-1]
-    ema200 = df['close'].ewm(span=200).mean().iloc[-1]
-    trend_ok = (direction > 0 and ema50 > ema200) or (direction < 0 and ema50 < ema200)
-
-    atr = float(df.get('atr14', pd.Series([0.0])).iloc[-1] or 0.0)
-    volp = atr / max(df['close'].iloc[-1], 1e-9)
-    vol_ok = (0.01 <= volp <= 0.06)
-
-    delta = df['close'].diff().fillna(0)
-    up = delta.clip(lower=0).rolling(14).mean()
-    down = -delta.clip(upper=0).rolling(14).mean()
-    rs = (up / (down + 1e-9)).replace([float('inf')], 0)
-    rsi = 100 - (100 / (1 + rs))
-    rsi_latest = float(rsi.iloc[-1]) if not rsi.isna().iloc[-1] else 50
-    mom_ok = (direction > 0 and rsi_latest >= 55) or (direction < 0 and rsi_latest <= 45)
-
-    return trend_ok and vol_ok and mom_ok
-
 # timezone helper
 BANGKOK = pytz.timezone("Asia/Bangkok")
 def now_thai():
@@ -80,14 +66,14 @@ def main():
     symbols_env = os.getenv('SYMBOLS')
     symbols = [s.strip() for s in symbols_env.split(',')] if symbols_env else list(CFG.data.symbols)
     symbols = [s if '/' in s else s[:-4] + '/' + s[-4:] for s in symbols]
-    timeframes = ["15m", "30m", "1h"]
+    timeframes = list(TIMEFRAMES)
 
     logger.info(f"Commander live (multi) DryRun={dry_run} Sandbox={sandbox} Symbols={symbols} Timeframes={timeframes}")
 
     broker = CCXTBroker(ex_name, api_key, api_secret, sandbox=sandbox)
-    reg = RegimeDetector(CFG.regime)
-    experts = [TrendFollower(), MeanRevert(), Breakout(), TrendPullback(), VolSqueezeBreakout()]
+    experts = build_experts()
     meta = MetaLearner(CFG.meta, [e.name for e in experts])
+    regimes = RegimeService(CFG.regime, [e.name for e in experts])
 
     risk_cfg = type("C", (), {})()
     risk_cfg.max_positions = MAX_POSITIONS
@@ -99,8 +85,18 @@ def main():
     risk_cfg.dyn_budget_min = float(os.getenv('DYN_BUDGET_MIN', '50'))
     risk_cfg.dyn_budget_max = float(os.getenv('DYN_BUDGET_MAX', '2000'))
     risk_cfg.daily_loss_limit = float(os.getenv('DAILY_LOSS_LIMIT', '0.05')) * CAPITAL_TOTAL
+    # equity returns for realized vol / VaR: one sample per RISK_SAMPLE_SECS, RISK_METRICS_WINDOW samples
+    risk_cfg.risk_sample_secs = float(os.getenv('RISK_SAMPLE_SECS', '3600'))
+    risk_cfg.risk_metrics_window = int(os.getenv('RISK_METRICS_WINDOW', '168'))
+    risk_cfg.max_var_frac = float(os.getenv('MAX_VAR_FRAC', '0'))  # 99% VaR over one sample step / equity, 0 = off
+    risk_cfg.max_portfolio_var_frac = float(os.getenv('MAX_PORTFOLIO_VAR_FRAC', '0.03'))  # 99% 1h VaR / equity
+    risk_cfg.max_open_risk_frac = float(os.getenv('MAX_OPEN_RISK_FRAC', '0'))  # 0 = off
 
     risk = RiskGovernor(risk_cfg)
+    risk.portfolio = PortfolioRisk(symbols)
+    # symbol -> correlation bucket, re-clustered in the background on a slow schedule
+    buckets = BucketService(CFG.risk.corr_threshold, float(os.getenv('BUCKET_REFRESH_SECS', '3600')))
+    risk_cfg.buckets_map = buckets.mapping
     autoscaler = AutoScaler(cooldown_secs=3600)
     realized_pnl = 0.0
 
@@ -109,13 +105,214 @@ def main():
     dyn_max_positions = auto_set['max_positions']
     dyn_max_gross_exposure = auto_set['max_gross_exposure']
 
-    state = {s: {"entry": None, "pos": 0.0, "sl": None, "tp1": None, "tp2": None} for s in symbols}
+    full_limit = max(CFG.data.lookback, 220)
+    store = CandleStore(full_limit, os.getenv('CANDLE_DTYPE', CFG.data.candle_dtype))
+
+    # optional: one fetcher process publishes candles through shared memory
+    reader = spec = None
+    if os.getenv('DATA_PLANE', 'false').lower() == 'true':
+        spec = PlaneSpec(name=f"ohc_{os.getpid()}", symbols=symbols, timeframes=timeframes,
+                         capacity=full_limit, price_dtype=os.getenv('CANDLE_DTYPE', CFG.data.candle_dtype))
+        plane, plane_proc, plane_stop = start_data_plane(spec, ex_name, api_key, api_secret, sandbox,
+                                                         float(os.getenv('DATA_PLANE_INTERVAL', '2')))
+        reader = DataPlaneReader(spec)
+
+        def _stop_plane():
+            plane_stop.set()
+            plane_proc.join(timeout=5)
+            reader.close()
+            plane.close()
+        atexit.register(_stop_plane)
+        logger.info(f"[DataPlane] shared candles {spec.nbytes / 1e6:.1f} MB name={spec.name}")
+
+    # WORKERS>1 shards the per-symbol signal pipeline over processes (reads the data plane if enabled)
+    # SIGNAL_MEMO_SIZE slots per process cache expert signals / filter gate per (symbol, tf) bar; 0 disables
+    evaluator = ParallelEvaluator(int(os.getenv('WORKERS', '1')), plane_spec=spec, logger=logger,
+                                  memo_size=int(os.getenv('SIGNAL_MEMO_SIZE', '4096')))
+    atexit.register(evaluator.close)
+
+    # SIGNAL_RECORD_DIR (e.g. data/signals) keeps every loop's signal matrix in daily memory-mappable files
+    recorder = None
+    if os.getenv('SIGNAL_RECORD_DIR'):
+        recorder = SignalRecorder(os.getenv('SIGNAL_RECORD_DIR'), symbols, timeframes, [e.name for e in experts])
+        atexit.register(recorder.close)
+
+    # open positions + re-entry cooldowns; a trade lives at most CFG.risk.ttl_candles bars of its origin timeframe
+    positions = PositionRegistry(CFG.risk.ttl_candles)
+    ttl_due = set()
+
+    # entries / exits go out concurrently; DRY_RUN fills them at the decision price right away
+    orders = OrderPipeline(broker, workers=int(os.getenv('ORDER_WORKERS', '4')),
+                           max_retries=int(os.getenv('ORDER_RETRIES', '3')), paper=dry_run)
+    atexit.register(orders.close)
+    order_wait = float(os.getenv('ORDER_WAIT_SECS', '2.0'))
+
+    # reduce-only SL / TP orders resting on the exchange (a paper book in DRY_RUN); the loop's own
+    # checks below stay on as a second line, stop moves are amended at most every PROTECT_AMEND_SECS
+    protection = None
+    if os.getenv('PROTECTIVE_ORDERS', 'true').lower() == 'true':
+        protection = ProtectionManager(PaperStopBook() if dry_run else broker,
+                                       min_interval=float(os.getenv('PROTECT_AMEND_SECS', '30')),
+                                       min_move=float(os.getenv('PROTECT_MIN_MOVE', '0.001')),
+                                       poll_secs=float(os.getenv('PROTECT_POLL_SECS', '5')), logger=logger)
+    # PAPER_FILLS=intrabar: DRY_RUN stops / targets fill from the forming 1h bar's high / low (fill_sim,
+    # same-bar ambiguity per PAPER_AMBIGUITY) instead of only the last close
+    paper_intrabar = os.getenv('PAPER_FILLS', 'close').lower() == 'intrabar'
+    paper_ambiguity = os.getenv('PAPER_AMBIGUITY', STOP_FIRST)
+
+    # ITER_BUDGET_SECS per iteration (0 = off); over budget sheds 15m/30m, then the universe beyond the
+    # SHED_TOP_N momentum leaders, then summary logging, and steps back after SHED_RECOVER_ITERS calm loops
+    shed = LoadShedder(float(os.getenv('ITER_BUDGET_SECS', '20')),
+                       recover_iters=int(os.getenv('SHED_RECOVER_ITERS', '3')),
+                       top_n=int(os.getenv('SHED_TOP_N', str(2 * CFG.risk.top_k))))
+
+    def reconcile(results):
+        """Apply finished orders to state / RiskGovernor / MetaLearner."""
+        nonlocal realized_pnl
+        for res in results:
+            it = res.intent
+            st = positions.get(it.symbol)
+            if st is None or st["pending"] != it.client_id:
+                logger.warning(f"[Order] stale result {it.client_id} for {it.symbol} ignored")
+                continue
+            st["pending"] = None
+            side_sign = 1 if st["pos"] > 0 else -1
+            if res.status == "rejected":
+                logger.warning(f"[OrderReject] {it.kind} {it.side} {it.symbol} qty={it.amount} "
+                               f"tries={it.attempts}: {res.error}")
+                if it.kind == "entry":
+                    risk.on_close(it.symbol)
+                    positions.close(it.symbol, "entry rejected", cooldown_seconds=60)
+                continue
 
-    # mark day
-    risk._last_day = now_thai().strftime("%Y-%m-%d")
+            if it.kind == "entry":
+                # the slot was reserved at the decision price; re-book at the actual fill
+                qty, entry = res.filled, res.avg_price
+                st.update({"pos": side_sign * qty, "entry": entry, "risk_usd": qty * abs(entry - st["sl"]),
+                           "closed_pnl": 0.0})
+                risk.on_close(it.symbol)
+                risk.on_open(it.symbol, qty * entry, qty, entry, st["sl"], st["tp2"], direction=side_sign)
+                if protection is not None:
+                    protection.protect(it.symbol, side_sign, qty, st["sl"], st["tp2"])
+                logger.info(f"[Fill] {it.side} {it.symbol} qty={qty} price={entry} ({res.status})")
+                continue
+
+            pnl_usd = (res.avg_price - st["entry"]) * side_sign * res.filled
+            realized_pnl += pnl_usd
+            risk.register_pnl(pnl_usd)
+            st["closed_pnl"] += pnl_usd
+            remaining = abs(st["pos"]) - res.filled
+            if res.status == "partial" and remaining > 0:
+                frac = remaining / abs(st["pos"])
+                st.update({"pos": side_sign * remaining, "risk_usd": st["risk_usd"] * frac})
+                risk.on_close(it.symbol)
+                risk.on_open(it.symbol, remaining * st["entry"], remaining, st["entry"], st["sl"], st["tp2"],
+                             direction=side_sign)
+                if protection is not None:
+                    protection.resize(it.symbol, remaining)
+                logger.info(f"[Exit] {it.symbol} partial qty={res.filled} pnl={pnl_usd:.2f}")
+                continue
+            if st.get('contrib') is not None and st.get('risk_usd'):
+                # credit experts by agreement with the trade, pnl in R-multiples
+                meta.update_vector(st['contrib'], st["closed_pnl"] / st['risk_usd'])
+            risk.on_close(it.symbol)
+            if protection is not None:
+                protection.release(it.symbol)
+            logger.info(f"[Exit] {it.symbol} pnl={st['closed_pnl']:.2f}")
+            positions.close(it.symbol, "exit", cooldown_seconds=1800)
+            ttl_due.discard(it.symbol)
+
+    # SNAPSHOT_PATH keeps a compact copy of state / risk / autoscaler / meta / regimes / candles, rewritten
+    # atomically every SNAPSHOT_SECS; a restart resumes from it if it is at most SNAPSHOT_MAX_AGE old
+    snapshot_path = os.getenv('SNAPSHOT_PATH', os.path.join('data', 'runner_snapshot.pkl'))
+    snapshots = SnapshotWriter(snapshot_path, float(os.getenv('SNAPSHOT_SECS', '60')))
+
+    def snapshot_payload():
+        return {"dry_run": dry_run, "symbols": symbols, "realized_pnl": realized_pnl,
+                "positions": positions.state_dict(),
+                "risk": risk.state_dict(), "autoscaler": autoscaler.state_dict(), "meta": meta.state_dict(),
+                "regimes": regimes.state_dict(), "candles": store.state_dict() if reader is None else None,
+                "protection": protection.state_dict() if protection is not None else None}
+
+    def reconcile_exchange():
+        """After a restart: stops that fired while we were down, then state vs the exchange's positions."""
+        if protection is not None:
+            for res in protection.poll():
+                positions.update(res.intent.symbol, pending=res.intent.client_id)
+                reconcile([res])
+        try:
+            live = broker.fetch_position_sizes(symbols)
+        except Exception as e:
+            logger.error(f"[Reconcile] fetch positions failed, keeping snapshot positions: {e}")
+            return
+        for s in symbols:
+            st = positions.get(s) or FLAT
+            if s not in live:
+                # no entry is not "flat": without an answer the snapshot position (and its stops) stay
+                if st["pos"] != 0.0:
+                    logger.warning(f"[Reconcile] {s} not reported by the exchange, keeping snapshot position {st['pos']}")
+                continue
+            ex_qty = float(live[s])
+            if abs(ex_qty - st["pos"]) <= 1e-9 * max(1.0, abs(st["pos"])):
+                continue
+            if st["pos"] == 0.0:
+                logger.warning(f"[Reconcile] {s} exchange position {ex_qty} is not managed by this runner")
+            elif ex_qty == 0.0 or (ex_qty > 0) != (st["pos"] > 0):
+                logger.warning(f"[Reconcile] {s} closed outside the runner (had {st['pos']}, exchange {ex_qty}); "
+                               f"pnl not booked")
+                risk.on_close(s)
+                if protection is not None:
+                    protection.release(s)
+                positions.close(s, "closed outside")
+            else:
+                logger.warning(f"[Reconcile] {s} size {st['pos']} -> {ex_qty} (exchange)")
+                side_sign = 1 if ex_qty > 0 else -1
+                positions.update(s, pos=ex_qty, risk_usd=st["risk_usd"] * abs(ex_qty / st["pos"]))
+                risk.on_close(s)
+                risk.on_open(s, abs(ex_qty) * st["entry"], abs(ex_qty), st["entry"], st["sl"], st["tp2"],
+                             direction=side_sign)
+                if protection is not None:
+                    protection.resize(s, abs(ex_qty))
+
+    snap = load_snapshot(snapshot_path, float(os.getenv('SNAPSHOT_MAX_AGE', '86400')))
+    if snap is not None and snap.get("dry_run") != dry_run:
+        logger.warning(f"[Snapshot] {snapshot_path} was written with DryRun={snap.get('dry_run')}, ignored")
+        snap = None
+    if snap is not None:
+        positions.load_state(snap["positions"], symbols)
+        for s, st in snap["positions"]["open"].items():
+            if s not in positions:
+                logger.warning(f"[Snapshot] {s} pos={st['pos']} is no longer in SYMBOLS and will not be managed")
+        for st in positions.list_open():
+            # whatever was in flight is settled by the exchange reconcile below
+            st["pending"] = None
+        realized_pnl = float(snap["realized_pnl"])
+        risk.load_state(snap["risk"])
+        for s in list(risk.positions):
+            if s not in positions:
+                risk.on_close(s)
+        autoscaler.load_state(snap["autoscaler"])
+        if not meta.load_state(snap["meta"]):
+            logger.warning("[Snapshot] expert set changed, MetaLearner starts fresh")
+        regimes.load_state(snap["regimes"])
+        # restored buffers make the first fetch_limit() ask only for the candles missed while down
+        n_candles = store.load_state(snap["candles"], {(s, tf) for s in symbols for tf in timeframes}) \
+            if snap.get("candles") and reader is None else 0
+        if protection is not None and snap.get("protection"):
+            protection.load_state(snap["protection"])
+            for s in [s for s in protection.positions if s not in positions]:
+                protection.release(s)
+        logger.info(f"[Snapshot] restored {snapshot_path} age={snap['_age_secs']:.0f}s candles={n_candles} "
+                    f"open={positions.symbols()} realized={realized_pnl:.2f}")
+        if not dry_run:
+            reconcile_exchange()
+    atexit.register(lambda: snapshots.save_now(snapshot_payload()))
+
+    # mark day (a restored day keeps its pnl until the daily reset below sees a new day)
+    if not getattr(risk, '_last_day', None):
+        risk._last_day = now_thai().strftime("%Y-%m-%d")
 
     while True:
-        TF_WEIGHTS = {"15m": 0.3, "30m": 0.3, "1h": 0.4}
         try:
             # reset daily pnl if new day
             today_str = now_thai().strftime("%Y-%m-%d")
@@ -124,23 +321,34 @@ def main():
                 risk.daily_pnl = 0.0
                 risk._last_day = today_str
 
+            shed.start()
+            # fills that arrived after last loop's wait
+            reconcile(orders.drain())
+
             data = {}
+            now_ms = int(time.time() * 1000)
+            fetch_tfs = shed.timeframes(timeframes)
+            fetch_syms = set(shed.universe(symbols, positions.symbols()))
             for s in symbols:
-                data[s] = {}
-                for tf in timeframes:
+                # shed timeframes / symbols stay None: neutral in the blend, not usable this loop
+                data[s] = {tf: None for tf in timeframes}
+                if s not in fetch_syms:
+                    continue
+                for tf in fetch_tfs:
                     try:
-                        df = broker.fetch_ohlcv(s, tf, limit=max(CFG.data.lookback, 220))
-                        if df is None or df.empty:
-                            df = None
+                        if reader is not None:
+                            df = reader.frame(s, tf)
                         else:
-                            if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                            # warm buffers only fetch the gap since the last stored candle
+                            limit = store.fetch_limit(s, tf, now_ms, full_limit)
+                            store.update(s, tf, broker.fetch_ohlcv_raw(s, tf, limit=limit))
+                            df = store.frame(s, tf)
+                        if df is not None:
                             try:
                                 df['atr14'] = atr_wilder(df, 14)
                             except Exception:
                                 df['atr14'] = 0.0
                         data[s][tf] = df
-                        time.sleep(0.12)
                     except Exception as e:
                         logger.error(f"[fetch err] {s} {tf} -> {e}")
                         data[s][tf] = None
@@ -151,6 +359,22 @@ def main():
                 time.sleep(5)
                 continue
 
+            # mark-to-market equity feeds the streaming risk metrics every loop (returns sampled per RISK_SAMPLE_SECS)
+            unrealized = 0.0
+            for st in positions.list_open():
+                if data[st['symbol']].get('1h') is not None:
+                    unrealized += (float(data[st['symbol']]['1h']['close'].iloc[-1]) - st['entry']) * st['pos']
+            risk.on_equity(float(CAPITAL_TOTAL) + float(realized_pnl) + unrealized, today_str)
+
+            # covariance of 1h returns is rebuilt only when a new 1h candle shows up (and the whole universe is in)
+            if shed.full_universe():
+                last_1h = max(int(data[s]["1h"]['timestamp'].iloc[-1].value) for s in usable)
+                risk.portfolio.update_covariance({s: data[s]["1h"]['close'].values for s in usable}, key=last_1h)
+
+            if buckets.due() and shed.full_universe():
+                buckets.submit({s: data[s]["1h"]['close'].values for s in usable})
+            risk_cfg.buckets_map = buckets.mapping
+
             equity_estimate = float(CAPITAL_TOTAL) + float(realized_pnl)
             auto_set = autoscaler.get_settings(equity_estimate)
             dyn_risk_per_trade = auto_set['risk_per_trade']
@@ -159,51 +383,73 @@ def main():
             logger.info(f"[AutoScaler] eq={equity_estimate:.2f} -> RPT={dyn_risk_per_trade:.4f} MAX_POS={dyn_max_positions} MAX_GROSS={dyn_max_gross_exposure:.2f}")
 
             ranked = rank_by_momentum({s: data[s]["1h"] for s in usable})
+            if shed.full_universe():
+                shed.ranking = ranked
             tradables = pick_diversified(ranked, {s: data[s]["1h"] for s in usable},
                                          CFG.risk.top_k, CFG.risk.corr_threshold)
 
-            candidates = []
-            for s in usable:
-                df1h = data[s]["1h"]
-                tf_signals = {}
-                for tf in timeframes:
-                    df_tf = data[s].get(tf)
-                    sigs = []
-                    if df_tf is not None:
-                        for e in experts:
-                            try:
-                                sgl = e.signal(df_tf)
-                                st = max(0.0, min(1.0, getattr(sgl, 'strength', 0.0)))
-                                dirn = int(getattr(sgl, 'direction', 0))
-                                sigs.append((dirn, st, e.name))
-                            except Exception:
-                                sigs.append((0, 0.0, e.name))
-                    tf_signals[tf] = sigs
-                tf_nets = {tf: sum(d * st for (d, st, _) in sigs) for tf, sigs in tf_signals.items()}
-                combined = sum(tf_nets.get(tf, 0.0) * w for tf, w in TF_WEIGHTS.items())
-                direction = 1 if combined > 0.05 else (-1 if combined < -0.05 else 0)
-                strength = min(1.0, abs(combined))
-                if direction == 0:
-                    logger.debug(f"[Filter] {s} rejected: neutral signal")
-                    continue
-                if not pass_filters(df1h, direction):
-                    logger.debug(f"[Filter] {s} rejected: filters not passed")
-                    continue
-                p = strength_to_prob(strength)
-                rr = 1.5
-                eu = p * rr - (1 - p)
-                if eu <= 0:
-                    logger.debug(f"[Filter] {s} rejected: EU={eu:.2f}")
-                    continue
-                candidates.append((eu, s, direction, strength))
-
-            candidates.sort(reverse=True, key=lambda x: x[0])
+            # regimes are recomputed in one batch only for (symbol, tf) whose bar just closed
+            regimes.update({(s, tf): data[s].get(tf) for s in usable for tf in timeframes})
+            regime_factors = {s: regimes.expert_factors(s, timeframes) for s in usable}
 
             equity = float(CAPITAL_TOTAL) + float(realized_pnl)
-            open_positions = [sym for sym in symbols if state[sym]["pos"] != 0.0]
-            corr_bucket_count = {}
+            open_positions = positions.symbols()
+            # lapsed cooldowns are dropped and trades past their time-in-trade limit queued for exit
+            ttl_due.update(positions.tick())
+
+            # cheap gates first: no free slot / paused day / full exposure -> no signal work at all
+            stage_counts = Counter()
+            slots_left = min(dyn_max_positions, MAX_POSITIONS) - len(open_positions)
+            if not risk.can_trade_today(equity):
+                stage_counts["day paused"] += len(usable)
+                slots_left = 0
+            elif risk.total_abs_exposure() >= MAX_GROSS_EXPOSURE * max(1.0, equity):
+                stage_counts["exposure"] += len(usable)
+                slots_left = 0
+            to_eval = gate_symbols(usable, tradables, open_positions, positions.in_cooldown, slots_left, stage_counts)
+            if to_eval and shed.over_budget():
+                # the budget is gone before the signal stage: no new entries, go straight to exits
+                stage_counts["over budget"] += len(to_eval)
+                shed.skipped_entries += 1
+                to_eval = []
+
+            # MetaLearner weights and regime tilts scale each expert's vote in the TF blend
+            candidates, rejects, contribs = evaluator.evaluate(to_eval, data, TF_WEIGHTS, meta.weights_vector(),
+                                                               regime_factors)
+            for s, reason in rejects:
+                stage_counts[reason.split('=')[0]] += 1
+                logger.debug(f"[Filter] {s} rejected: {reason}")
+            stage_counts["candidates"] += len(candidates)
+            if recorder is not None:
+                recorder.record(now_ms, evaluator.last_matrix, len(candidates))
+            # reason text is looked up from the code table only for what gets logged
+            for _, s, _, _ in candidates:
+                logger.debug(f"[Signals] {s} {evaluator.last_matrix.describe(s)}")
+            memo = evaluator.memo_stats()
+            logger.info(f"[Pipeline] {dict(stage_counts)} memo hits={memo['hits']} misses={memo['misses']} "
+                        f"hit_rate={memo['hit_rate']:.2f}")
 
-            for eu, s, direction, strength in candidates:
+            candidates.sort(reverse=True, key=lambda x: x[0])
+
+            corr_bucket_count = buckets.counts(open_positions)
+
+            # size every candidate in one pass: column j = size if j more positions get opened first
+            k_atr = 2.0
+            c_syms = [c[1] for c in candidates]
+            c_price = np.array([float(data[s]["1h"]['close'].iloc[-1]) for s in c_syms])
+            c_atr = np.array([float(data[s]["1h"].get('atr14', pd.Series([0.0])).iloc[-1] or 0.0) for s in c_syms])
+            c_dir = np.array([c[2] for c in candidates], dtype=float)
+            c_sl, c_tp1, c_tp2 = compute_sl_tp_batch(c_price, c_atr, k_atr=k_atr, side=c_dir)
+            open_now = len(open_positions)
+            positions_remaining = np.maximum(1, dyn_max_positions - np.arange(open_now, max(open_now + 1, dyn_max_positions)))
+            risk_fracs = np.minimum(dyn_risk_per_trade, MAX_RISK_PER_DAY / positions_remaining)
+            # volatility-targeted USD budget per position caps the risk fraction
+            risk_fracs = np.minimum(risk_fracs, risk.dynamic_budget() / max(1.0, equity))
+            c_qty = position_size_by_risk_batch(equity, risk_fracs[None, :], c_price[:, None], c_sl[:, None])
+            c_qty *= kelly_multiplier_batch(strength_to_prob_batch([c[3] for c in candidates]), RR)[:, None]
+            c_qty_rounded = broker.round_amounts(np.repeat(c_syms, c_qty.shape[1]), c_qty.ravel()).reshape(c_qty.shape)
+
+            for ci, (eu, s, direction, strength) in enumerate(candidates):
                 if len(open_positions) >= dyn_max_positions:
                     logger.info(f"[Block] Skip {s}: max positions reached")
                     break
@@ -211,104 +457,108 @@ def main():
                     logger.debug(f"[Block] {s} not in tradables")
                     continue
 
-                price = float(data[s]["1h"]['close'].iloc[-1])
-                atrv = float(data[s]["1h"].get('atr14', pd.Series([0.0])).iloc[-1] or 0.0)
+                price = float(c_price[ci])
                 side = 'buy' if direction > 0 else 'sell'
-                k_atr = 2.0
-                sl, tp1, tp2 = compute_sl_tp(price, atrv, k_atr=k_atr, side=1 if side == 'buy' else -1)
-
-                per_slot_budget = risk.dynamic_budget()
-                positions_remaining = max(1, dyn_max_positions - len(open_positions))
-                risk_per_trade_frac = min(dyn_risk_per_trade, (MAX_RISK_PER_DAY / positions_remaining))
-                qty = position_size_by_risk(equity, risk_per_trade_frac, price, sl)
-
-                p = strength_to_prob(strength)
-                R = rr
-                kelly_f = max(0.0, min(0.5, (p * R - (1 - p)) / max(1e-9, R)))
-                qty *= (0.5 + kelly_f)
-
-                qty_rounded = broker._round_amount(s, qty)
+                sl, tp1, tp2 = float(c_sl[ci]), float(c_tp1[ci]), float(c_tp2[ci])
+                qty_rounded = float(c_qty_rounded[ci, len(open_positions) - open_now])
                 if qty_rounded <= 0:
                     logger.info(f"[SizeReject] {s} qty=0 after rounding")
                     continue
 
                 symbol_notional = qty_rounded * price
-                can, reason = risk.can_open(equity, s, symbol_notional, corr_bucket_count, len(open_positions))
+                can, reason = risk.can_open(equity, s, symbol_notional, corr_bucket_count, len(open_positions),
+                                            direction=direction, stop_risk=qty_rounded * abs(price - sl))
                 if not can:
                     logger.info(f"[RiskBlock] Skip {s} reason={reason}")
                     continue
 
-                if not dry_run:
-                    order = broker.place_order(s, side, qty_rounded)
-                    if order:
-                        state[s].update({"pos": qty_rounded if side == 'buy' else -qty_rounded,
-                                         "entry": price, "sl": sl, "tp1": tp1, "tp2": tp2})
-                        risk.on_open(s, symbol_notional, qty_rounded, price, sl, tp2)
-                        open_positions.append(s)
-                        logger.info(f"[Order] Live {side} {s} qty={qty_rounded} price={price}")
-                else:
-                    state[s].update({"pos": qty_rounded if side == 'buy' else -qty_rounded,
-                                     "entry": price, "sl": sl, "tp1": tp1, "tp2": tp2})
-                    risk.on_open(s, symbol_notional, qty_rounded, price, sl, tp2)
-                    open_positions.append(s)
-                    logger.info(f"[Order] DryRun {side} {s} qty={qty_rounded} price={price}")
+                if orders.busy(s):
+                    continue
+                # reserve the slot at the decision price now; reconcile() re-books or rolls back on the result
+                intent = orders.submit(s, side, qty_rounded, "entry", price)
+                positions.open(s, {"pos": qty_rounded if side == 'buy' else -qty_rounded,
+                                   "entry": price, "sl": sl, "tp1": tp1, "tp2": tp2, "pending": intent.client_id,
+                                   "risk_usd": qty_rounded * abs(price - sl), "contrib": contribs.get(s) * direction,
+                                   "tf_origin": evaluator.last_matrix.origin_timeframe(s, TF_WEIGHTS, direction)})
+                risk.on_open(s, symbol_notional, qty_rounded, price, sl, tp2, direction=direction)
+                open_positions.append(s)
+                corr_bucket_count = buckets.counts(open_positions)
+                logger.info(f"[Order] {'DryRun' if dry_run else 'Live'} {side} {s} qty={qty_rounded} price={price} "
+                            f"id={intent.client_id}")
+
+            if protection is not None:
+                if dry_run and paper_intrabar:
+                    # triggers crossed anywhere in the range traded since the last loop, not just at the last price
+                    protection.backend.mark_bars({s: (int(data[s]['1h']['timestamp'].iloc[-1].value),
+                                                      float(data[s]['1h']['high'].iloc[-1]),
+                                                      float(data[s]['1h']['low'].iloc[-1]),
+                                                      float(data[s]['1h']['close'].iloc[-1]))
+                                                  for s in open_positions if data[s]['1h'] is not None},
+                                                 policy=paper_ambiguity)
+                elif dry_run:
+                    protection.backend.mark({s: float(data[s]['1h']['close'].iloc[-1]) for s in open_positions})
+                for res in protection.poll():
+                    # an exchange-side SL / TP fired: book it like our own exit
+                    positions.update(res.intent.symbol, pending=res.intent.client_id)
+                    reconcile([res])
 
             for s in list(open_positions):
-                if state[s]['pos'] == 0.0:
+                st = positions.get(s)
+                if st is None or st['pending']:
                     continue
                 price = float(data[s]['1h']['close'].iloc[-1])
-                side_sign = 1 if state[s]['pos'] > 0 else -1
-                entry = state[s]['entry']
-                sl = state[s]['sl']
-                tp2 = state[s]['tp2']
-
-                r = (price - entry) * side_sign
-                oneR = abs(entry - sl)
-                if oneR > 0 and r >= oneR and sl != entry:
-                    state[s]['sl'] = entry
-                if r >= oneR * 1.5:
-                    atr_now = float(data[s]['1h'].get('atr14', pd.Series([0.0])).iloc[-1] or 0.0)
-                    trail = 1.2 * atr_now
-                    new_sl = price - side_sign * trail
-                    if side_sign > 0:
-                        state[s]['sl'] = max(state[s]['sl'], new_sl)
-                    else:
-                        state[s]['sl'] = min(state[s]['sl'], new_sl)
+                side_sign = 1 if st['pos'] > 0 else -1
+                tp2 = st['tp2']
+
+                # break-even at 1R, 1.2 x ATR trail from 1.5R (shared with the backtest)
+                atr_now = float(data[s]['1h'].get('atr14', pd.Series([0.0])).iloc[-1] or 0.0)
+                st['sl'] = float(trail_stop_batch(price, st['entry'], st['sl'], side_sign, atr_now))
+                if protection is not None:
+                    protection.update_stop(s, st['sl'])
 
                 exit_now = False
-                if side_sign > 0 and price <= state[s]['sl']:
+                if side_sign > 0 and price <= st['sl']:
                     exit_now = True
-                if side_sign < 0 and price >= state[s]['sl']:
+                if side_sign < 0 and price >= st['sl']:
                     exit_now = True
                 if side_sign > 0 and price >= tp2:
                     exit_now = True
                 if side_sign < 0 and price <= tp2:
                     exit_now = True
 
-                if exit_now:
-                    if not dry_run:
-                        broker.place_order(s, 'sell' if side_sign > 0 else 'buy', abs(state[s]['pos']))
-                    pnl_usd = (price - entry) * side_sign * abs(state[s]['pos'])
-                    realized_pnl += pnl_usd
-                    risk.register_pnl(pnl_usd)
-                    risk.on_close(s)
-                    logger.info(f"[Exit] {s} pnl={pnl_usd:.2f}")
-                    state[s].update({"pos": 0.0, "entry": None, "sl": None, "tp1": None, "tp2": None})
-                    try:
-                        open_positions.remove(s)
-                    except ValueError:
-                        pass
-                    risk.set_cooldown(s, 1800)
+                if s in ttl_due:
+                    logger.info(f"[TTL] {s} open {st['ttl_candles']} x {st['tf_origin']} candles, closing")
+                    exit_now = True
 
-            summaries = []
-            for s in symbols:
-                pos = state[s]['pos']
-                entry = state[s]['entry'] or 0.0
-                sl = state[s]['sl'] or 0.0
-                size = abs(pos)
-                price = float(data[s]['1h']['close'].iloc[-1]) if data[s]['1h'] is not None else 0.0
-                summaries.append(f"{s}: price={price:.2f} pos={pos:.6f} entry={entry:.2f} sl={sl:.2f} size={size:.6f}")
-            logger.info(" | ".join(summaries))
+                if exit_now:
+                    intent = orders.submit(s, 'sell' if side_sign > 0 else 'buy', abs(st['pos']), "exit", price,
+                                           reduce_only=True)
+                    st['pending'] = intent.client_id
+
+            # this bar's entries and exits are in flight together; book whatever finishes in time
+            reconcile(orders.drain(wait=order_wait))
+            if protection is not None:
+                protection.flush()
+
+            if not shed.quiet():
+                summaries = []
+                for s in symbols:
+                    st = positions.get(s) or FLAT
+                    pos = st['pos']
+                    entry = st['entry'] or 0.0
+                    sl = st['sl'] or 0.0
+                    size = abs(pos)
+                    price = float(data[s]['1h']['close'].iloc[-1]) if data[s]['1h'] is not None else 0.0
+                    summaries.append(f"{s}: price={price:.2f} pos={pos:.6f} entry={entry:.2f} sl={sl:.2f} size={size:.6f}")
+                logger.info(" | ".join(summaries))
+            change = shed.finish()
+            if change:
+                logger.warning(f"[Shed] {'degrade' if change > 0 else 'recover'} -> {LEVEL_NAMES[shed.level]} "
+                               f"({shed.last_elapsed:.1f}s vs budget {shed.budget:.0f}s)")
+            if change or shed.level:
+                logger.info(f"[Shed] {shed.stats()}")
+            if snapshots.due():
+                snapshots.submit(snapshot_payload())
             time.sleep(5)
 
         except Exception as e:
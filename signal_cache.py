@@ -0,0 +1,101 @@
+# signal_cache.py - bar-keyed memo for expert signals and the 1h filter gate
+from collections import OrderedDict
+
+
+def bar_key(df):
+    """
+    Identity of a candle frame: length, first / last closed bar and the values of the
+    still-forming last bar. Closed bars never change, so equal keys mean equal frames.
+    """
+    if df is None or len(df) == 0:
+        return None
+    ts = df['timestamp'].values
+    closed = ts[-2] if len(ts) > 1 else None
+    last = tuple(float(df[c].values[-1]) for c in ('open', 'high', 'low', 'close', 'volume'))
+    return len(ts), ts[0], closed, ts[-1], last
+
+
+def config_hash(obj) -> int:
+    """
+    Settings of an expert: its data attributes, class-level ones (over the MRO) overridden by
+    instance ones. Thresholds written as literals inside signal_code are code, not config:
+    changing them means a new process, and the memo lives in memory only.
+    """
+    state = {}
+    for klass in reversed(type(obj).__mro__):
+        for k, v in vars(klass).items():
+            if not k.startswith('__') and not callable(v) and not isinstance(v, (staticmethod, classmethod, property)):
+                state[k] = v
+    state.update(getattr(obj, '__dict__', {}))
+    return hash((type(obj).__qualname__, repr(sorted(state.items()))))
+
+
+class SignalMemo:
+    """
+    One slot per (kind, symbol, timeframe), tagged with (bar key, config hash). A new bar
+    or a changed config replaces the slot; least recently used slots are evicted past maxsize.
+    An expert's config hash is computed once per instance; call reconfigure() after changing
+    an expert's settings in place.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = max(1, int(maxsize))
+        self._slots = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._configs = {}          # id(expert) -> (expert, config hash); the reference keeps the id unique
+
+    def config_of(self, expert) -> int:
+        ent = self._configs.get(id(expert))
+        if ent is None or ent[0] is not expert:
+            ent = self._configs[id(expert)] = (expert, config_hash(expert))
+        return ent[1]
+
+    def reconfigure(self, expert=None):
+        """Forget the config hash of one expert (all with None); its next lookup re-hashes it."""
+        if expert is None:
+            self._configs.clear()
+        else:
+            self._configs.pop(id(expert), None)
+
+    def get(self, slot, tag, compute):
+        ent = self._slots.get(slot)
+        if ent is not None and ent[0] == tag:
+            self.hits += 1
+            self._slots.move_to_end(slot)
+            return ent[1]
+        if ent is not None:
+            self.invalidations += 1
+        self.misses += 1
+        value = compute()
+        self._slots[slot] = (tag, value)
+        self._slots.move_to_end(slot)
+        if len(self._slots) > self.maxsize:
+            self._slots.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def signal(self, expert, symbol: str, tf: str, df, bkey=None):
+        bkey = bar_key(df) if bkey is None else bkey
+        return self.get((expert.name, symbol, tf), (bkey, self.config_of(expert)), lambda: expert.signal_code(df))
+
+    def filter_direction(self, symbol: str, tf: str, df, fn, bkey=None):
+        if df is None:
+            return fn(df)
+        bkey = bar_key(df) if bkey is None else bkey
+        return self.get(("filter", symbol, tf), (bkey, hash(fn.__qualname__)), lambda: fn(df))
+
+    def clear(self):
+        self._slots.clear()
+        self._configs.clear()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                "evictions": self.evictions, "size": len(self._slots),
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,83 @@
+# signal_matrix.py - symbol x timeframe x expert signals in one preallocated structured array
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from experts.reasons import REASONS
+
+SIGNAL_DTYPE = np.dtype([('direction', 'i1'), ('strength', 'f4'), ('reason', 'u2')])
+# per-symbol outcome of the blend: filter-allowed direction, blended score / direction / strength, EU
+SUMMARY_DTYPE = np.dtype([('allowed', 'i1'), ('combined', 'f4'), ('direction', 'i1'), ('strength', 'f4'),
+                          ('eu', 'f4'), ('evaluated', '?')])
+
+
+class SignalMatrix:
+    """
+    data[symbol, timeframe, expert] = (direction, strength, reason code). Unevaluated cells
+    stay zero (reason 0); summary[symbol] keeps the blend outcome. Votes and the TF-weighted
+    blend are computed for every symbol at once; reason text is looked up in
+    experts.reasons.REASONS only when describe() is called.
+    """
+
+    def __init__(self, symbols: Sequence[str], timeframes: Sequence[str], expert_names: Sequence[str]):
+        self.symbols = list(symbols)
+        self.timeframes = list(timeframes)
+        self.expert_names = list(expert_names)
+        self.sym_index = {s: i for i, s in enumerate(self.symbols)}
+        self.tf_index = {tf: i for i, tf in enumerate(self.timeframes)}
+        self.data = np.zeros((len(self.symbols), len(self.timeframes), len(self.expert_names)), dtype=SIGNAL_DTYPE)
+        self.summary = np.zeros(len(self.symbols), dtype=SUMMARY_DTYPE)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def reset(self, rows=None):
+        if rows is None:
+            self.data.fill(0)
+            self.summary.fill(0)
+        else:
+            self.data[rows] = 0
+            self.summary[rows] = 0
+
+    def set(self, i: int, t: int, k: int, direction: int, strength: float, code: int):
+        self.data[i, t, k] = (direction, strength, code)
+
+    def tf_weight_vector(self, tf_weights: Dict[str, float]) -> np.ndarray:
+        return np.array([float(tf_weights.get(tf, 0.0)) for tf in self.timeframes])
+
+    def votes(self, tf_weights: Dict[str, float], factors=None, rows=None) -> np.ndarray:
+        """(symbols, timeframes, experts) weighted signed votes: w_tf * direction * clip(strength) * factor."""
+        d = self.data if rows is None else self.data[rows]
+        v = d['direction'].astype(float) * np.clip(d['strength'].astype(float), 0.0, 1.0)
+        v *= self.tf_weight_vector(tf_weights)[None, :, None]
+        if factors is not None:
+            v *= factors
+        return v
+
+    def reduce(self, tf_weights: Dict[str, float], factors=None, rows=None) -> np.ndarray:
+        """Per-expert TF blend for every symbol -> (symbols, experts)."""
+        return self.votes(tf_weights, factors, rows).sum(axis=1)
+
+    def origin_timeframe(self, symbol: str, tf_weights: Dict[str, float], direction: int) -> str:
+        """Timeframe whose weighted votes pushed hardest in `direction` for one symbol."""
+        i = self.sym_index[symbol]
+        per_tf = self.votes(tf_weights, rows=[i])[0].sum(axis=1) * direction
+        return self.timeframes[int(np.argmax(per_tf))]
+
+    def merge(self, other: "SignalMatrix"):
+        """Copy the rows of a shard matrix (same timeframes / experts) into this one."""
+        rows = [self.sym_index[s] for s in other.symbols]
+        self.data[rows] = other.data
+        self.summary[rows] = other.summary
+
+    def describe(self, symbol: str) -> Dict[str, List[str]]:
+        """{tf: ["expert:+1@0.80 reason", ...]} of the non-neutral cells of one symbol."""
+        out = {}
+        row = self.data[self.sym_index[symbol]]
+        for t, tf in enumerate(self.timeframes):
+            cells = [f"{name}:{int(c['direction']):+d}@{float(c['strength']):.2f} {REASONS.text(c['reason'])}"
+                     for name, c in zip(self.expert_names, row[t]) if c['direction'] != 0]
+            if cells:
+                out[tf] = cells
+        return out
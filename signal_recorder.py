@@ -0,0 +1,178 @@
+# signal_recorder.py - append-only daily signal matrix files, written by a background thread
+import json
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from experts.reasons import REASONS
+from signal_matrix import SIGNAL_DTYPE, SUMMARY_DTYPE, SignalMatrix
+
+LOOP_DTYPE = np.dtype([('ts', 'i8'), ('candidates', 'i2')])
+
+
+def _day(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+class SignalRecorder:
+    """
+    Appends one record per loop to <root>/<YYYY-MM-DD>/ (UTC days):
+      loops.bin    LOOP_DTYPE                         (n,)
+      signals.bin  SIGNAL_DTYPE  (n, symbols, timeframes, experts)
+      summary.bin  SUMMARY_DTYPE (n, symbols)
+      meta.json    symbols / timeframes / experts / reason texts / dtypes
+    Raw little-endian records, so load_day() can np.memmap them. Rows of symbols that were
+    not evaluated in a loop stay zero (summary.evaluated = False). A loop identical to the
+    previous one of the same day is skipped unless keep_unchanged: the state at time t is the
+    last record <= t.
+    """
+
+    def __init__(self, root: str, symbols: Sequence[str], timeframes: Sequence[str], expert_names: Sequence[str],
+                 keep_unchanged: bool = False, max_queue: int = 256):
+        self.root = root
+        self.layout = SignalMatrix(symbols, timeframes, expert_names)
+        self.keep_unchanged = keep_unchanged
+        self.records = 0
+        self.skipped = 0
+        self.dropped = 0
+        self._last = None
+        self._q = queue.Queue(maxsize=max_queue)
+        self._dir = None
+        self._files = {}
+        self._thread = threading.Thread(target=self._run, name="signal-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, ts_ms: int, matrix: Optional[SignalMatrix], candidates: int = 0):
+        """Copy the loop's matrix into the recorder's universe layout and queue it; never blocks."""
+        out = self.layout
+        out.reset()
+        if matrix is not None:
+            rows = [out.sym_index[s] for s in matrix.symbols if s in out.sym_index]
+            src = [i for i, s in enumerate(matrix.symbols) if s in out.sym_index]
+            t_src = [matrix.tf_index[tf] for tf in out.timeframes]
+            out.data[rows] = matrix.data[src][:, t_src]
+            out.summary[rows] = matrix.summary[src]
+        day = _day(ts_ms)
+        if not self.keep_unchanged and self._last is not None and self._last[0] == day \
+                and np.array_equal(self._last[1], out.data) and np.array_equal(self._last[2], out.summary):
+            self.skipped += 1
+            return
+        item = (int(ts_ms), int(candidates), out.data.copy(), out.summary.copy())
+        try:
+            self._q.put_nowait(item)
+            self._last = (day, item[2], item[3])
+        except queue.Full:
+            self.dropped += 1
+
+    def _meta(self) -> dict:
+        m = self.layout
+        return {"symbols": m.symbols, "timeframes": m.timeframes, "experts": m.expert_names,
+                "reasons": [REASONS.text(i) for i in range(len(REASONS))],
+                "signal_dtype": SIGNAL_DTYPE.descr, "summary_dtype": SUMMARY_DTYPE.descr, "loop_dtype": LOOP_DTYPE.descr}
+
+    def _open_day(self, day: str):
+        for f in self._files.values():
+            f.close()
+        meta = self._meta()
+        base = os.path.join(self.root, day)
+        path, part = base, 1
+        # a restart with another universe starts a new segment of the same day
+        while os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json")) as f:
+                old = json.load(f)
+            if all(old.get(k) == v for k, v in json.loads(json.dumps(meta)).items() if k != "reasons"):
+                break
+            part += 1
+            path = f"{base}.{part}"
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        # drop records a crash left without their loops.bin entry, so the files stay aligned
+        lp = os.path.join(path, "loops.bin")
+        n = os.path.getsize(lp) // LOOP_DTYPE.itemsize if os.path.exists(lp) else 0
+        shape = self.layout.shape
+        sizes = {"loops": n * LOOP_DTYPE.itemsize, "signals": n * SIGNAL_DTYPE.itemsize * int(np.prod(shape)),
+                 "summary": n * SUMMARY_DTYPE.itemsize * shape[0]}
+        for k, size in sizes.items():
+            p = os.path.join(path, f"{k}.bin")
+            if os.path.exists(p) and os.path.getsize(p) > size:
+                os.truncate(p, size)
+        self._dir = day
+        self._files = {k: open(os.path.join(path, f"{k}.bin"), "ab") for k in ("loops", "signals", "summary")}
+
+    def _write(self, ts_ms, candidates, data, summary):
+        day = _day(ts_ms)
+        if day != self._dir:
+            self._open_day(day)
+        self._files["signals"].write(data.tobytes())
+        self._files["summary"].write(summary.tobytes())
+        # loops.bin last: a reader trusts only as many records as loops.bin holds
+        self._files["loops"].write(np.array([(ts_ms, candidates)], dtype=LOOP_DTYPE).tobytes())
+        for f in self._files.values():
+            f.flush()
+        self.records += 1
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"[SignalRecorder] write failed: {e}")
+
+    def close(self, timeout: float = 5.0):
+        self._q.put(None)
+        self._thread.join(timeout)
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+def load_day(path: str) -> Dict[str, object]:
+    """Memory-map one day directory -> {meta, ts, candidates, signals, summary} (read-only)."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    shape = (len(meta["symbols"]), len(meta["timeframes"]), len(meta["experts"]))
+    n = os.path.getsize(os.path.join(path, "loops.bin")) // LOOP_DTYPE.itemsize
+    if n == 0:
+        loops = np.zeros(0, dtype=LOOP_DTYPE)
+        signals = np.zeros((0,) + shape, dtype=SIGNAL_DTYPE)
+        summary = np.zeros((0, shape[0]), dtype=SUMMARY_DTYPE)
+    else:
+        loops = np.memmap(os.path.join(path, "loops.bin"), dtype=LOOP_DTYPE, mode='r', shape=(n,))
+        signals = np.memmap(os.path.join(path, "signals.bin"), dtype=SIGNAL_DTYPE, mode='r', shape=(n,) + shape)
+        summary = np.memmap(os.path.join(path, "summary.bin"), dtype=SUMMARY_DTYPE, mode='r', shape=(n, shape[0]))
+    return {"meta": meta, "ts": loops['ts'], "candidates": loops['candidates'], "signals": signals, "summary": summary}
+
+
+def list_days(root: str, start: str = None, end: str = None) -> List[str]:
+    """Day directories (incl. same-day segments) between start and end (YYYY-MM-DD, inclusive)."""
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for name in sorted(os.listdir(root)):
+        day = name.split(".")[0]
+        if (start is None or day >= start) and (end is None or day <= end) \
+                and os.path.exists(os.path.join(root, name, "meta.json")):
+            out.append(os.path.join(root, name))
+    return out
+
+
+def load_range(root: str, start: str = None, end: str = None) -> Dict[str, object]:
+    """Concatenate days that share the universe of the first one (others are skipped)."""
+    days = [load_day(p) for p in list_days(root, start, end)]
+    if not days:
+        return {}
+    meta = days[0]["meta"]
+    keep = [d for d in days if d["meta"]["symbols"] == meta["symbols"] and d["meta"]["timeframes"] == meta["timeframes"]
+            and d["meta"]["experts"] == meta["experts"]]
+    out = {"meta": meta}
+    for k in ("ts", "candidates", "signals", "summary"):
+        out[k] = np.concatenate([d[k] for d in keep])
+    return out
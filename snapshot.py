@@ -0,0 +1,83 @@
+# snapshot.py - atomic warm-restart snapshots of the runner's in-memory state
+import os
+import pickle
+import threading
+import time
+from typing import Optional
+
+SNAPSHOT_VERSION = 2
+
+
+def save_snapshot(path: str, payload: dict) -> int:
+    """Write payload to path via a temp file + fsync + rename: a crash leaves the old file or the new one."""
+    blob = pickle.dumps({"version": SNAPSHOT_VERSION, "saved_at": time.time(), "payload": payload},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(blob)
+
+
+def load_snapshot(path: str, max_age_secs: float = 0) -> Optional[dict]:
+    """Payload of a snapshot, or None if missing / unreadable / other version / older than max_age_secs (0 = any age)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snap = pickle.load(f)
+    except Exception as e:
+        print(f"[Snapshot] cannot read {path}: {e}")
+        return None
+    if not isinstance(snap, dict) or snap.get("version") != SNAPSHOT_VERSION:
+        print(f"[Snapshot] {path} has version {snap.get('version') if isinstance(snap, dict) else '?'}, ignored")
+        return None
+    age = time.time() - float(snap.get("saved_at", 0))
+    if max_age_secs and age > max_age_secs:
+        print(f"[Snapshot] {path} is {age / 3600:.1f}h old, ignored")
+        return None
+    payload = snap["payload"]
+    payload["_age_secs"] = age
+    return payload
+
+
+class SnapshotWriter:
+    """
+    Saves every interval seconds from the loop. The caller builds the payload (copies of its
+    state, so the loop can go on mutating), the pickle / fsync happens on a background thread;
+    a save still in flight makes the next one wait for the following interval.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.path = path
+        self.interval = interval
+        self.saves = 0
+        self.last_bytes = 0
+        self._last = time.time()
+        self._thread = None
+
+    def due(self, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self._last >= self.interval and not (self._thread and self._thread.is_alive())
+
+    def _save(self, payload: dict):
+        try:
+            self.last_bytes = save_snapshot(self.path, payload)
+            self.saves += 1
+        except Exception as e:
+            print(f"[Snapshot] save {self.path} failed: {e}")
+
+    def submit(self, payload: dict):
+        self._last = time.time()
+        self._thread = threading.Thread(target=self._save, args=(payload,), name="snapshot", daemon=True)
+        self._thread.start()
+
+    def save_now(self, payload: dict):
+        """Synchronous save (shutdown)."""
+        if self._thread is not None:
+            self._thread.join()
+        self._last = time.time()
+        self._save(payload)
@@ -0,0 +1,294 @@
+# synthetic.py - vectorized synthetic OHLCV generator for scale / stress testing
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from base import Broker
+from utils import timeframe_to_ms
+
+# regime ids (shared by every symbol -> market-wide regime, like real crypto)
+TREND_UP, TREND_DOWN, RANGE, VOL_EXPANSION = 0, 1, 2, 3
+REGIMES = ("trend_up", "trend_down", "range", "vol_expansion")
+
+# row = current regime, col = next regime
+# range tends to resolve into a volatility expansion (squeeze -> breakout),
+# expansions tend to become trends, trends fade back into ranges
+DEFAULT_TRANSITIONS = np.array([
+    [0.00, 0.15, 0.60, 0.25],
+    [0.15, 0.00, 0.60, 0.25],
+    [0.30, 0.30, 0.00, 0.40],
+    [0.35, 0.35, 0.30, 0.00],
+])
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+@dataclass
+class SyntheticConfig:
+    base_timeframe: str = "15m"
+    start: str = "2024-01-01"
+    base_price: float = 100.0
+    vol_per_bar: float = 0.004           # stdev of log return per base bar (calm market)
+    corr: float = 0.6                    # constant pairwise correlation of shocks
+    tail_df: Optional[float] = 3.5       # student-t dof for fat tails, None -> gaussian
+    gap_prob: float = 0.002              # probability of a gap per bar per symbol
+    gap_scale: float = 0.02              # stdev of gap size (log)
+    mean_regime_bars: int = 300          # average regime duration in base bars
+    trend_drift: float = 0.0006          # log drift per bar in trend regimes
+    range_phi: float = 0.97              # AR(1) coefficient of the range oscillator
+    range_vol_mult: float = 0.5          # range regimes are quiet (squeeze)
+    expansion_vol_mult: float = 2.5      # vol expansion multiplier
+    trend_vol_mult: float = 1.0
+    symbol_vol_spread: float = 0.4       # per-symbol vol scale drawn from [1-x, 1+x]
+
+
+def regime_path(n_bars: int, cfg: SyntheticConfig, rng: np.random.Generator,
+                transitions: np.ndarray = DEFAULT_TRANSITIONS) -> np.ndarray:
+    """Markov chain over regimes with geometric durations -> int8 array (n_bars,)."""
+    # enough segments to cover n_bars with high probability, top up if not
+    n_seg = max(4, int(2 * n_bars / max(1, cfg.mean_regime_bars)) + 4)
+    lengths = rng.geometric(1.0 / max(1, cfg.mean_regime_bars), size=n_seg)
+    while lengths.sum() < n_bars:
+        lengths = np.concatenate([lengths, rng.geometric(1.0 / max(1, cfg.mean_regime_bars), size=n_seg)])
+    n_seg = int(np.searchsorted(np.cumsum(lengths), n_bars) + 1)
+    lengths = lengths[:n_seg]
+
+    # the chain itself is sequential, but only over segments (n_bars / mean duration)
+    labels = np.empty(n_seg, dtype=np.int8)
+    labels[0] = rng.integers(0, len(REGIMES))
+    u = rng.random(n_seg)
+    cum = np.cumsum(transitions, axis=1)
+    for i in range(1, n_seg):
+        labels[i] = min(int(np.searchsorted(cum[labels[i - 1]], u[i])), len(REGIMES) - 1)
+    return np.repeat(labels, lengths)[:n_bars]
+
+
+def _shocks(n_symbols: int, n_bars: int, cfg: SyntheticConfig, rng: np.random.Generator,
+            corr_matrix: Optional[np.ndarray] = None) -> np.ndarray:
+    def draw(shape):
+        if cfg.tail_df is None:
+            return rng.standard_normal(shape)
+        z = rng.standard_t(cfg.tail_df, size=shape)
+        # unit variance so vol_per_bar keeps its meaning
+        return z / np.sqrt(cfg.tail_df / (cfg.tail_df - 2.0)) if cfg.tail_df > 2 else z
+
+    if corr_matrix is not None:
+        chol = np.linalg.cholesky(np.asarray(corr_matrix, dtype=float))
+        return chol @ draw((n_symbols, n_bars))
+    # one-factor model: O(S*N) instead of a dense cholesky product
+    rho = float(np.clip(cfg.corr, 0.0, 0.999))
+    common = draw((1, n_bars))
+    idio = draw((n_symbols, n_bars))
+    return np.sqrt(rho) * common + np.sqrt(1.0 - rho) * idio
+
+
+def generate(symbols: Sequence[str], n_bars: int, cfg: SyntheticConfig = None, seed: int = 0,
+             corr_matrix: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Generate correlated OHLCV for all symbols at cfg.base_timeframe.
+    Returns dict of arrays: timestamp (n,) int64 ms, open/high/low/close/volume (S, n) float64,
+    regime (n,) int8.
+    """
+    cfg = cfg or SyntheticConfig()
+    rng = np.random.default_rng(seed)
+    S, n = len(symbols), int(n_bars)
+
+    regime = regime_path(n, cfg, rng)
+    vol_mult = np.array([cfg.trend_vol_mult, cfg.trend_vol_mult, cfg.range_vol_mult, cfg.expansion_vol_mult])[regime]
+
+    # drift: trends drift with their sign, each expansion segment breaks out in a random direction
+    drift = np.zeros(n)
+    drift[regime == TREND_UP] = cfg.trend_drift
+    drift[regime == TREND_DOWN] = -cfg.trend_drift
+    seg_start = np.flatnonzero(np.diff(regime, prepend=-1) != 0)
+    seg_id = np.cumsum(np.diff(regime, prepend=-1) != 0) - 1
+    seg_sign = rng.choice([-1.0, 1.0], size=len(seg_start))
+    is_exp = regime == VOL_EXPANSION
+    drift[is_exp] = 2.0 * cfg.trend_drift * seg_sign[seg_id[is_exp]]
+
+    sym_vol = cfg.vol_per_bar * rng.uniform(1 - cfg.symbol_vol_spread, 1 + cfg.symbol_vol_spread, size=(S, 1))
+    sym_beta = rng.uniform(0.7, 1.3, size=(S, 1))
+    sigma = sym_vol * vol_mult[None, :]                       # (S, n)
+    innov = sigma * _shocks(S, n, cfg, rng, corr_matrix)
+
+    # ranges: random walk frozen, price oscillates around the level via an AR(1) filter
+    in_range = (regime == RANGE)[None, :]
+    walk = np.where(in_range, 0.0, drift[None, :] * sym_beta + innov)
+    osc = lfilter([1.0], [1.0, -cfg.range_phi], np.where(in_range, innov, 0.0), axis=1)
+
+    gaps = np.where(rng.random((S, n)) < cfg.gap_prob, rng.standard_normal((S, n)) * cfg.gap_scale, 0.0)
+    log_close = np.log(cfg.base_price) + np.cumsum(walk + gaps, axis=1) + osc
+    log_open = np.empty_like(log_close)
+    log_open[:, 0] = np.log(cfg.base_price)
+    log_open[:, 1:] = log_close[:, :-1] + gaps[:, 1:]
+
+    close = np.exp(log_close)
+    open_ = np.exp(log_open)
+    wick = np.abs(rng.standard_normal((2, S, n))) * sigma * 0.5
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+
+    bar_ret = np.abs(log_close - log_open)
+    volume = 1000.0 * np.exp(0.5 * rng.standard_normal((S, n))) * (1.0 + 3.0 * bar_ret / sigma)
+
+    step = timeframe_to_ms(cfg.base_timeframe)
+    t0 = int(pd.Timestamp(cfg.start).value // 1_000_000)
+    t0 -= t0 % step
+    timestamp = t0 + step * np.arange(n, dtype=np.int64)
+    return {'timestamp': timestamp, 'open': open_, 'high': high, 'low': low,
+            'close': close, 'volume': volume, 'regime': regime}
+
+
+def resample(arrays: Dict[str, np.ndarray], base_timeframe: str, timeframe: str) -> Dict[str, np.ndarray]:
+    """Aggregate base-timeframe arrays to a higher timeframe (bars aligned to tf boundaries)."""
+    base_ms, tf_ms = timeframe_to_ms(base_timeframe), timeframe_to_ms(timeframe)
+    if tf_ms == base_ms:
+        return arrays
+    if tf_ms % base_ms:
+        raise ValueError(f"{timeframe} is not a multiple of {base_timeframe}")
+    k = tf_ms // base_ms
+    ts = arrays['timestamp']
+    first = int(np.argmax(ts % tf_ms == 0))
+    m = (len(ts) - first) // k
+    sl = slice(first, first + m * k)
+
+    def blocks(a):
+        return a[..., sl].reshape(a.shape[:-1] + (m, k))
+
+    return {
+        'timestamp': ts[sl][::k],
+        'open': blocks(arrays['open'])[..., 0],
+        'high': blocks(arrays['high']).max(axis=-1),
+        'low': blocks(arrays['low']).min(axis=-1),
+        'close': blocks(arrays['close'])[..., -1],
+        'volume': blocks(arrays['volume']).sum(axis=-1),
+        'regime': blocks(arrays['regime'])[..., -1],
+    }
+
+
+def to_frames(arrays: Dict[str, np.ndarray], symbols: Sequence[str]) -> Dict[str, pd.DataFrame]:
+    """Same column layout as CCXTBroker.fetch_ohlcv (timestamp as datetime64[ms])."""
+    ts = pd.to_datetime(arrays['timestamp'], unit='ms')
+    out = {}
+    for i, s in enumerate(symbols):
+        out[s] = pd.DataFrame({
+            'timestamp': ts,
+            'open': arrays['open'][i], 'high': arrays['high'][i], 'low': arrays['low'][i],
+            'close': arrays['close'][i], 'volume': arrays['volume'][i],
+        }, columns=COLUMNS)
+    return out
+
+
+def generate_universe(symbols: Sequence[str], n_bars: int, timeframes=("15m", "30m", "1h"),
+                      cfg: SyntheticConfig = None, seed: int = 0) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """{timeframe: {symbol: DataFrame}} built from one base path, so timeframes stay consistent."""
+    cfg = cfg or SyntheticConfig()
+    base = generate(symbols, n_bars, cfg, seed)
+    return {tf: to_frames(resample(base, cfg.base_timeframe, tf), symbols) for tf in timeframes}
+
+
+class SyntheticBroker(Broker):
+    """
+    Offline broker replaying generated data. The cursor is "now": the base bar opening at the
+    cursor has only printed its open. fetch_ohlcv returns the last `limit` bars known at the
+    cursor, like an exchange: closed bars, then the forming bar built from the base bars
+    closed so far in it plus that open (close = current price). step() advances one base bar.
+    """
+
+    def __init__(self, symbols: Sequence[str], n_bars: int, timeframes=("15m", "30m", "1h"),
+                 cfg: SyntheticConfig = None, seed: int = 0, warmup: int = 1000):
+        self.cfg = cfg or SyntheticConfig()
+        self.symbols = list(symbols)
+        self.base = generate(self.symbols, n_bars, self.cfg, seed)
+        self.arrays = {tf: resample(self.base, self.cfg.base_timeframe, tf) for tf in timeframes}
+        self.cursor_ms = int(self.base['timestamp'][min(warmup, n_bars - 1)])
+        self.step_ms = timeframe_to_ms(self.cfg.base_timeframe)
+        self.paper_trades = []
+
+    def step(self, bars: int = 1):
+        self.cursor_ms += bars * self.step_ms
+
+    def _forming_bar(self, i: int, timeframe: str):
+        """[ts, o, h, l, c, v] of the timeframe bar containing the cursor, or None past the data."""
+        b = self.base
+        cur = int(np.searchsorted(b['timestamp'], self.cursor_ms, side='left'))
+        if cur >= len(b['timestamp']) or int(b['timestamp'][cur]) != self.cursor_ms:
+            return None
+        tf_open = self.cursor_ms - self.cursor_ms % timeframe_to_ms(timeframe)
+        lo = int(np.searchsorted(b['timestamp'], tf_open, side='left'))
+        px = float(b['open'][i, cur])
+        o = float(b['open'][i, lo]) if lo < cur else px
+        h = max(px, float(b['high'][i, lo:cur].max())) if lo < cur else px
+        l = min(px, float(b['low'][i, lo:cur].min())) if lo < cur else px
+        v = float(b['volume'][i, lo:cur].sum())
+        return [float(tf_open), o, h, l, px, v]
+
+    def fetch_ohlcv_raw(self, symbol: str, timeframe: str, limit: int):
+        a = self.arrays[timeframe]
+        i = self.symbols.index(symbol)
+        # closed bars only from the resampled arrays: a bar whose span reaches past the cursor is not known yet
+        end = int(np.searchsorted(a['timestamp'] + timeframe_to_ms(timeframe), self.cursor_ms, side='right'))
+        forming = self._forming_bar(i, timeframe)
+        start = max(0, end - int(limit) + (forming is not None))
+        rows = np.column_stack([a['timestamp'][start:end].astype(float), a['open'][i, start:end],
+                                a['high'][i, start:end], a['low'][i, start:end],
+                                a['close'][i, start:end], a['volume'][i, start:end]])
+        if forming is not None and limit > 0:
+            rows = np.vstack([rows, forming])
+        return rows
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str, limit: int):
+        df = pd.DataFrame(self.fetch_ohlcv_raw(symbol, timeframe, limit), columns=COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype('int64'), unit='ms')
+        return df
+
+    def get_price(self, symbol: str) -> float:
+        return float(self.fetch_ohlcv_raw(symbol, self.cfg.base_timeframe, 1)[-1, 4])
+
+    def _round_amount(self, symbol: str, amount: float) -> float:
+        return float(np.floor(amount * 1e6) / 1e6)
+
+    def round_amounts(self, symbols, amounts) -> np.ndarray:
+        return np.floor(np.asarray(amounts, dtype=float) * 1e6) / 1e6
+
+    def place_order(self, symbol: str, side: str, size: float, price: float = None, stop: float = None, take: float = None):
+        amt = self._round_amount(symbol, size)
+        if amt <= 0:
+            return None
+        record = {"timestamp": pd.Timestamp(self.cursor_ms, unit='ms').isoformat(), "symbol": symbol,
+                  "side": side, "size": amt, "price": price or self.get_price(symbol), "status": "FILLED"}
+        self.paper_trades.append(record)
+        return record
+
+
+def write_csv(universe: Dict[str, Dict[str, pd.DataFrame]], out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    for tf, frames in universe.items():
+        for sym, df in frames.items():
+            df.to_csv(os.path.join(out_dir, f"{sym.replace('/', '_')}_{tf}.csv"), index=False)
+
+
+if __name__ == "__main__":
+    from config import CFG
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', default=",".join(CFG.data.symbols))
+    parser.add_argument('--n-symbols', type=int, default=0, help="generate SYN0..SYNn/USDT instead of --symbols")
+    parser.add_argument('--bars', type=int, default=100_000, help="number of base (15m) bars")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=os.path.join("data", "synthetic"))
+    args = parser.parse_args()
+    if args.n_symbols > 0:
+        syms: List[str] = [f"SYN{i}/USDT" for i in range(args.n_symbols)]
+    else:
+        syms = [s.strip() for s in args.symbols.split(',') if s.strip()]
+    t = time.time()
+    uni = generate_universe(syms, args.bars, seed=args.seed)
+    print(f"Generated {len(syms)} symbols x {args.bars} bars in {time.time() - t:.2f}s")
+    write_csv(uni, args.out)
+    print(f"Saved CSVs to {args.out}")
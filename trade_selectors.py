@@ -41,4 +41,39 @@ def pick_diversified(symbols_ranked: List[str], prices_by_symbol: Dict[str, pd.D
             chosen.append(sym)
         if len(chosen) >= top_k:
             break
-    return chosen
\ No newline at end of file
+    return chosen
+
+
+def pick_diversified_arrays(order, rets: np.ndarray, top_k: int = 5, corr_threshold: float = 0.75) -> List[int]:
+    """
+    pick_diversified over aligned arrays: order = row indices best first, rets = (symbols, bars)
+    returns of the last 120 bars (NaN where a symbol has no bar). -> chosen row indices
+    """
+    finite = np.isfinite(rets)
+    enough = finite.sum(axis=1) >= 20
+    corr = None
+    if finite.all() and rets.shape[1] >= 20:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.corrcoef(rets)
+    chosen = []
+    for i in order:
+        if not enough[i]:
+            continue
+        ok = True
+        for c in chosen:
+            if corr is not None:
+                cij = corr[i, c]
+            else:
+                m = finite[i] & finite[c]
+                if m.sum() < 20:
+                    continue
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    cij = np.corrcoef(rets[i, m], rets[c, m])[0, 1]
+            if cij >= corr_threshold:
+                ok = False
+                break
+        if ok:
+            chosen.append(i)
+        if len(chosen) >= top_k:
+            break
+    return chosen
@@ -59,4 +59,43 @@ def zscore(series: pd.Series, window: int = 20) -> pd.Series:
 def donchian_channels(df: pd.DataFrame, period: int = 20):
     upper = df['high'].rolling(period).max()
     lower = df['low'].rolling(period).min()
-    return upper, lower
\ No newline at end of file
+    return upper, lower
+
+# timeframe string ("15m", "1h", ...) -> milliseconds
+def timeframe_to_ms(timeframe: str) -> int:
+    unit = timeframe[-1]
+    n = int(timeframe[:-1])
+    return n * {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}[unit]
+
+
+# --- batched versions over stacked (series, bars) arrays, used for cross-symbol passes ---
+def ewm_2d(x: np.ndarray, alpha: float) -> np.ndarray:
+    # EMA with adjust=False along the last axis, seeded with the first value of each row
+    from scipy.signal import lfilter
+    x = np.asarray(x, dtype=float)
+    x = np.where(np.isfinite(x), x, 0.0)
+    zi = (1.0 - alpha) * x[..., :1]
+    out, _ = lfilter([alpha], [1.0, -(1.0 - alpha)], x, axis=-1, zi=zi)
+    return out
+
+def ema_2d(x: np.ndarray, span: int) -> np.ndarray:
+    return ewm_2d(x, 2.0 / (span + 1.0))
+
+def true_range_2d(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+def atr_2d(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    return ewm_2d(true_range_2d(high, low, close), 1.0 / period)
+
+def adx_2d(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    up = np.diff(high, axis=-1, prepend=high[..., :1])
+    down = -np.diff(low, axis=-1, prepend=low[..., :1])
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    atr = atr_2d(high, low, close, period)
+    plus_di = 100 * ewm_2d(plus_dm, 1.0 / period) / atr
+    minus_di = 100 * ewm_2d(minus_dm, 1.0 / period) / atr
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.nan_to_num(100 * np.abs(plus_di - minus_di) / (plus_di + minus_di))
+    return ewm_2d(dx, 1.0 / period)
@@ -1,6 +1,8 @@
 # utils_sizing.py
 from math import floor
 
+import numpy as np
+
 def compute_sl_tp(price: float, atr: float, k_atr: float = 2.0, rr1: float = 1.5, rr2: float = 2.5, side: int = 1):
     """
     คืนค่า (sl, tp1, tp2)
@@ -29,3 +31,51 @@ def position_size_by_risk(equity: float, risk_per_trade: float, price: float, sl
     qty = usd_risk / (sl_dist * contract_multiplier)
     # Don't return fractional dust; caller should round to market step
     return float(qty)
+
+
+# ---- batched versions (one vectorized pass over all candidates; same results as the scalar ones) ----
+
+
+def compute_sl_tp_batch(price, atr, k_atr: float = 2.0, rr1: float = 1.5, rr2: float = 2.5, side=1):
+    """compute_sl_tp over arrays -> (sl, tp1, tp2) arrays"""
+    price = np.asarray(price, dtype=float)
+    side = np.asarray(side, dtype=float)
+    sl = price - side * k_atr * np.asarray(atr, dtype=float)
+    rr_dist = np.abs(price - sl)
+    tp1 = price + side * rr1 * rr_dist
+    tp2 = price + side * rr2 * rr_dist
+    return sl, tp1, tp2
+
+
+def position_size_by_risk_batch(equity: float, risk_per_trade, price, sl, contract_multiplier: float = 1.0):
+    """
+    position_size_by_risk over arrays. risk_per_trade broadcasts against price/sl, e.g.
+    price[:, None] with risk_per_trade[None, :] gives one size per (candidate, risk level).
+    """
+    usd_risk = equity * np.asarray(risk_per_trade, dtype=float)
+    sl_dist = np.abs(np.asarray(price, dtype=float) - np.asarray(sl, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qty = usd_risk / (sl_dist * contract_multiplier)
+    return np.where(sl_dist <= 1e-12, 0.0, qty)
+
+
+def kelly_multiplier_batch(prob, rr: float):
+    """Half-Kelly tilt used by the runner: 0.5 + clip((p*R - (1-p)) / R, 0, 0.5)"""
+    prob = np.asarray(prob, dtype=float)
+    kelly_f = np.maximum(0.0, np.minimum(0.5, (prob * rr - (1 - prob)) / max(1e-9, rr)))
+    return 0.5 + kelly_f
+
+
+def trail_stop_batch(price, entry, sl, side, atr, trail_atr: float = 1.2):
+    """
+    The runner's stop management: break-even once 1R is reached, then trail trail_atr * ATR
+    behind price from 1.5R on (never loosening). Works on scalars or arrays -> new sl.
+    """
+    price, entry, sl = np.asarray(price, dtype=float), np.asarray(entry, dtype=float), np.asarray(sl, dtype=float)
+    side = np.asarray(side, dtype=float)
+    r = (price - entry) * side
+    one_r = np.abs(entry - sl)
+    new_sl = np.where((one_r > 0) & (r >= one_r) & (sl != entry), entry, sl)
+    trail = price - side * trail_atr * np.asarray(atr, dtype=float)
+    tighter = np.where(side > 0, np.maximum(new_sl, trail), np.minimum(new_sl, trail))
+    return np.where(r >= one_r * 1.5, tighter, new_sl)